@@ -0,0 +1,54 @@
+from functools import wraps
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.views import redirect_to_login
+from django.shortcuts import redirect
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.functional import SimpleLazyObject
+
+UserModel = get_user_model()
+
+
+class AccountBackend(ModelBackend):
+    """ModelBackend that loads the session's user and account in one joined query."""
+
+    def get_user(self, user_id):
+        try:
+            user = UserModel._default_manager.select_related('account').get(pk=user_id)
+        except UserModel.DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
+
+
+def _request_account(request):
+    # The backend already joined the account onto the user, so this is free for logged-in users
+    return getattr(request.user, 'account', None)
+
+
+class AccountMiddleware(MiddlewareMixin):
+    """Expose the requesting user's Account as ``request.account``, loaded once and only when used.
+
+    Must come after AuthenticationMiddleware. The JSON API replaces it with the
+    token's account.
+    """
+
+    def process_request(self, request):
+        request.account = SimpleLazyObject(lambda: _request_account(request))
+
+
+def admin_required(view):
+    """Let only admins through; everyone else goes to login (anonymous) or home.
+
+    The decision is made on every request from the account the backend joined
+    onto the session's user, so a demotion or deactivation made anywhere (any
+    worker, a management command, a bulk update) applies to the next request.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        account = request.account
+        if not (account and account.is_admin):
+            return redirect('home')  # Redirect non-admins
+        return view(request, *args, **kwargs)
+    return wrapper
@@ -1,3 +1,8 @@
 from django.contrib import admin
+from .models import ExchangeRate
 
 # Register your models here.
+@admin.register(ExchangeRate)
+class ExchangeRateAdmin(admin.ModelAdmin):
+    list_display = ('currency', 'symbol', 'rate', 'effective_at')
+    list_filter = ('currency',)
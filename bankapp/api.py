@@ -0,0 +1,244 @@
+import hashlib
+import json
+import secrets
+from decimal import Decimal, DecimalException
+from functools import wraps
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.http import JsonResponse
+from django.urls import reverse
+from django.views.decorators.csrf import csrf_exempt
+from .models import Account, ApiToken, TransferCommand
+from .pagination import akeyset_page, keyset_page
+from . import archive, hot_accounts, idempotency, ledger, rates, transfer_queue
+
+API_PAGE_SIZE = 50
+API_MAX_PAGE_SIZE = 200
+SAFE_METHODS = ('GET', 'HEAD')
+
+
+def hash_key(key):
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def issue_token(account, name=''):
+    """Create an API token for ``account``; the raw key is only ever returned here."""
+    key = secrets.token_urlsafe(32)
+    ApiToken.objects.create(account=account, key_hash=hash_key(key), name=name)
+    return key
+
+
+def api_response(data, status=200):
+    # Compact separators: no whitespace in machine-facing payloads
+    return JsonResponse(data, status=status, json_dumps_params={'separators': (',', ':')})
+
+
+def api_error(message, status):
+    return api_response({'error': message}, status=status)
+
+
+def _token_accounts(request):
+    # Token and account (with its user) in one indexed, joined query; None without a bearer token.
+    # Deactivating a user revokes their tokens too, as it already ends their sessions
+    header = request.headers.get('Authorization', '')
+    if header.startswith('Bearer '):
+        return Account.objects.select_related('user').filter(
+            api_tokens__key_hash=hash_key(header[len('Bearer '):].strip()), user__is_active=True,
+        )
+    return None
+
+
+def _authenticate(request):
+    accounts = _token_accounts(request)
+    if accounts is not None:
+        return accounts.first()
+    # Browser sessions may read; writes need a token since CSRF checks are skipped here
+    if request.method in SAFE_METHODS and request.user.is_authenticated:
+        return Account.objects.filter(user=request.user).first()
+    return None
+
+
+async def _aauthenticate(request):
+    accounts = _token_accounts(request)
+    if accounts is not None:
+        return await accounts.afirst()
+    if request.method in SAFE_METHODS:
+        user = await request.auser()
+        if user.is_authenticated:
+            return await Account.objects.filter(user=user).afirst()
+    return None
+
+
+def _refuse(account, admin):
+    if account is None:
+        return api_error('Authentication required.', 401)
+    if admin and not account.is_admin:
+        return api_error('Admin access required.', 403)
+    return None
+
+
+def api_view(methods, admin=False):
+    """Wrap a JSON API view: method check, token auth and ``request.account``.
+
+    Works for both plain and ``async def`` views.
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @csrf_exempt
+            @wraps(view)
+            async def wrapper(request, *args, **kwargs):
+                if request.method not in methods:
+                    return api_error('Method not allowed.', 405)
+                account = await _aauthenticate(request)
+                refused = _refuse(account, admin)
+                if refused:
+                    return refused
+                request.account = account
+                return await view(request, *args, **kwargs)
+            return wrapper
+
+        @csrf_exempt
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                return api_error('Method not allowed.', 405)
+            account = _authenticate(request)
+            refused = _refuse(account, admin)
+            if refused:
+                return refused
+            request.account = account
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _page_size(request):
+    try:
+        return max(1, min(int(request.GET.get('limit', API_PAGE_SIZE)), API_MAX_PAGE_SIZE))
+    except ValueError:
+        return API_PAGE_SIZE
+
+
+def _page(rows, next_cursor, serialize):
+    # Every list endpoint shares this shape
+    return api_response({'results': [serialize(row) for row in rows], 'next': next_cursor})
+
+
+def _serialize_posting(posting):
+    return {
+        'id': posting.pk,
+        'entry': posting.entry_id,
+        'kind': posting.entry.kind,
+        'timestamp': posting.timestamp.isoformat(),
+        'amount': str(posting.amount),
+        'counterparty': posting.counterparty.account_number if posting.counterparty else None,
+    }
+
+
+def _serialize_command(command):
+    return {
+        'id': command.pk,
+        'status': command.status,
+        'payment_number': command.payment_number,
+        'amount': str(command.amount),
+        'entry': command.entry_id,
+        'error': command.error or None,
+        'status_url': reverse('api_transfer_status', args=[command.pk]),
+    }
+
+
+def _serialize_account(account):
+    return {
+        'id': account.pk,
+        'username': account.user.username,
+        'account_number': account.account_number,
+        'payment_number': account.payment_number,
+        'balance': str(account.full_balance),
+        'is_suspended': account.is_suspended,
+        'is_closed': account.is_closed,
+    }
+
+
+@api_view(['GET'])
+async def balance(request):
+    account = request.account
+    currency = await rates.provider.aget(request.GET.get('currency', 'USD'))
+    return api_response({
+        'account_number': account.account_number,
+        'payment_number': account.payment_number,
+        'balance': str(currency.convert(await hot_accounts.acurrent_balance(account))),
+        'currency': currency.code,
+    })
+
+
+@api_view(['GET'])
+async def history(request):
+    fields = (
+        # account_id stays loaded: the related manager checks it on every row
+        'pk', 'account', 'entry__kind', 'timestamp', 'amount', 'counterparty__account_number',
+    )
+    rows, next_cursor = await akeyset_page(
+        request.account.postings.select_related('entry', 'counterparty').only(*fields),
+        cursor=request.GET.get('cursor'),
+        page_size=_page_size(request),
+        archived=[request.account.archived_postings.select_related('entry', 'counterparty').only(*fields)],
+        horizon=await archive.ahorizon(),
+    )
+    return _page(rows, next_cursor, _serialize_posting)
+
+
+@api_view(['POST'])
+async def transfers(request):
+    try:
+        body = json.loads(request.body or b'{}')
+        payment_number = str(body['payment_number'])
+        amount = Decimal(str(body['amount']))
+    except (ValueError, KeyError, TypeError, DecimalException):
+        return api_error('Expected a JSON body with "payment_number" and "amount".', 400)
+    key = request.headers.get('Idempotency-Key', '')
+    if len(key) > idempotency.MAX_KEY_LENGTH:
+        return api_error(f'Idempotency-Key must be at most {idempotency.MAX_KEY_LENGTH} characters.', 400)
+
+    def send():
+        if transfer_queue.queued_transfers_enabled():
+            try:
+                command = transfer_queue.enqueue_transfer(request.account, payment_number, amount)
+            except ledger.LedgerError as e:
+                return 422, {'error': str(e)}
+            return 202, _serialize_command(command)
+        try:
+            entry = ledger.send_payment(request.account, payment_number, amount)
+        except ledger.LedgerError as e:
+            return 422, {'error': str(e)}
+        return 201, {
+            'entry': entry.pk,
+            'payment_number': payment_number,
+            'amount': str(amount),
+            'balance': str(hot_accounts.current_balance(request.account)),
+        }
+
+    # The transfer's transaction runs in a thread; everything around it stays on the event loop
+    status, body, replayed = await sync_to_async(idempotency.run_once)(request.account, key, 'api_transfer', send)
+    response = api_response(body, status=status)
+    if replayed:
+        response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+@api_view(['GET'])
+async def transfer_status(request, command_id):
+    # Polled by clients of queued mode; only the sender can see a command
+    command = await TransferCommand.objects.filter(pk=command_id, sender=request.account).afirst()
+    if command is None:
+        return api_error('Transfer not found.', 404)
+    return api_response(_serialize_command(command))
+
+
+@api_view(['GET'], admin=True)
+def admin_accounts(request):
+    rows, next_cursor = keyset_page(
+        hot_accounts.with_full_balance(Account.objects.filter(is_admin=False).select_related('user')),
+        cursor=request.GET.get('cursor'),
+        page_size=_page_size(request),
+        field='pk',
+    )
+    return _page(rows, next_cursor, _serialize_account)
@@ -7,3 +7,4 @@ class BankappConfig(AppConfig):
    
     def ready(self):
         import bankapp.signals
+        import bankapp.metrics  # Installs the request query timer on each new DB connection
@@ -0,0 +1,50 @@
+from django.db import transaction
+from django.db.models import Max
+from .checkpoints import write_checkpoints
+from .models import ArchivedPosting, BalanceCheckpoint, Posting
+
+ARCHIVE_BATCH_SIZE = 5000  # Postings moved per transaction
+POSTING_FIELDS = ('id', 'entry_id', 'account_id', 'counterparty_id', 'amount', 'timestamp')
+
+
+def horizon():
+    """Return the newest archived timestamp, or None when nothing is archived.
+
+    History pages that stay newer than this never touch the archive. It is
+    read from the database on every call (one lookup at the end of the
+    timestamp index), so a web process sees rows archive_transactions has
+    just moved without any shared cache.
+    """
+    return ArchivedPosting.objects.aggregate(newest=Max('timestamp'))['newest']
+
+
+async def ahorizon():
+    return (await ArchivedPosting.objects.aaggregate(newest=Max('timestamp')))['newest']
+
+
+def archive_postings(before, batch_size=ARCHIVE_BATCH_SIZE, progress=None):
+    """Move postings older than ``before`` from the hot table to the archive table.
+
+    Balance checkpoints are brought up to date first, and only postings they
+    already cover are moved, so balances (and balance_at) never need the
+    archive. Each batch is copied and deleted in its own short transaction,
+    oldest first. ``progress(moved)`` is called after each batch. Returns the
+    number of postings moved.
+    """
+    write_checkpoints()
+    watermark = BalanceCheckpoint.objects.aggregate(last=Max('last_posting_id'))['last']
+    if not watermark:
+        return 0
+    cold = Posting.objects.filter(timestamp__lt=before, pk__lte=watermark)
+    moved = 0
+    while True:
+        with transaction.atomic():
+            rows = list(cold.order_by('pk').values_list(*POSTING_FIELDS)[:batch_size])
+            if not rows:
+                break
+            ArchivedPosting.objects.bulk_create([ArchivedPosting(**dict(zip(POSTING_FIELDS, row))) for row in rows])
+            Posting.objects.filter(pk__in=[row[0] for row in rows]).delete()
+        moved += len(rows)
+        if progress:
+            progress(moved)
+    return moved
@@ -0,0 +1,48 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.db import transaction
+from .models import AdminLog
+
+# Entries recorded inside atomic(), waiting for the block to finish. A context variable,
+# like the metrics query timer, so concurrent requests never share a buffer.
+_pending = ContextVar('bankapp_admin_log_buffer', default=None)
+
+
+@contextmanager
+def atomic():
+    """transaction.atomic() whose admin log entries are written in one INSERT as it finishes.
+
+    Entries recorded in the block commit or roll back with the change they
+    describe, and a block that logs many actions still writes them in a
+    single statement. A nested block hands its entries to the outer one.
+    """
+    with transaction.atomic():
+        entries = []
+        token = _pending.set(entries)
+        try:
+            yield
+        finally:
+            _pending.reset(token)
+        outer = _pending.get()
+        if outer is not None:
+            outer.extend(entries)
+        elif entries:
+            AdminLog.objects.bulk_create(entries)
+
+
+def record(admin, kind, target=None, amount=None, detail=''):
+    """Log an admin action; buffered inside atomic(), written straight away outside it.
+
+    ``target`` is the Account acted on; its number is copied onto the entry so
+    the log still reads correctly after the account is deleted.
+    """
+    entry = AdminLog(
+        admin=admin, kind=kind, amount=amount, detail=detail,
+        target_id=target.pk if target else None, target_number=target.account_number if target else '',
+    )
+    entries = _pending.get()
+    if entries is None:
+        entry.save()
+    else:
+        entries.append(entry)
+    return entry
@@ -0,0 +1,282 @@
+import gzip
+import hashlib
+import json
+from contextlib import contextmanager
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max, signals
+from django.utils import timezone
+from .models import (
+    CHECKPOINT_LAG, Account, AdminLog, ApiToken, ArchivedPosting, BalanceCheckpoint, BalanceShard, BankCounter,
+    CounterReconciliation, ExchangeRate, IdempotencyKey, JournalEntry, Posting, TransferCommand,
+)
+from . import rates
+
+BACKUP_FORMAT = 'fakebank-backup'
+BACKUP_VERSION = 1
+BACKUP_CHUNK_SIZE = 5000  # Rows fetched per round-trip from the server-side cursor
+RESTORE_BATCH_SIZE = 5000  # Rows per bulk INSERT
+
+# Every table a backup holds, parents before children. Users' groups and permissions
+# are not used by the bank and are left out, like sessions.
+BACKUP_MODELS = (
+    User, Account, JournalEntry, Posting, ArchivedPosting, BalanceShard, BalanceCheckpoint, AdminLog,
+    BankCounter, CounterReconciliation, ApiToken, IdempotencyKey, ExchangeRate, TransferCommand,
+)
+# Append-only tables: an incremental backup only holds their rows above a watermark,
+# as (watermark name, column compared with it). Every other table is small or mutable
+# and is written in full each time.
+INCREMENTAL = {
+    JournalEntry: ('entry', 'pk'),
+    Posting: ('entry', 'entry_id'),
+    ArchivedPosting: ('entry', 'entry_id'),
+    AdminLog: ('admin_log', 'pk'),
+}
+# Where each watermark comes from: (model, timestamp field)
+WATERMARKS = {
+    'entry': (JournalEntry, 'created_at'),
+    'admin_log': (AdminLog, 'timestamp'),
+}
+
+# File layout: gzip-compressed NDJSON. The first line is the header (format, version,
+# watermarks). Each table follows as {"table", "columns"}, one JSON array per row in pk
+# order, then {"end", "rows", "sha256"} with the SHA-256 of that table's row lines.
+
+
+class BackupError(Exception):
+    pass
+
+
+def _line(value):
+    return json.dumps(value, default=str, separators=(',', ':')) + '\n'
+
+
+def _columns(model):
+    return [field.attname for field in model._meta.concrete_fields]
+
+
+def _watermark(model, time_field):
+    # Like balance checkpoints, stay CHECKPOINT_LAG behind: a row committed late with a lower
+    # id is still above the watermark, so the next incremental backup picks it up
+    newest = model._base_manager.filter(**{f'{time_field}__lte': timezone.now() - CHECKPOINT_LAG})
+    return newest.aggregate(last=Max('pk'))['last'] or 0
+
+
+def _parse_header(line):
+    try:
+        header = json.loads(line or 'null')
+    except ValueError:
+        header = None
+    if not isinstance(header, dict) or header.get('format') != BACKUP_FORMAT:
+        raise BackupError('Not a bank backup file.')
+    if header.get('version') != BACKUP_VERSION:
+        raise BackupError(f"Unsupported backup version {header.get('version')}.")
+    return header
+
+
+def read_header(source):
+    """Return the header of the backup at ``source`` (a path or binary file)."""
+    try:
+        with gzip.open(source, 'rt', encoding='utf-8') as stream:
+            return _parse_header(stream.readline())
+    except (EOFError, OSError) as e:
+        raise BackupError(f'The backup file is unreadable: {e}')
+
+
+def write_backup(out, since=None, chunk_size=BACKUP_CHUNK_SIZE, progress=None):
+    """Stream every bank table to ``out`` (a path or binary file) as compressed NDJSON.
+
+    Tables are read in pk order through server-side cursors, so memory stays
+    flat however large they are. With ``since`` (the watermarks of an earlier
+    backup) the append-only ledger tables only contribute newer rows. All
+    tables are read in one transaction; on PostgreSQL it is REPEATABLE READ,
+    so the backup is one consistent snapshot. ``progress(table, rows)`` is
+    called after each table. Returns the header written.
+    """
+    outermost = not connection.in_atomic_block
+    with transaction.atomic():
+        if outermost and connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+        header = {
+            'format': BACKUP_FORMAT,
+            'version': BACKUP_VERSION,
+            'created_at': timezone.now().isoformat(),
+            'since': since,
+            'watermarks': {name: _watermark(*source) for name, source in WATERMARKS.items()},
+        }
+        with gzip.open(out, 'wt', encoding='utf-8') as stream:
+            stream.write(_line(header))
+            for model in BACKUP_MODELS:
+                label = model._meta.label_lower
+                columns = _columns(model)
+                rows = model._base_manager.order_by('pk')
+                if since and model in INCREMENTAL:
+                    name, column = INCREMENTAL[model]
+                    rows = rows.filter(**{f'{column}__gt': since[name]})
+                stream.write(_line({'table': label, 'columns': columns}))
+                digest = hashlib.sha256()
+                count = 0
+                for row in rows.values_list(*columns).iterator(chunk_size=chunk_size):
+                    line = _line(row)
+                    digest.update(line.encode())
+                    stream.write(line)
+                    count += 1
+                stream.write(_line({'end': label, 'rows': count, 'sha256': digest.hexdigest()}))
+                if progress:
+                    progress(label, count)
+    return header
+
+
+@contextmanager
+def _raw_writes():
+    # Restored rows are stored exactly as they were saved: no receivers (account creation,
+    # counter adjustments, cache invalidation) and no auto_now stamps replacing the saved ones
+    muted = (signals.pre_save, signals.post_save, signals.pre_delete, signals.post_delete, signals.m2m_changed)
+    receivers = [signal.receivers for signal in muted]
+    stamped = [
+        (field, field.auto_now, field.auto_now_add)
+        for model in BACKUP_MODELS for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    for signal in muted:
+        signal.receivers = []
+        signal.sender_receivers_cache.clear()
+    for field, _, _ in stamped:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for signal, saved in zip(muted, receivers):
+            signal.receivers = saved
+            signal.sender_receivers_cache.clear()
+        for field, auto_now, auto_now_add in stamped:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class _TableRestore:
+    """Writes one table's rows in batches and checks them against the table's footer."""
+
+    def __init__(self, model, columns, incremental, batch_size):
+        fields = {field.attname: field for field in model._meta.concrete_fields}
+        unknown = set(columns) - set(fields)
+        if unknown:
+            raise BackupError(f"{model._meta.label_lower}: unknown columns {', '.join(sorted(unknown))}.")
+        self.model = model
+        self.manager = model._base_manager
+        self.columns = [fields[column] for column in columns]
+        # An incremental backup replaces mutable tables in place and appends to ledger tables
+        self.replace = incremental and model not in INCREMENTAL
+        self.batch_size = batch_size
+        self.batch = []
+        self.floor = None  # Highest pk written so far (tables are in pk order)
+        self.digest = hashlib.sha256()
+        self.count = 0
+
+    def add(self, line):
+        self.digest.update(line.encode())
+        self.count += 1
+        self.batch.append(json.loads(line))
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.batch:
+            return
+        objs = [
+            self.model(**{field.attname: field.to_python(value) for field, value in zip(self.columns, row)})
+            for row in self.batch
+        ]
+        self.batch = []
+        if not self.replace:
+            # Rows just above the previous backup's watermark are sent again; keep the copies already here
+            self.manager.bulk_create(objs, batch_size=self.batch_size, ignore_conflicts=self.model in INCREMENTAL)
+        else:
+            pks = [obj.pk for obj in objs]
+            # Rows between this batch's pks were deleted after the base backup
+            stale = self.manager.filter(pk__lte=pks[-1]).exclude(pk__in=pks)
+            if self.floor is not None:
+                stale = stale.filter(pk__gt=self.floor)
+            stale.delete()
+            pk = self.model._meta.pk
+            self.manager.bulk_create(
+                objs, batch_size=self.batch_size, update_conflicts=True, unique_fields=[pk.name],
+                update_fields=[field.name for field in self.model._meta.concrete_fields if field is not pk],
+            )
+        self.floor = objs[-1].pk
+
+    def finish(self, footer):
+        self.flush()
+        if self.replace:
+            stale = self.manager.all() if self.floor is None else self.manager.filter(pk__gt=self.floor)
+            stale.delete()
+        label = self.model._meta.label_lower
+        if footer.get('rows') != self.count or footer.get('sha256') != self.digest.hexdigest():
+            raise BackupError(f'{label}: checksum mismatch, the backup is damaged.')
+        return label, self.count
+
+
+def _prepare(header):
+    since = header['since']
+    if since is None:
+        if JournalEntry.objects.exists():
+            raise BackupError('The database already has a ledger; restore a full backup into an empty database.')
+        # Rows seeded by migrations (counters, rates) are replaced by the backup's
+        for model in reversed(BACKUP_MODELS):
+            model._base_manager.all().delete()
+    else:
+        newest = JournalEntry.objects.aggregate(last=Max('pk'))['last'] or 0
+        if newest < since['entry']:
+            raise BackupError('Restore the backup this incremental backup was taken after first.')
+
+
+def restore_backup(source, batch_size=RESTORE_BATCH_SIZE, progress=None):
+    """Load a backup written by write_backup() from ``source`` (a path or binary file).
+
+    A full backup needs a database without a ledger. An incremental backup is
+    applied on top of its base: ledger rows are appended and the other tables
+    are brought to the backed-up state. Rows are written with bulk_create in
+    batches of ``batch_size``, with model signals off. Each table's checksum is
+    verified, and the whole restore is one transaction, so a damaged file
+    leaves the database untouched. ``progress(table, rows)`` is called after
+    each table. Returns the header.
+    """
+    models = {model._meta.label_lower: model for model in BACKUP_MODELS}
+    restored = set()
+    table = None
+    try:
+        with gzip.open(source, 'rt', encoding='utf-8') as stream, transaction.atomic(), _raw_writes():
+            header = _parse_header(stream.readline())
+            _prepare(header)
+            for line in stream:
+                if table is not None and line.startswith('['):
+                    table.add(line)
+                    continue
+                record = json.loads(line)
+                if not isinstance(record, dict):
+                    raise BackupError('Unexpected line in the backup file.')
+                if table is None and record.get('table') in models:
+                    table = _TableRestore(models[record['table']], record['columns'], header['since'] is not None, batch_size)
+                elif table is not None and record.get('end') == table.model._meta.label_lower:
+                    label, count = table.finish(record)
+                    restored.add(label)
+                    table = None
+                    if progress:
+                        progress(label, count)
+                else:
+                    raise BackupError('Unexpected line in the backup file.')
+            if table is not None or restored != set(models):
+                raise BackupError('The backup file is incomplete.')
+            statements = connection.ops.sequence_reset_sql(no_style(), BACKUP_MODELS)
+            if statements:
+                # Explicit ids were inserted; move the id sequences past them
+                with connection.cursor() as cursor:
+                    for sql in statements:
+                        cursor.execute(sql)
+    except (EOFError, OSError, ValueError, ValidationError) as e:
+        raise BackupError(f'The backup file is unreadable: {e}')
+    # Anything cached from the previous contents is now stale
+    rates.provider.invalidate()
+    return header
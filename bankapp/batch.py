@@ -0,0 +1,55 @@
+import csv
+import io
+import json
+
+MAX_BATCH_LINES = 10000  # Largest payment file accepted in one batch
+
+
+class BatchFileError(ValueError):
+    pass
+
+
+def _csv_lines(text):
+    rows = [row for row in csv.reader(io.StringIO(text)) if row and any(cell.strip() for cell in row)]
+    if rows and rows[0][0].strip().lower() == 'payment_number':
+        rows = rows[1:]  # Optional header row
+    for row in rows:
+        if len(row) < 2:
+            raise BatchFileError(f'Expected "payment_number,amount", got {",".join(row)!r}.')
+        yield row[0].strip(), row[1].strip()
+
+
+def _json_lines(text):
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise BatchFileError(f'Invalid JSON: {e}')
+    if not isinstance(data, list):
+        raise BatchFileError('Expected a JSON list of payments.')
+    for item in data:
+        if isinstance(item, dict):
+            yield str(item.get('payment_number', '')), item.get('amount')
+        elif isinstance(item, (list, tuple)) and len(item) == 2:
+            yield str(item[0]), item[1]
+        else:
+            raise BatchFileError(f'Unrecognised payment entry: {item!r}.')
+
+
+def parse_payment_file(data, filename=''):
+    """Parse a CSV or JSON payment file into a list of (payment_number, amount) pairs.
+
+    The format is taken from the file extension, falling back to sniffing for
+    a leading ``[``. Amounts are returned unparsed; batch_transfer validates them.
+    """
+    if isinstance(data, bytes):
+        try:
+            data = data.decode('utf-8-sig')
+        except UnicodeDecodeError:
+            raise BatchFileError('Payment files must be UTF-8 encoded.')
+    is_json = filename.lower().endswith('.json') or data.lstrip().startswith('[')
+    lines = list(_json_lines(data) if is_json else _csv_lines(data))
+    if not lines:
+        raise BatchFileError('The payment file is empty.')
+    if len(lines) > MAX_BATCH_LINES:
+        raise BatchFileError(f'A batch can contain at most {MAX_BATCH_LINES} payments.')
+    return lines
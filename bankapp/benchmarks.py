@@ -0,0 +1,266 @@
+import json
+import time
+import tracemalloc
+from decimal import Decimal
+from typing import Callable, NamedTuple, Optional
+from django.contrib.auth.models import User
+from django.contrib.auth.tokens import default_token_generator
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, transaction
+from django.test import Client
+from django.urls import reverse
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+from .api import issue_token
+from .models import AdminLog
+from .seeding import seed_bank
+from .transfer_queue import enqueue_transfer
+
+# (users, journal entries) per step; each step seeds on top of the previous one
+BENCHMARK_SIZES = ((100, 1000), (1000, 10000))
+BENCHMARK_PASSWORD = 'fakebank-benchmark'
+ROLES = ('anon', 'customer', 'admin', 'root')
+# Statements that depend on how a run is wrapped (command vs. TestCase), not on the view
+TRANSACTION_SQL = ('BEGIN', 'SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')
+
+
+class Case(NamedTuple):
+    name: str                     # URL name in bankapp/urls.py
+    role: str                     # Who makes the request: one of ROLES
+    budget: Optional[int]         # Most queries allowed at every dataset size; None = grows with the data
+    method: str = 'get'
+    variant: str = ''             # Tells apart several cases for the same URL, method and role
+    kwargs: tuple = ()            # Fixture keys passed as URL arguments
+    data: Callable = None         # fixture -> GET params / POST data (a str is sent as JSON)
+    token: bool = False           # Authenticate with an API token instead of the session
+
+    @property
+    def label(self):
+        variant = f' [{self.variant}]' if self.variant else ''
+        return f'{self.method.upper()} {self.name}{variant} ({self.role})'
+
+
+class QueryCounter:
+    """``connection.execute_wrapper`` that counts statements, skipping transaction bookkeeping."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        if not sql.startswith(TRANSACTION_SQL):
+            self.count += 1
+        return execute(sql, params, many, context)
+
+
+def _batch_file(fixture):
+    lines = f"payment_number,amount\n{fixture['payment_number']},1.00\n{fixture['payment_number']},2.50\n"
+    return {'payments': SimpleUploadedFile('payments.csv', lines.encode())}
+
+
+# Every URL in bankapp/urls.py, as the role that normally uses it. Budgets count
+# everything the request runs, including the user lookup (sessions come from the cache;
+# admin views check the freshly loaded account, never a cached admin flag;
+# history pages read the archive horizon from its index, never a cached copy).
+CASES = (
+    Case('home', 'anon', 1),
+    Case('login', 'anon', 0),
+    Case('login', 'anon', 6, method='post',
+         data=lambda f: {'username': f['customer_username'], 'password': BENCHMARK_PASSWORD}),
+    Case('logout', 'anon', 0),
+    Case('register', 'anon', 0),
+    Case('password_reset_request', 'anon', 0),
+    Case('password_reset_done', 'anon', 0),
+    Case('password_reset_confirm', 'anon', 1, kwargs=('uidb64', 'token')),
+    Case('password_reset_complete', 'anon', 0),
+    Case('account', 'customer', 4),
+    Case('account', 'customer', 4, variant='EUR', data=lambda f: {'currency': 'EUR'}),
+    Case('account', 'customer', 13, method='post', variant='deposit',
+         data=lambda f: {'action': 'deposit', 'amount': '10.00', 'idempotency_key': 'benchmark'}),
+    Case('account', 'customer', 10, method='post', variant='send',
+         data=lambda f: {'action': 'send', 'payment_number': f['payment_number'], 'send_amount': '1.00'}),
+    Case('account_statement', 'customer', 6, data=lambda f: {'from': '2000-01-01', 'format': 'csv'}),
+    Case('batch_payments', 'customer', 1),
+    Case('batch_payments', 'customer', 7, method='post', data=_batch_file),
+    Case('admin_dashboard', 'admin', 5),
+    Case('admin_dashboard', 'admin', 6, variant='filtered',
+         data=lambda f: {'kind': AdminLog.SUSPEND_ACCOUNT, 'admin': 'bench-admin'}),
+    Case('create_admin', 'admin', 1),
+    Case('create_admin', 'admin', 9, method='post',
+         data=lambda f: {'username': 'bench-new-admin', 'password': BENCHMARK_PASSWORD, 'first_name': 'New', 'last_name': 'Admin'}),
+    Case('reset_bank', 'root', 1),
+    Case('reset_bank', 'root', None, method='post'),  # Batched deletes: one round per RESET_BATCH_SIZE rows
+    Case('view_transactions', 'admin', 3),
+    Case('view_transactions', 'admin', 4, variant='filtered',
+         data=lambda f: {'account': f['customer_username'], 'min_amount': '1'}),
+    Case('view_transactions', 'admin', 3, variant='csv', data=lambda f: {'format': 'csv', 'date_from': '2000-01-01'}),
+    Case('manage_accounts', 'admin', 2),
+    Case('edit_balance', 'admin', 2, kwargs=('account_id',)),
+    Case('edit_balance', 'admin', 8, method='post', kwargs=('account_id',), data=lambda f: {'balance': '75.00'}),
+    Case('close_account', 'admin', 2, kwargs=('account_id',)),
+    Case('suspend_account', 'admin', 2, kwargs=('account_id',)),
+    Case('suspend_account', 'admin', 4, method='post', kwargs=('account_id',)),
+    Case('delete_account', 'admin', 2, kwargs=('account_id',)),
+    Case('metrics', 'anon', 0),
+    Case('api_balance', 'customer', 1, token=True),
+    Case('api_history', 'customer', 3, token=True),
+    Case('api_transfers', 'customer', 7, method='post', token=True,
+         data=lambda f: json.dumps({'payment_number': f['payment_number'], 'amount': '1.00'})),
+    Case('api_transfer_status', 'customer', 2, kwargs=('command_id',), token=True),
+    Case('api_admin_accounts', 'admin', 2, token=True),
+)
+
+
+def _create_user(username, is_admin=False):
+    # The post_save signal opens the $50 account
+    user = User.objects.create_user(username=username, password=BENCHMARK_PASSWORD, first_name='Bench', last_name=username)
+    if is_admin:
+        user.account.is_admin = True
+        user.account.save(update_fields=['is_admin'])
+    return user
+
+
+def create_fixture():
+    """Create the root and admin users plus their API tokens; the customer comes from the seeded data."""
+    users = {'admin': _create_user('bench-admin', is_admin=True), 'root': _create_user('root', is_admin=True)}
+    return {
+        'users': users,
+        'tokens': {role: issue_token(user.account, 'benchmark') for role, user in users.items()},
+    }
+
+
+def _seed_step(fixture, step, users, transactions):
+    seed_bank(users, transactions, seed=step, prefix=f'bench{step}-', fast_hasher=True, password=BENCHMARK_PASSWORD)
+    # The admin log grows with the bank too; the dashboard must not grow with it
+    admin = fixture['users']['admin'].account
+    AdminLog.objects.bulk_create(
+        [AdminLog(admin=admin, kind=AdminLog.SUSPEND_ACCOUNT, target=admin, target_number=admin.account_number)
+         for _ in range(transactions // 10)],
+    )
+    if 'customer' in fixture['users']:
+        return
+    customer = User.objects.select_related('account').get(username='bench0-0')
+    target = User.objects.select_related('account').get(username='bench0-1')
+    fixture['users']['customer'] = customer
+    fixture['tokens']['customer'] = issue_token(customer.account, 'benchmark')
+    fixture.update(
+        customer_username=customer.username,
+        account_id=target.account.pk,
+        payment_number=target.account.payment_number,
+        uidb64=urlsafe_base64_encode(force_bytes(customer.pk)),
+        token=default_token_generator.make_token(customer),
+        command_id=enqueue_transfer(customer.account, target.account.payment_number, Decimal('1.00')).pk,
+    )
+
+
+def _clients(fixture):
+    clients = {}
+    for role, user in fixture['users'].items():
+        clients[role] = Client()
+        clients[role].force_login(user)
+    return clients
+
+
+def _request(case, fixture, clients):
+    # Anonymous requests get fresh cookies, so a benchmarked login never leaks into the next case
+    client = Client() if case.role == 'anon' else clients[case.role]
+    url = reverse(case.name, kwargs={key: fixture[key] for key in case.kwargs})
+    data = case.data(fixture) if case.data else {}
+    extra = {}
+    if case.token:
+        extra['HTTP_AUTHORIZATION'] = f"Bearer {fixture['tokens'][case.role]}"
+    if isinstance(data, str):
+        extra['content_type'] = 'application/json'
+    # Every run is rolled back, so each case sees the same dataset
+    with transaction.atomic():
+        response = getattr(client, case.method)(url, data, **extra)
+        if getattr(response, 'streaming', False):
+            b''.join(response.streaming_content)  # The streamed body is part of the work
+        transaction.set_rollback(True)
+    return response
+
+
+def run_case(case, fixture, clients):
+    """Time one request, count its queries and measure its peak Python memory."""
+    _request(case, fixture, clients)  # Warm caches (rates, templates, URL resolver) first
+    counter = QueryCounter()
+    # Counted with a wrapper: the test client's request_started signal resets connection.queries
+    with connection.execute_wrapper(counter):
+        started = time.perf_counter()
+        response = _request(case, fixture, clients)
+        elapsed = time.perf_counter() - started
+    # Separate run: tracemalloc slows allocation-heavy code down too much to time it
+    tracemalloc.start()
+    try:
+        _request(case, fixture, clients)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {
+        'view': case.label,
+        'status': response.status_code,
+        'queries': counter.count,
+        'budget': case.budget,
+        'wall_ms': round(elapsed * 1000, 2),
+        'peak_kib': round(peak / 1024, 1),
+    }
+
+
+def run_benchmarks(sizes=BENCHMARK_SIZES, cases=CASES, progress=None):
+    """Seed each dataset size in turn and run every case against it; returns the report dict.
+
+    Expects a database without other bank data, such as a test database.
+    Each step seeds on top of the last, so sizes must increase.
+    ``progress(users, transactions, results)`` is called after each size.
+    """
+    fixture = create_fixture()
+    runs = []
+    previous = (0, 0)
+    for step, (users, transactions) in enumerate(sizes):
+        _seed_step(fixture, step, users - previous[0], transactions - previous[1])
+        previous = (users, transactions)
+        clients = _clients(fixture)
+        results = [run_case(case, fixture, clients) for case in cases]
+        runs.append({'users': users, 'transactions': transactions, 'results': results})
+        if progress:
+            progress(users, transactions, results)
+    return {'vendor': connection.vendor, 'runs': runs}
+
+
+def over_budget(report):
+    """Return (users, result) for every request that ran more queries than its budget."""
+    return [
+        (run['users'], result)
+        for run in report['runs'] for result in run['results']
+        if result['budget'] is not None and result['queries'] > result['budget']
+    ]
+
+
+def query_growth(report):
+    """Return (view, counts per size) for budgeted views whose query count changed with the data."""
+    counts = {}
+    for run in report['runs']:
+        for result in run['results']:
+            if result['budget'] is not None:
+                counts.setdefault(result['view'], []).append(result['queries'])
+    return [(view, found) for view, found in counts.items() if len(set(found)) > 1]
+
+
+def compare(report, baseline, slowdown=1.5):
+    """Diff two reports: query count increases and wall times over ``slowdown`` x the baseline."""
+    before = {(run['users'], result['view']): result for run in baseline['runs'] for result in run['results']}
+    changes = []
+    for run in report['runs']:
+        for result in run['results']:
+            old = before.get((run['users'], result['view']))
+            if old is None:
+                continue
+            if result['queries'] > old['queries']:
+                changes.append(f"{result['view']} @ {run['users']} users: {old['queries']} -> {result['queries']} queries")
+            if result['wall_ms'] > old['wall_ms'] * slowdown:
+                changes.append(f"{result['view']} @ {run['users']} users: {old['wall_ms']} -> {result['wall_ms']} ms")
+    return changes
+
+
+def dump_report(report):
+    # Stable key order and one field per line keep reports diffable
+    return json.dumps(report, indent=2, sort_keys=True) + '\n'
@@ -0,0 +1,58 @@
+from django.db import transaction
+from django.db.models import Max, OuterRef, Subquery, Sum
+from django.utils import timezone
+from .models import CHECKPOINT_LAG, OPENING_BALANCE, BalanceCheckpoint, Posting
+
+CHECKPOINT_BATCH_SIZE = 5000  # Accounts checkpointed per transaction
+
+
+def _latest_balances(account_ids):
+    # Newest checkpoint per account, fetched for a whole batch of accounts in one query
+    newest = BalanceCheckpoint.objects.filter(account_id=OuterRef('account_id')).order_by('-as_of').values('pk')[:1]
+    return dict(
+        BalanceCheckpoint.objects.filter(account_id__in=account_ids, pk=Subquery(newest))
+        .values_list('account_id', 'balance')
+    )
+
+
+def write_checkpoints(lag=CHECKPOINT_LAG, batch_size=CHECKPOINT_BATCH_SIZE, progress=None):
+    """Checkpoint every account that has postings since the previous run.
+
+    The run covers postings up to the newest one older than ``lag``. Every
+    checkpoint it writes shares that posting's id as ``last_posting_id``, so
+    the next run can start from it with a single ``id > watermark`` range.
+    Per-account deltas come from one GROUP BY over the new postings. Accounts
+    with no new activity keep their older checkpoint, which is still correct.
+    Returns the number of checkpoints written.
+    """
+    cutoff = Posting.objects.filter(timestamp__lte=timezone.now() - lag).order_by('-pk').values('pk', 'timestamp').first()
+    if cutoff is None:
+        return 0
+    watermark = BalanceCheckpoint.objects.aggregate(last=Max('last_posting_id'))['last'] or 0
+    if cutoff['pk'] <= watermark:
+        return 0
+
+    deltas = list(
+        Posting.objects.filter(pk__gt=watermark, pk__lte=cutoff['pk'])
+        .values_list('account_id')
+        .annotate(total=Sum('amount'))
+        .order_by('account_id')
+    )
+    written = 0
+    for start in range(0, len(deltas), batch_size):
+        batch = deltas[start:start + batch_size]
+        previous = _latest_balances([account_id for account_id, _ in batch])
+        with transaction.atomic():
+            BalanceCheckpoint.objects.bulk_create([
+                BalanceCheckpoint(
+                    account_id=account_id,
+                    as_of=cutoff['timestamp'],
+                    balance=previous.get(account_id, OPENING_BALANCE) + total,
+                    last_posting_id=cutoff['pk'],
+                )
+                for account_id, total in batch
+            ])
+        written += len(batch)
+        if progress:
+            progress(written, len(deltas))
+    return written
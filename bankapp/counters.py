@@ -0,0 +1,92 @@
+import logging
+import random
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import F, Sum
+from .models import Account, BalanceShard, BankCounter, CounterReconciliation
+
+logger = logging.getLogger(__name__)
+
+TOTAL_BALANCE = 'total_balance'  # Sum of every account balance, admins included
+CUSTOMER_ACCOUNTS = 'customer_accounts'  # Number of non-admin accounts
+COUNTER_NAMES = (TOTAL_BALANCE, CUSTOMER_ACCOUNTS)
+COUNTER_SHARDS = 8
+CENTS = Decimal('0.01')
+
+
+def _actual_values():
+    return {
+        # Hot accounts hold part of their balance in shard rows
+        TOTAL_BALANCE: (
+            (Account.objects.aggregate(total=Sum('balance'))['total'] or Decimal('0'))
+            + (BalanceShard.objects.aggregate(total=Sum('balance'))['total'] or Decimal('0'))
+        ).quantize(CENTS),
+        CUSTOMER_ACCOUNTS: Decimal(Account.objects.filter(is_admin=False).count()),
+    }
+
+
+def adjust(name, delta):
+    """Add ``delta`` to a counter inside the caller's transaction.
+
+    The increment lands on a random shard row, so two concurrent deposits
+    usually touch different rows and don't queue behind each other.
+    """
+    if not delta:
+        return
+    shard = random.randrange(COUNTER_SHARDS)
+    updated = BankCounter.objects.filter(name=name, shard=shard).update(value=F('value') + delta)
+    if not updated:
+        # Shard row not created yet (fresh or flushed database); reconcile() fills in the real total later
+        BankCounter.objects.get_or_create(name=name, shard=shard)
+        BankCounter.objects.filter(name=name, shard=shard).update(value=F('value') + delta)
+
+
+def read_all():
+    """Return every counter's current value in one small query over the shard rows."""
+    values = {name: Decimal('0') for name in COUNTER_NAMES}
+    for row in BankCounter.objects.values('name').annotate(total=Sum('value')):
+        values[row['name']] = row['total'].quantize(CENTS)
+    return values
+
+
+def read(name):
+    total = BankCounter.objects.filter(name=name).aggregate(total=Sum('value'))['total'] or Decimal('0')
+    return total.quantize(CENTS)
+
+
+def latest_drift():
+    """Return {name: CounterReconciliation} for counters whose last check found drift."""
+    flagged = {}
+    for name in COUNTER_NAMES:
+        check = CounterReconciliation.objects.filter(name=name).order_by('-checked_at').first()
+        if check and check.drift:
+            flagged[name] = check
+    return flagged
+
+
+def reconcile(record=True):
+    """Recompute the real aggregates, record any drift and reset the counters to match.
+
+    Counter rows are locked first, so writers that adjust a counter wait for
+    the check instead of racing it. Returns one CounterReconciliation per
+    counter; they are only saved (and drift only logged) when ``record`` is
+    true, so bulk rewrites like the bank reset can resync without raising alarms.
+    """
+    checks = []
+    with transaction.atomic():
+        list(BankCounter.objects.select_for_update().order_by('pk').values_list('pk', flat=True))
+        recorded = read_all()
+        for name, expected in _actual_values().items():
+            if record and recorded[name] != expected:
+                logger.warning('Counter %s drifted: recorded %s, expected %s', name, recorded[name], expected)
+            checks.append(CounterReconciliation(name=name, expected=expected, recorded=recorded[name]))
+            # Fold everything into shard 0 and clear the rest; every shard row is created up
+            # front so adjust() stays a single UPDATE instead of falling back to get_or_create
+            BankCounter.objects.bulk_create(
+                [BankCounter(name=name, shard=shard) for shard in range(COUNTER_SHARDS)], ignore_conflicts=True,
+            )
+            BankCounter.objects.filter(name=name).exclude(shard=0).update(value=0)
+            BankCounter.objects.filter(name=name, shard=0).update(value=expected)
+        if record:
+            CounterReconciliation.objects.bulk_create(checks)
+    return checks
@@ -1,4 +1,5 @@
 from django import forms
+from .models import Account, AdminLog
 import uuid
 class AccountForm(forms.ModelForm):
     class Meta:
@@ -10,4 +11,31 @@ class AccountForm(forms.ModelForm):
         instance.payment_number = str(uuid.uuid4())[:10]
         if commit:
             instance.save()
-        return instance
\ No newline at end of file
+        return instance
+
+# Filters for the admin ledger browser (all optional, submitted via GET)
+class LedgerFilterForm(forms.Form):
+    date_from = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+    date_to = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+    account = forms.CharField(max_length=150, required=False, help_text='Account number or username')
+    min_amount = forms.DecimalField(max_digits=12, decimal_places=2, required=False)
+    max_amount = forms.DecimalField(max_digits=12, decimal_places=2, required=False)
+
+# Filters for the admin dashboard's log (all optional, submitted via GET)
+class AdminLogFilterForm(forms.Form):
+    kind = forms.ChoiceField(choices=[('', 'Any action')] + AdminLog.KIND_CHOICES, required=False)
+    admin = forms.CharField(max_length=150, required=False, help_text='Admin account number or username')
+    account = forms.CharField(max_length=150, required=False, help_text='Account number or username acted on')
+    date_from = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+    date_to = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+
+# Date range of a customer statement; both ends optional and inclusive
+class StatementForm(forms.Form):
+    date_from = forms.DateField(required=False)
+    date_to = forms.DateField(required=False)
+
+    def clean(self):
+        cleaned = super().clean()
+        if cleaned.get('date_from') and cleaned.get('date_to') and cleaned['date_from'] > cleaned['date_to']:
+            raise forms.ValidationError('The statement must start before it ends.')
+        return cleaned
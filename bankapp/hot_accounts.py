@@ -0,0 +1,159 @@
+import random
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from .models import Account, BalanceShard
+
+HOT_ACCOUNT_SHARDS = 8  # Sub-balance rows per hot account
+CONSOLIDATE_BATCH_SIZE = 100  # Hot accounts consolidated per transaction
+
+# A hot account's balance is its own row's balance plus the sum of its BalanceShard rows.
+# Credits land on one random shard and never lock the account row, so many payers can pay
+# the same account at once. Locks are always taken account rows first, then shard rows in
+# (account, shard) order, so the sharded paths can't deadlock with each other.
+
+
+def pick_shard():
+    return random.randrange(HOT_ACCOUNT_SHARDS)
+
+
+def credit(account_id, amount, shard=None):
+    """Add ``amount`` to one of a hot account's shards inside the caller's transaction.
+
+    Returns False if the account no longer exists, so the caller can roll back.
+    """
+    shard = pick_shard() if shard is None else shard
+    if BalanceShard.objects.filter(account_id=account_id, shard=shard).update(balance=F('balance') + amount):
+        return True
+    # No shard rows (flag set without enable()): the account row is always a correct place for money
+    return bool(Account.objects.filter(pk=account_id).update(balance=F('balance') + amount))
+
+
+def lock_shards(account_ids, also=()):
+    """Lock every shard of ``account_ids`` plus the (account id, shard) pairs in ``also``, in one ordered query.
+
+    Returns {account id: [BalanceShard, ...]} for the accounts in ``account_ids``.
+    """
+    account_ids = set(account_ids)
+    query = Q(account_id__in=account_ids)
+    for account_id, shard in also:
+        query |= Q(account_id=account_id, shard=shard)
+    shards = {}
+    for row in BalanceShard.objects.select_for_update().filter(query).order_by('account_id', 'shard'):
+        if row.account_id in account_ids:
+            shards.setdefault(row.account_id, []).append(row)
+    return shards
+
+
+def pull(shards, amount):
+    """Take up to ``amount`` out of locked shard rows, fullest first; returns (amount taken, rows changed).
+
+    Rows are only changed in memory; the caller saves them once the debit is certain.
+    """
+    taken = Decimal('0')
+    changed = []
+    for row in sorted(shards, key=lambda row: row.balance, reverse=True):
+        if taken >= amount or row.balance <= 0:
+            break
+        part = min(row.balance, amount - taken)
+        row.balance -= part
+        taken += part
+        changed.append(row)
+    return taken, changed
+
+
+def fold(account_ids, skip_locked=False):
+    """Empty the shards of ``account_ids`` inside the caller's transaction; returns {account id: amount}.
+
+    The caller must already hold the account rows' locks and add the amounts
+    to them. With ``skip_locked``, shards that a credit is writing right now
+    are left for the next run instead of waited for.
+    """
+    rows = list(
+        BalanceShard.objects.select_for_update(skip_locked=skip_locked)
+        .filter(account_id__in=account_ids).exclude(balance=0).order_by('account_id', 'shard')
+    )
+    folded = {}
+    for row in rows:
+        folded[row.account_id] = folded.get(row.account_id, Decimal('0')) + row.balance
+    if rows:
+        BalanceShard.objects.filter(pk__in=[row.pk for row in rows]).update(balance=0)
+    return folded
+
+
+def _shard_total(account_ids):
+    return BalanceShard.objects.filter(account_id__in=account_ids).aggregate(total=Sum('balance'))['total'] or Decimal('0')
+
+
+def current_balance(account):
+    """Return the account's full balance: its own row plus, for a hot account, every shard."""
+    if not account.is_hot:
+        return account.balance
+    return account.balance + _shard_total([account.pk])
+
+
+async def acurrent_balance(account):
+    if not account.is_hot:
+        return account.balance
+    total = await BalanceShard.objects.filter(account_id=account.pk).aaggregate(total=Sum('balance'))
+    return account.balance + (total['total'] or Decimal('0'))
+
+
+def with_full_balance(accounts):
+    """Annotate an Account queryset with ``full_balance`` (row plus shards) in the same query."""
+    shards = (BalanceShard.objects.filter(account_id=OuterRef('pk')).order_by()
+              .values('account_id').annotate(total=Sum('balance')).values('total'))
+    return accounts.annotate(full_balance=F('balance') + Coalesce(Subquery(shards), Value(Decimal('0'))))
+
+
+def enable(account):
+    """Turn on hot mode: create the account's shard rows, then start routing credits to them."""
+    with transaction.atomic():
+        BalanceShard.objects.bulk_create(
+            [BalanceShard(account=account, shard=shard) for shard in range(HOT_ACCOUNT_SHARDS)], ignore_conflicts=True,
+        )
+        Account.objects.filter(pk=account.pk).update(is_hot=True)
+    account.is_hot = True
+
+
+def disable(account):
+    """Turn off hot mode and fold the shards back into the account row.
+
+    A credit that read the flag just before it changed still lands on a
+    shard; consolidate() folds shards of any account, hot or not, so it is
+    picked up on the next run.
+    """
+    with transaction.atomic():
+        balance = Account.objects.select_for_update().values_list('balance', flat=True).get(pk=account.pk)
+        balance += fold([account.pk]).get(account.pk, Decimal('0'))
+        Account.objects.filter(pk=account.pk).update(balance=balance, is_hot=False)
+    account.balance = balance
+    account.is_hot = False
+
+
+def consolidate(batch_size=CONSOLIDATE_BATCH_SIZE, skip_locked=True):
+    """Fold every non-empty shard into its account row, ``batch_size`` accounts per transaction.
+
+    Keeps the account rows of hot accounts close to their real balance, so
+    debits rarely need to pull from shards. Shards being credited at that
+    moment are skipped rather than waited for, unless ``skip_locked`` is
+    False (as when every shard must be empty afterwards). Returns the amount
+    moved.
+    """
+    account_ids = list(
+        BalanceShard.objects.exclude(balance=0).order_by('account_id').values_list('account_id', flat=True).distinct()
+    )
+    moved = Decimal('0')
+    for start in range(0, len(account_ids), batch_size):
+        with transaction.atomic():
+            balances = dict(
+                Account.objects.select_for_update().filter(pk__in=account_ids[start:start + batch_size])
+                .order_by('pk').values_list('pk', 'balance')
+            )
+            folded = fold(list(balances), skip_locked=skip_locked)
+            Account.objects.bulk_update(
+                [Account(pk=pk, balance=balances[pk] + amount) for pk, amount in folded.items()], ['balance'],
+            )
+        moved += sum(folded.values(), Decimal('0'))
+    return moved
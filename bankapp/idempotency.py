@@ -0,0 +1,68 @@
+from datetime import timedelta
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from .models import IdempotencyKey
+
+IDEMPOTENCY_TTL = timedelta(hours=24)  # How long a key's outcome is replayed
+MAX_KEY_LENGTH = 64
+PURGE_BATCH_SIZE = 5000
+REUSED_KEY_STATUS = 422  # A stored key sent again with a different action
+
+
+def _stored(account, key):
+    # Single read on the (account, key) unique index
+    return IdempotencyKey.objects.filter(
+        account=account, key=key, expires_at__gt=timezone.now(), status_code__isnull=False,
+    ).values_list('status_code', 'response', 'action').first()
+
+
+def _replay(stored, action):
+    status_code, response, stored_action = stored
+    if stored_action != action:
+        # Not a retry of the stored request: refuse rather than pass off its outcome as this one's
+        return REUSED_KEY_STATUS, {'error': 'This idempotency key was already used for a different request.'}, False
+    return status_code, response, True
+
+
+def run_once(account, key, action, operation):
+    """Run ``operation`` at most once per (account, key) and return its outcome.
+
+    ``operation()`` must return ``(status_code, response)`` where ``response``
+    is JSON-serialisable. Returns ``(status_code, response, replayed)``. A
+    repeat of a stored key returns the saved outcome without calling
+    ``operation``; a stored key sent with another ``action`` gets a 422 error
+    and nothing runs. The key row is claimed in the same transaction as the
+    operation, so a concurrent duplicate waits on the unique index and then
+    replays the winner's outcome instead of moving money twice. A blank key
+    just runs the operation.
+    """
+    if not key:
+        return (*operation(), False)
+    stored = _stored(account, key)
+    if stored:
+        return _replay(stored, action)
+    try:
+        with transaction.atomic():
+            # An expired row still holding this key would block the insert; it is safe to reuse
+            IdempotencyKey.objects.filter(account=account, key=key, expires_at__lte=timezone.now()).delete()
+            record = IdempotencyKey.objects.create(
+                account=account, key=key, action=action, expires_at=timezone.now() + IDEMPOTENCY_TTL,
+            )
+            status_code, response = operation()
+            IdempotencyKey.objects.filter(pk=record.pk).update(status_code=status_code, response=response)
+    except IntegrityError:
+        stored = _stored(account, key)
+        if stored is None:
+            raise
+        return _replay(stored, action)
+    return status_code, response, False
+
+
+def purge_expired(batch_size=PURGE_BATCH_SIZE):
+    """Delete expired keys in small batches; returns the number removed."""
+    removed = 0
+    while True:
+        ids = list(IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return removed
+        removed += IdempotencyKey.objects.filter(pk__in=ids).delete()[0]
@@ -0,0 +1,336 @@
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import F
+from .models import OPENING_BALANCE, Account, BalanceShard, JournalEntry, Posting
+from . import counters, hot_accounts, velocity
+
+# Balances may never drop below this (per user rules)
+OVERDRAFT_FLOOR = Decimal('-5')
+
+
+class LedgerError(Exception):
+    """Base class for money movements the ledger refuses to apply."""
+
+
+class InvalidAmount(LedgerError):
+    pass
+
+
+class InvalidRecipient(LedgerError):
+    pass
+
+
+class InsufficientFunds(LedgerError):
+    pass
+
+
+class AccountSuspended(LedgerError):
+    """The paying account is suspended or closed; money can still come in, not go out."""
+
+
+SUSPENDED_MESSAGE = 'Your account is suspended or closed.'
+
+
+class TransferBlocked(LedgerError):
+    """Refused by a velocity rule (see bankapp.velocity)."""
+
+
+def _check_sender(is_suspended, is_closed):
+    # Read from the locked row, so a suspension committed a moment ago already applies
+    if is_suspended or is_closed:
+        raise AccountSuspended(SUSPENDED_MESSAGE)
+
+
+def _check_amount(amount):
+    if amount is None or not amount.is_finite() or amount <= 0:
+        raise InvalidAmount('Amount must be greater than zero.')
+
+
+def _debit(account_id, amount):
+    # Conditional UPDATE: the overdraft floor is enforced by the database, not by a stale Python value
+    return Account.objects.filter(
+        pk=account_id, balance__gte=OVERDRAFT_FLOOR + amount
+    ).update(balance=F('balance') - amount)
+
+
+def _credit(account_id, amount):
+    return Account.objects.filter(pk=account_id).update(balance=F('balance') + amount)
+
+
+def _debit_hot(account_id, balance, amount, also=()):
+    """Debit a hot account whose row is locked at ``balance``; returns the row's new balance, or None.
+
+    When the row alone would drop below the overdraft floor, the difference
+    is pulled from the account's shards. Shards being credited in the same
+    transaction are passed as ``also``, so every shard lock is taken in one
+    ordered query.
+    """
+    shortfall = OVERDRAFT_FLOOR + amount - balance
+    if shortfall > 0:
+        shards = hot_accounts.lock_shards([account_id], also=also).get(account_id, [])
+        taken, changed = hot_accounts.pull(shards, shortfall)
+        if taken < shortfall:
+            return None
+        BalanceShard.objects.bulk_update(changed, ['balance'])
+        balance += taken
+    balance -= amount
+    Account.objects.filter(pk=account_id).update(balance=balance)
+    return balance
+
+
+def _post(kind, lines, memo=''):
+    """Write one journal entry and its postings; ``lines`` are (account_id, counterparty_id, amount)."""
+    entry = JournalEntry.objects.create(kind=kind, memo=memo)
+    Posting.objects.bulk_create([
+        Posting(entry=entry, account_id=account_id, counterparty_id=counterparty_id,
+                amount=amount, timestamp=entry.created_at)
+        for account_id, counterparty_id, amount in lines
+    ])
+    return entry
+
+
+def transfer(sender, recipient, amount):
+    """Move ``amount`` from ``sender`` to ``recipient`` atomically; returns the JournalEntry.
+
+    Runs as: one SELECT ... FOR UPDATE locking both rows in id order, a
+    conditional debit, a credit, the journal entry and one bulk INSERT of its
+    two postings. A hot recipient's row is not locked: the credit lands on one
+    of its shards. The in-memory ``balance`` (the account row) of both accounts
+    is updated on success.
+    """
+    _check_amount(amount)
+    if recipient.pk == sender.pk:
+        raise InvalidRecipient('You cannot send money to yourself.')
+    with transaction.atomic():
+        # Lock in ascending id order so two opposite transfers can never deadlock
+        balances, frozen = {}, {}
+        for pk, balance, is_suspended, is_closed in (
+            Account.objects.select_for_update()
+            .filter(pk__in=[sender.pk] if recipient.is_hot else [sender.pk, recipient.pk])
+            .order_by('pk')
+            .values_list('pk', 'balance', 'is_suspended', 'is_closed')
+        ):
+            balances[pk] = balance
+            frozen[pk] = (is_suspended, is_closed)
+        _check_sender(*frozen[sender.pk])
+        if not recipient.is_hot and recipient.pk not in balances:
+            raise InvalidRecipient('Recipient payment number not found.')
+        shard = hot_accounts.pick_shard() if recipient.is_hot else None
+        if sender.is_hot:
+            sender_balance = _debit_hot(sender.pk, balances[sender.pk], amount,
+                                        also=[(recipient.pk, shard)] if recipient.is_hot else ())
+            if sender_balance is None:
+                raise InsufficientFunds('Insufficient funds: balance cannot drop below -$5.')
+        elif _debit(sender.pk, amount):
+            sender_balance = balances[sender.pk] - amount
+        else:
+            raise InsufficientFunds('Insufficient funds: balance cannot drop below -$5.')
+        if recipient.is_hot:
+            if not hot_accounts.credit(recipient.pk, amount, shard):
+                raise InvalidRecipient('Recipient payment number not found.')
+        else:
+            _credit(recipient.pk, amount)
+        entry = _post(JournalEntry.TRANSFER, [
+            (sender.pk, recipient.pk, -amount),
+            (recipient.pk, sender.pk, amount),
+        ])
+    sender.balance = sender_balance
+    if not recipient.is_hot:
+        recipient.balance = balances[recipient.pk] + amount
+    return entry
+
+
+def screen(sender, payee, amount):
+    """Run the velocity rules on one send; returns the Decision to pass to velocity.record()."""
+    _check_amount(amount)
+    if payee.pk == sender.pk:
+        raise InvalidRecipient('You cannot send money to yourself.')
+    decision, = velocity.evaluate(sender.pk, [(payee, amount)])
+    if not decision.allowed:
+        raise TransferBlocked(decision.reason)
+    return decision
+
+
+def send_payment(sender, payment_number, amount):
+    """Resolve ``payment_number``, screen and transfer to it; returns the JournalEntry."""
+    try:
+        recipient = Account.objects.only('pk', 'is_hot', 'is_suspended', 'is_closed').get(payment_number=payment_number)
+    except Account.DoesNotExist:
+        raise InvalidRecipient('Recipient payment number not found.')
+    payee = velocity.Payee(recipient.pk, recipient.is_suspended, recipient.is_closed)
+    decision = screen(sender, payee, amount)
+    entry = transfer(sender, recipient, amount)
+    velocity.record(sender.pk, [(payee, amount)], [decision])
+    return entry
+
+
+def _lock_balance(account_id):
+    return Account.objects.select_for_update().values_list('balance', flat=True).get(pk=account_id)
+
+
+def _lock_sender_balance(account_id):
+    balance, is_suspended, is_closed = (
+        Account.objects.select_for_update().values_list('balance', 'is_suspended', 'is_closed').get(pk=account_id)
+    )
+    _check_sender(is_suspended, is_closed)
+    return balance
+
+
+def deposit(account, amount):
+    _check_amount(amount)
+    if account.is_hot:
+        with transaction.atomic():
+            hot_accounts.credit(account.pk, amount)
+            _post(JournalEntry.DEPOSIT, [(account.pk, None, amount)])
+            counters.adjust(counters.TOTAL_BALANCE, amount)
+        return
+    with transaction.atomic():
+        balance = _lock_balance(account.pk)
+        _credit(account.pk, amount)
+        _post(JournalEntry.DEPOSIT, [(account.pk, None, amount)])
+        counters.adjust(counters.TOTAL_BALANCE, amount)
+    account.balance = balance + amount
+
+
+def withdraw(account, amount):
+    _check_amount(amount)
+    with transaction.atomic():
+        balance = _lock_sender_balance(account.pk)
+        if account.is_hot:
+            balance = _debit_hot(account.pk, balance, amount)
+            if balance is None:
+                raise InsufficientFunds('Insufficient funds: balance cannot drop below -$5.')
+        elif _debit(account.pk, amount):
+            balance -= amount
+        else:
+            raise InsufficientFunds('Insufficient funds: balance cannot drop below -$5.')
+        _post(JournalEntry.WITHDRAWAL, [(account.pk, None, -amount)])
+        counters.adjust(counters.TOTAL_BALANCE, -amount)
+    account.balance = balance
+
+
+def set_balance(account, new_balance, memo='', **fields):
+    """Overwrite an account's balance (admin edits, closures), journaling the difference.
+
+    Extra ``fields`` (e.g. ``is_closed=True``) are saved in the same UPDATE.
+    A hot account's shards are emptied, so ``new_balance`` is its whole balance.
+    """
+    with transaction.atomic():
+        old_balance = _lock_balance(account.pk)
+        if account.is_hot:
+            old_balance += hot_accounts.fold([account.pk]).get(account.pk, Decimal('0'))
+        Account.objects.filter(pk=account.pk).update(balance=new_balance, **fields)
+        if new_balance != old_balance:
+            _post(JournalEntry.ADJUSTMENT, [(account.pk, None, new_balance - old_balance)], memo=memo)
+            counters.adjust(counters.TOTAL_BALANCE, new_balance - old_balance)
+    account.balance = new_balance
+    for name, value in fields.items():
+        setattr(account, name, value)
+
+
+BATCH_WRITE_SIZE = 1000  # Rows per bulk UPDATE / INSERT statement in batch payments
+
+
+def batch_transfer(sender, lines):
+    """Pay many recipients from ``sender`` in one atomic unit.
+
+    ``lines`` is a sequence of (payment_number, amount) pairs. Recipients are
+    resolved with one ``payment_number__in`` query; lines that can't be paid
+    (bad amount, unknown recipient, self) are rejected individually. The total
+    of the remaining lines is checked against the overdraft floor up front, and
+    if it fails the whole batch is rejected. Otherwise the sender is debited
+    once, recipients are credited with bulk UPDATEs (hot accounts on one of
+    their shards instead) and a single journal entry
+    carries two postings per line. Returns one result dict per input line.
+    """
+    results = []
+    for number, (payment_number, amount) in enumerate(lines, start=1):
+        result = {'line': number, 'payment_number': payment_number, 'amount': amount, 'status': 'pending', 'error': ''}
+        try:
+            amount = Decimal(str(amount).strip())
+            _check_amount(amount)
+            result['amount'] = amount
+        except (ArithmeticError, ValueError, InvalidAmount):
+            result.update(status='rejected', error='Amount must be a number greater than zero.')
+        results.append(result)
+
+    pending = [result for result in results if result['status'] == 'pending']
+    recipients, hot = {}, set()
+    for payment_number, pk, is_hot, is_suspended, is_closed in (
+        Account.objects.filter(payment_number__in={result['payment_number'] for result in pending})
+        .values_list('payment_number', 'pk', 'is_hot', 'is_suspended', 'is_closed')
+    ):
+        recipients[payment_number] = velocity.Payee(pk, is_suspended, is_closed)
+        if is_hot:
+            hot.add(pk)
+    for result in pending:
+        payee = recipients.get(result['payment_number'])
+        if payee is None:
+            result.update(status='rejected', error='Recipient payment number not found.')
+        elif payee.pk == sender.pk:
+            result.update(status='rejected', error='You cannot send money to yourself.')
+        else:
+            result['recipient_id'] = payee.pk
+    payable = [result for result in pending if 'recipient_id' in result]
+    # Velocity rules judge the lines in order, as if each allowed line before them were already paid
+    screened = [(recipients[result['payment_number']], result['amount']) for result in payable]
+    decisions = velocity.evaluate(sender.pk, screened)
+    for result, decision in zip(payable, decisions):
+        if not decision.allowed:
+            result.update(status='rejected', error=decision.reason)
+    payable = [result for result, decision in zip(payable, decisions) if decision.allowed]
+    if not payable:
+        return results
+
+    total = sum(result['amount'] for result in payable)
+    credits = {}
+    for result in payable:
+        credits[result['recipient_id']] = credits.get(result['recipient_id'], Decimal('0')) + result['amount']
+
+    # Hot recipients are credited on a shard each, in (account, shard) order, without locking their rows
+    hot_credits = sorted((pk, hot_accounts.pick_shard()) for pk in credits if pk in hot)
+
+    with transaction.atomic():
+        # Same deadlock-free id ordering as single transfers, for every account in the batch at once
+        balances = {}
+        for pk, balance, is_suspended, is_closed in (
+            Account.objects.select_for_update()
+            .filter(pk__in=[sender.pk, *(pk for pk in credits if pk not in hot)])
+            .order_by('pk')
+            .values_list('pk', 'balance', 'is_suspended', 'is_closed')
+        ):
+            balances[pk] = balance
+            if pk == sender.pk and (is_suspended or is_closed):
+                for result in payable:
+                    result.update(status='rejected', error=SUSPENDED_MESSAGE)
+                return results
+        if sender.is_hot:
+            sender_balance = _debit_hot(sender.pk, balances[sender.pk], total, also=hot_credits)
+        elif balances[sender.pk] - total >= OVERDRAFT_FLOOR and _debit(sender.pk, total):
+            sender_balance = balances[sender.pk] - total
+        else:
+            sender_balance = None
+        if sender_balance is None:
+            for result in payable:
+                result.update(status='rejected', error=f'Batch total ${total} would take the balance below -$5.')
+            return results
+        # Rows are locked, so absolute new balances are safe to write with CASE-based bulk updates
+        Account.objects.bulk_update(
+            [Account(pk=pk, balance=balances[pk] + amount) for pk, amount in credits.items() if pk not in hot],
+            ['balance'], batch_size=BATCH_WRITE_SIZE,
+        )
+        for pk, shard in hot_credits:
+            hot_accounts.credit(pk, credits[pk], shard)
+        entry = JournalEntry.objects.create(kind=JournalEntry.TRANSFER, memo=f'Batch payment ({len(payable)} lines)')
+        postings = []
+        for result in payable:
+            postings.append(Posting(entry=entry, account_id=sender.pk, counterparty_id=result['recipient_id'],
+                                    amount=-result['amount'], timestamp=entry.created_at))
+            postings.append(Posting(entry=entry, account_id=result['recipient_id'], counterparty_id=sender.pk,
+                                    amount=result['amount'], timestamp=entry.created_at))
+        Posting.objects.bulk_create(postings, batch_size=BATCH_WRITE_SIZE)
+    for result in payable:
+        result['status'] = 'paid'
+    velocity.record(sender.pk, screened, decisions)
+    sender.balance = sender_balance
+    return results
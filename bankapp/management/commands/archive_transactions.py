@@ -0,0 +1,26 @@
+from datetime import datetime, time
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from bankapp.archive import ARCHIVE_BATCH_SIZE, archive_postings
+
+
+class Command(BaseCommand):
+    help = 'Move ledger postings older than a date into the archive table, in batches (history reads still see them).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--before', required=True, metavar='YYYY-MM-DD', help='Archive postings made before this day.')
+        parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE, help='Postings moved per transaction.')
+
+    def handle(self, *args, **options):
+        try:
+            day = datetime.strptime(options['before'], '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError('--before must be a date like 2024-01-31.')
+
+        def progress(moved):
+            self.stdout.write(f'archived {moved} postings')
+
+        moved = archive_postings(
+            timezone.make_aware(datetime.combine(day, time.min)), batch_size=options['batch_size'], progress=progress,
+        )
+        self.stdout.write(self.style.SUCCESS(f'{moved} postings archived.'))
@@ -0,0 +1,26 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from bankapp.backup import RESTORE_BATCH_SIZE, BackupError, restore_backup
+
+
+class Command(BaseCommand):
+    help = 'Load a bank_backup file with batched bulk inserts; incremental backups go on top of their base.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help='Backup file written by bank_backup.')
+        parser.add_argument('--batch-size', type=int, default=RESTORE_BATCH_SIZE, help='Rows per bulk INSERT.')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+
+        def progress(table, rows):
+            self.stdout.write(f'{table}: {rows} rows ({time.monotonic() - started:.1f}s)')
+
+        try:
+            header = restore_backup(options['input'], batch_size=options['batch_size'], progress=progress)
+        except BackupError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(
+            f"{'Incremental' if header['since'] else 'Full'} backup from {header['created_at']} restored "
+            f"in {time.monotonic() - started:.1f}s."
+        ))
@@ -0,0 +1,34 @@
+import csv
+from pathlib import Path
+from django.core.management.base import BaseCommand, CommandError
+from bankapp import ledger
+from bankapp.batch import BatchFileError, parse_payment_file
+from bankapp.models import Account
+
+
+class Command(BaseCommand):
+    help = 'Pay every (payment_number, amount) line of a CSV/JSON file from one account, atomically.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help='User whose account sends the payments.')
+        parser.add_argument('file', help='CSV (payment_number,amount) or JSON payment file.')
+
+    def handle(self, *args, **options):
+        try:
+            sender = Account.objects.get(user__username=options['username'])
+        except Account.DoesNotExist:
+            raise CommandError(f"No account for user '{options['username']}'.")
+        path = Path(options['file'])
+        try:
+            lines = parse_payment_file(path.read_bytes(), path.name)
+        except (OSError, BatchFileError) as e:
+            raise CommandError(str(e))
+
+        results = ledger.batch_transfer(sender, lines)
+        # Per-line report as CSV on stdout
+        writer = csv.writer(self.stdout)
+        writer.writerow(['line', 'payment_number', 'amount', 'status', 'error'])
+        for result in results:
+            writer.writerow([result['line'], result['payment_number'], result['amount'], result['status'], result['error']])
+        paid = sum(1 for result in results if result['status'] == 'paid')
+        self.stderr.write(f'{paid}/{len(results)} payments sent; balance now ${sender.balance}.')
@@ -0,0 +1,61 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from django.test.runner import DiscoverRunner
+from django.test.utils import setup_test_environment, teardown_test_environment
+from bankapp.benchmarks import BENCHMARK_SIZES, compare, dump_report, over_budget, query_growth, run_benchmarks
+
+
+def _size(value):
+    try:
+        users, transactions = (int(part) for part in value.split(':'))
+    except ValueError:
+        raise CommandError(f"Sizes look like USERS:TRANSACTIONS, got '{value}'.")
+    return users, transactions
+
+
+class Command(BaseCommand):
+    help = 'Benchmark every bankapp URL against seeded datasets in a throwaway test database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=_size, default=list(BENCHMARK_SIZES),
+                            help='Dataset sizes as USERS:TRANSACTIONS, smallest first.')
+        parser.add_argument('--output', help='Write the JSON report to this file.')
+        parser.add_argument('--baseline', help='Earlier JSON report to compare against.')
+        parser.add_argument('--slowdown', type=float, default=1.5, help='Flag views this many times slower than the baseline.')
+
+    def handle(self, *args, **options):
+        sizes = options['sizes']
+        if sizes != sorted(sizes):
+            raise CommandError('--sizes must increase: each dataset is seeded on top of the previous one.')
+
+        def progress(users, transactions, results):
+            self.stdout.write(f'{users} users / {transactions} journal entries')
+            for result in results:
+                budget = '-' if result['budget'] is None else result['budget']
+                self.stdout.write(f"  {result['view']:<50} {result['queries']:>4}/{budget:<4} "
+                                  f"{result['wall_ms']:>9.2f} ms {result['peak_kib']:>9.1f} KiB")
+
+        # Seeding and the rolled-back requests never touch the real database
+        setup_test_environment()
+        runner = DiscoverRunner(verbosity=0, interactive=False)
+        databases = runner.setup_databases()
+        try:
+            report = run_benchmarks(sizes, progress=progress)
+        finally:
+            runner.teardown_databases(databases)
+            teardown_test_environment()
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(dump_report(report))
+        problems = [f"{result['view']} @ {users} users: {result['queries']} queries, budget {result['budget']}"
+                    for users, result in over_budget(report)]
+        problems += [f'{view}: query count changed with the data {counts}' for view, counts in query_growth(report)]
+        if options['baseline']:
+            with open(options['baseline']) as baseline:
+                problems += compare(report, json.load(baseline), options['slowdown'])
+        for problem in problems:
+            self.stderr.write(problem)
+        if problems:
+            raise CommandError(f'{len(problems)} benchmark regression(s).')
+        self.stdout.write(self.style.SUCCESS('All views within their query budgets.'))
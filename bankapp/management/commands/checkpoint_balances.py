@@ -0,0 +1,24 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from bankapp.checkpoints import CHECKPOINT_BATCH_SIZE, write_checkpoints
+from bankapp.models import CHECKPOINT_LAG
+
+
+class Command(BaseCommand):
+    help = 'Write balance checkpoints for every account with postings since the last run (run periodically).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=CHECKPOINT_BATCH_SIZE, help='Checkpoints written per transaction.')
+        parser.add_argument('--lag-seconds', type=int, default=int(CHECKPOINT_LAG.total_seconds()),
+                            help='Only cover postings at least this old.')
+
+    def handle(self, *args, **options):
+        def progress(done, total):
+            self.stdout.write(f'checkpointed {done}/{total} accounts')
+
+        written = write_checkpoints(
+            lag=timedelta(seconds=options['lag_seconds']),
+            batch_size=options['batch_size'],
+            progress=progress,
+        )
+        self.stdout.write(self.style.SUCCESS(f'{written} checkpoints written.'))
@@ -0,0 +1,20 @@
+import time
+from django.core.management.base import BaseCommand
+from bankapp.hot_accounts import CONSOLIDATE_BATCH_SIZE, consolidate
+
+
+class Command(BaseCommand):
+    help = "Fold hot accounts' shard balances into their account rows (run periodically, or keep running with --every)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=CONSOLIDATE_BATCH_SIZE, help='Accounts per transaction.')
+        parser.add_argument('--every', type=int, metavar='SECONDS',
+                            help='Keep running as a background worker, consolidating this often.')
+
+    def handle(self, *args, **options):
+        while True:
+            moved = consolidate(options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'${moved} moved from shards into account rows.'))
+            if not options['every']:
+                return
+            time.sleep(options['every'])
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+from bankapp import hot_accounts
+from bankapp.models import Account
+
+
+class Command(BaseCommand):
+    help = 'Turn hot-account mode on (or off with --off) for an account that many payers credit at once.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('payment_number')
+        parser.add_argument('--off', action='store_true', help='Fold the shards back into the account and stop sharding.')
+
+    def handle(self, *args, **options):
+        try:
+            account = Account.objects.get(payment_number=options['payment_number'])
+        except Account.DoesNotExist:
+            raise CommandError(f"No account with payment number '{options['payment_number']}'.")
+        if options['off']:
+            hot_accounts.disable(account)
+            self.stdout.write(self.style.SUCCESS(f'{account} is no longer hot; balance ${account.balance}.'))
+        else:
+            hot_accounts.enable(account)
+            self.stdout.write(self.style.SUCCESS(
+                f'{account} is hot: credits now land on {hot_accounts.HOT_ACCOUNT_SHARDS} shards.'
+            ))
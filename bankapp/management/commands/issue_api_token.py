@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+from bankapp.api import issue_token
+from bankapp.models import Account
+
+
+class Command(BaseCommand):
+    help = 'Create a JSON API bearer token for a user. The key is shown once and cannot be recovered.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('--name', default='', help='Label for the token, e.g. the integration using it.')
+
+    def handle(self, *args, **options):
+        try:
+            account = Account.objects.get(user__username=options['username'])
+        except Account.DoesNotExist:
+            raise CommandError(f"No account for user '{options['username']}'.")
+        self.stdout.write(issue_token(account, options['name']))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from bankapp.idempotency import PURGE_BATCH_SIZE, purge_expired
+
+
+class Command(BaseCommand):
+    help = 'Delete expired idempotency keys (run periodically).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=PURGE_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        removed = purge_expired(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'{removed} expired idempotency keys removed.'))
@@ -0,0 +1,20 @@
+import time
+from django.core.management.base import BaseCommand
+from bankapp.sessions import PURGE_BATCH_SIZE, purge_expired
+
+
+class Command(BaseCommand):
+    help = 'Delete expired sessions in small batches (run periodically, or keep running with --every).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=PURGE_BATCH_SIZE)
+        parser.add_argument('--every', type=int, metavar='SECONDS',
+                            help='Keep running as a background worker, purging this often.')
+
+    def handle(self, *args, **options):
+        while True:
+            removed = purge_expired(options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'{removed} expired sessions removed.'))
+            if not options['every']:
+                return
+            time.sleep(options['every'])
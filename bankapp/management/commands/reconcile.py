@@ -0,0 +1,33 @@
+import csv
+import time
+from django.core.management.base import BaseCommand, CommandError
+from bankapp.reconciliation import RECONCILE_RANGE_SIZE, RECONCILE_WORKERS, reconcile_ledger
+
+
+class Command(BaseCommand):
+    help = 'Check every account balance against its ledger postings in parallel and write a discrepancy report.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=RECONCILE_WORKERS, help='Worker processes (1 = no pool).')
+        parser.add_argument('--range-size', type=int, default=RECONCILE_RANGE_SIZE, help='Account ids per unit of work.')
+        parser.add_argument('--report', default='ledger-discrepancies.csv', help='CSV file listing every mismatch.')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1 or options['range_size'] < 1:
+            raise CommandError('--workers and --range-size must be positive.')
+        started = time.monotonic()
+
+        def progress(checked, found):
+            self.stdout.write(f'{checked} accounts checked, {found} mismatched ({time.monotonic() - started:.1f}s)')
+
+        checked, discrepancies = reconcile_ledger(options['workers'], options['range_size'], progress=progress)
+        with open(options['report'], 'w', newline='') as report:
+            writer = csv.writer(report)
+            writer.writerow(('account_id', 'account_number', 'balance', 'expected', 'difference'))
+            for row in discrepancies:
+                writer.writerow((*row, row.difference))
+        summary = f"{checked} accounts checked in {time.monotonic() - started:.1f}s; report written to {options['report']}."
+        if discrepancies:
+            self.stdout.write(self.style.WARNING(f'{len(discrepancies)} balances disagree with the ledger. {summary}'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Every balance matches the ledger. {summary}'))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from bankapp import counters
+
+
+class Command(BaseCommand):
+    help = 'Recompute bank-wide totals from the account table, flag drift and reset the counters.'
+
+    def handle(self, *args, **options):
+        for check in counters.reconcile():
+            if check.drift:
+                self.stdout.write(self.style.WARNING(
+                    f'{check.name}: counter {check.recorded}, actual {check.expected} (drift {check.drift})'
+                ))
+            else:
+                self.stdout.write(f'{check.name}: {check.expected} (ok)')
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+from bankapp.models import Account
+from bankapp.reset import RESET_BATCH_SIZE, reset_bank
+
+
+class Command(BaseCommand):
+    help = 'Reset all non-suspended accounts to $50 and clear transactions and admin logs in small batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=RESET_BATCH_SIZE, help='Rows deleted per transaction.')
+        parser.add_argument('--truncate', action='store_true', help='Use TRUNCATE instead of batched deletes (PostgreSQL only).')
+        parser.add_argument('--admin', default='root', help='Username recorded in the admin log for this reset.')
+        parser.add_argument('--noinput', '--no-input', action='store_false', dest='interactive', help='Do not ask for confirmation.')
+
+    def handle(self, *args, **options):
+        try:
+            admin = Account.objects.get(user__username=options['admin'])
+        except Account.DoesNotExist:
+            raise CommandError(f"No account for admin user '{options['admin']}'.")
+        if options['interactive']:
+            answer = input('This wipes every transaction and admin log. Type "yes" to continue: ')
+            if answer != 'yes':
+                raise CommandError('Reset cancelled.')
+
+        def progress(label, count):
+            self.stdout.write(f'{label}: {count}')
+
+        reset_bank(admin=admin, batch_size=options['batch_size'], truncate=options['truncate'], progress=progress)
+        self.stdout.write(self.style.SUCCESS('Bank reset complete.'))
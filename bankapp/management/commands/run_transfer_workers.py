@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+from bankapp.transfer_queue import IDLE_SLEEP, QUEUE_BATCH_SIZE, TRANSFER_PARTITIONS, drain, run_pool
+
+
+class Command(BaseCommand):
+    help = 'Apply queued transfers with a pool of worker processes, one owner per partition (runs until stopped).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help=f'Worker processes (at most {TRANSFER_PARTITIONS}).')
+        parser.add_argument('--batch-size', type=int, default=QUEUE_BATCH_SIZE, help='Commands applied per transaction.')
+        parser.add_argument('--idle-sleep', type=float, default=IDLE_SLEEP, help='Seconds to wait when there is no work.')
+        parser.add_argument('--once', action='store_true', help='Drain every partition in this process, then exit.')
+
+    def handle(self, *args, **options):
+        if options['once']:
+            applied = drain(batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'{applied} queued transfers processed.'))
+            return
+        if not 1 <= options['workers'] <= TRANSFER_PARTITIONS:
+            raise CommandError(f'--workers must be between 1 and {TRANSFER_PARTITIONS}.')
+        self.stdout.write(f"Starting {options['workers']} transfer workers over {TRANSFER_PARTITIONS} partitions.")
+        run_pool(options['workers'], batch_size=options['batch_size'], idle_sleep=options['idle_sleep'])
@@ -0,0 +1,34 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from bankapp.seeding import SEED_BATCH_SIZE, SEED_PASSWORD, seed_bank
+
+
+class Command(BaseCommand):
+    help = 'Generate a deterministic synthetic dataset of users, accounts and ledger rows for load testing.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, required=True, help='Number of users/accounts to create.')
+        parser.add_argument('--transactions', type=int, default=0, help='Number of journal entries to create.')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed; the same seed gives the same data.')
+        parser.add_argument('--prefix', default='seed', help='Username prefix; must not clash with existing users.')
+        parser.add_argument('--days', type=int, default=365, help='Spread ledger timestamps over this many past days.')
+        parser.add_argument('--batch-size', type=int, default=SEED_BATCH_SIZE, help='Rows per bulk INSERT.')
+        parser.add_argument('--password', default=SEED_PASSWORD, help='Password shared by every synthetic user.')
+        parser.add_argument('--fast-hasher', action='store_true', help='Hash the password with 1 PBKDF2 iteration (cheap logins).')
+
+    def handle(self, *args, **options):
+        if options['users'] < 1 or options['transactions'] < 0:
+            raise CommandError('--users must be positive and --transactions non-negative.')
+        started = time.monotonic()
+
+        def progress(label, count):
+            self.stdout.write(f'{label}: {count} ({time.monotonic() - started:.1f}s)')
+
+        accounts, entries = seed_bank(
+            options['users'], options['transactions'], seed=options['seed'], prefix=options['prefix'],
+            days=options['days'], batch_size=options['batch_size'], fast_hasher=options['fast_hasher'],
+            password=options['password'], progress=progress,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {accounts} accounts and {entries} journal entries in {time.monotonic() - started:.1f}s.'
+        ))
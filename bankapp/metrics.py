@@ -0,0 +1,369 @@
+import atexit
+import hmac
+import ipaddress
+import json
+import os
+import threading
+import time
+import weakref
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import NamedTuple
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+FLUSH_INTERVAL = 5  # Seconds between snapshot writes when METRICS_DIR is set
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+UNRESOLVED = '<unresolved>'  # View label for requests that matched no URL
+
+
+class Metric(NamedTuple):
+    name: str
+    kind: str          # 'counter' or 'histogram'
+    help: str
+    labels: tuple
+    buckets: tuple = ()
+
+
+REQUESTS = Metric('fakebank_http_requests_total', 'counter', 'Requests handled, by view, method and status.',
+                  ('view', 'method', 'status'))
+LATENCY = Metric('fakebank_http_request_duration_seconds', 'histogram', 'Time from the first middleware to the response.',
+                 ('view',), LATENCY_BUCKETS)
+RESPONSE_SIZE = Metric('fakebank_http_response_size_bytes', 'histogram', 'Response body size; streamed bodies once sent.',
+                       ('view',), SIZE_BUCKETS)
+DB_QUERIES = Metric('fakebank_db_queries_per_request', 'histogram', 'Database statements run per request.',
+                    ('view',), QUERY_BUCKETS)
+DB_TIME = Metric('fakebank_db_duration_seconds', 'histogram', 'Time spent in the database per request.',
+                 ('view',), LATENCY_BUCKETS)
+VELOCITY_DECISIONS = Metric('fakebank_velocity_decisions_total', 'counter', 'Transfers judged by the velocity rules.',
+                            ('rule', 'outcome'))
+METRICS = {metric.name: metric for metric in (REQUESTS, LATENCY, RESPONSE_SIZE, DB_QUERIES, DB_TIME, VELOCITY_DECISIONS)}
+
+
+def _merge(into, key, values):
+    current = into.get(key)
+    if current is None:
+        into[key] = list(values)
+    else:
+        for i, value in enumerate(values):
+            current[i] += value
+
+
+class _Retire:
+    """Lives in a thread's local storage; when the thread ends its shard is folded into the retired totals."""
+
+    def __init__(self, registry, shard):
+        weakref.finalize(self, registry._retire, shard)
+
+
+class Registry:
+    """Per-process metric aggregates with no locking on the request path.
+
+    Each thread records into its own shard: a dict of (metric name, label
+    values) -> [value] for counters, or [per-bucket counts..., +Inf count,
+    sum] for histograms. Only the owning thread writes to a shard, so
+    recording is a couple of dict and list operations. Readers sum the
+    shards. A thread's shard is folded into the retired totals when the
+    thread exits, so thread-per-request servers don't pile up shards.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = {}  # id(shard) -> shard; single dict operations are atomic under the GIL
+        self._retired = {}
+        self._retire_lock = threading.Lock()  # Thread exit and snapshots only, never per request
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = {}
+            self._local.retire = _Retire(self, shard)
+            self._shards[id(shard)] = shard
+        return shard
+
+    def _retire(self, shard):
+        with self._retire_lock:
+            for key, values in list(shard.items()):
+                _merge(self._retired, key, values)
+            del self._shards[id(shard)]
+
+    def inc(self, metric, labels, amount=1):
+        shard = self._shard()
+        values = shard.get((metric.name, labels))
+        if values is None:
+            shard[(metric.name, labels)] = [amount]
+        else:
+            values[0] += amount
+
+    def observe(self, metric, labels, value):
+        shard = self._shard()
+        values = shard.get((metric.name, labels))
+        if values is None:
+            values = shard[(metric.name, labels)] = [0] * (len(metric.buckets) + 2)
+        values[bisect_left(metric.buckets, value)] += 1
+        values[-1] += value
+
+    def snapshot(self):
+        """Return {(metric name, labels): values} summed over every thread of this process."""
+        with self._retire_lock:
+            totals = {key: list(values) for key, values in self._retired.items()}
+            for shard in list(self._shards.values()):
+                for key, values in list(shard.items()):
+                    _merge(totals, key, values)
+        return totals
+
+
+registry = Registry()
+
+
+class _Flusher:
+    """Writes this process's snapshot into METRICS_DIR so any worker can serve the merged total."""
+
+    def __init__(self, interval=FLUSH_INTERVAL):
+        self.interval = interval
+        self._flushed_at = 0.0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def directory():
+        return getattr(settings, 'METRICS_DIR', None)
+
+    @staticmethod
+    def own_path(directory):
+        return os.path.join(directory, f'{os.getpid()}.json')
+
+    def maybe_flush(self):
+        now = time.monotonic()
+        if now - self._flushed_at > self.interval and self.directory() and self._lock.acquire(blocking=False):
+            try:
+                self._flushed_at = now
+                self.flush()
+            finally:
+                self._lock.release()
+
+    def flush(self):
+        directory = self.directory()
+        if not directory:
+            return
+        path = self.own_path(directory)
+        rows = [[name, list(labels), values] for (name, labels), values in registry.snapshot().items()]
+        # Write then rename, so a scrape never reads half a file
+        with open(f'{path}.tmp', 'w') as output:
+            json.dump(rows, output)
+        os.replace(f'{path}.tmp', path)
+
+
+flusher = _Flusher()
+atexit.register(flusher.flush)
+
+
+def _alive(pid):
+    if os.name != 'posix':
+        return True  # No signal 0 to probe with; keep every snapshot
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # Running as another user
+    return True
+
+
+def collect():
+    """Return the merged snapshot of every process that has written to METRICS_DIR, plus this one live.
+
+    Snapshots (and half-written temporary files) of processes that no longer
+    run are deleted, so restarted workers don't pile up files.
+    """
+    totals = registry.snapshot()
+    directory = flusher.directory()
+    if not directory or not os.path.isdir(directory):
+        return totals
+    own = os.path.basename(flusher.own_path(directory))
+    for filename in os.listdir(directory):
+        pid = filename.split('.', 1)[0]
+        if not pid.isdigit() or filename == own or not filename.endswith(('.json', '.json.tmp')):
+            continue
+        path = os.path.join(directory, filename)
+        if not _alive(int(pid)):
+            try:
+                os.remove(path)
+            except OSError:
+                pass  # Another scrape removed it first
+            continue
+        if filename.endswith('.tmp'):
+            continue
+        try:
+            with open(path) as snapshot:
+                rows = json.load(snapshot)
+        except (OSError, ValueError):
+            continue  # Vanished or unreadable; the next scrape picks it up
+        for name, labels, values in rows:
+            _merge(totals, (name, tuple(labels)), values)
+    return totals
+
+
+def scrape_allowed(request):
+    """Return whether ``request`` may read /metrics.
+
+    Allowed when the client address is in METRICS_ALLOWED_IPS (addresses or
+    networks) or it sends ``Authorization: Bearer <METRICS_TOKEN>``.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if token and hmac.compare_digest(request.headers.get('Authorization', '').encode(), f'Bearer {token}'.encode()):
+        return True
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    return any(address in ipaddress.ip_network(allowed) for allowed in getattr(settings, 'METRICS_ALLOWED_IPS', ()))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(totals):
+    """Format a snapshot in the Prometheus text exposition format (version 0.0.4)."""
+    by_metric = {}
+    for (name, labels), values in totals.items():
+        by_metric.setdefault(name, []).append((labels, values))
+    lines = []
+    for name, metric in METRICS.items():
+        lines.append(f'# HELP {name} {metric.help}')
+        lines.append(f'# TYPE {name} {metric.kind}')
+        for labels, values in sorted(by_metric.get(name, ())):
+            if metric.kind == 'counter':
+                lines.append(f'{name}{_labels(metric.labels, labels)} {_number(values[0])}')
+                continue
+            cumulative = 0
+            for bound, count in zip(metric.buckets + ('+Inf',), values):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f'{name}_bucket{_labels(metric.labels, labels, le)} {cumulative}')
+            lines.append(f'{name}_sum{_labels(metric.labels, labels)} {_number(values[-1])}')
+            lines.append(f'{name}_count{_labels(metric.labels, labels)} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+
+class _QueryTimer:
+    """Counts and times the statements of one request."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+
+# The timer of the request being handled. A context variable rather than a per-request
+# connection.execute_wrapper: it follows async views into their sync_to_async threads,
+# and concurrent requests on one event loop each see their own.
+_current_timer = ContextVar('bankapp_metrics_timer', default=None)
+
+
+def _time_query(execute, sql, params, many, context):
+    timer = _current_timer.get()
+    if timer is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timer.count += 1
+        timer.seconds += time.perf_counter() - started
+
+
+@receiver(connection_created)
+def install_query_timer(sender, connection, **kwargs):
+    # Fires again on every reconnect of the same wrapper, so only install once
+    if _time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_time_query)
+
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else UNRESOLVED
+
+
+def _count_streamed(content, view):
+    size = 0
+    for chunk in content:
+        size += len(chunk)
+        yield chunk
+    registry.observe(RESPONSE_SIZE, (view,), size)
+
+
+async def _acount_streamed(content, view):
+    size = 0
+    async for chunk in content:
+        size += len(chunk)
+        yield chunk
+    registry.observe(RESPONSE_SIZE, (view,), size)
+
+
+class RequestMetricsMiddleware:
+    """Record latency, DB work, response size and status per resolved URL name.
+
+    Goes first in MIDDLEWARE so session, auth and CSRF work is counted too.
+    Runs natively under both WSGI and ASGI, so async views stay on the event loop.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        timer = _QueryTimer()
+        token = _current_timer.set(timer)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_timer.reset(token)
+        return self._record(request, response, timer, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        timer = _QueryTimer()
+        token = _current_timer.set(timer)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_timer.reset(token)
+        return self._record(request, response, timer, time.perf_counter() - started)
+
+    def _record(self, request, response, timer, elapsed):
+        view = _view_name(request)
+        registry.inc(REQUESTS, (view, request.method, str(response.status_code)))
+        registry.observe(LATENCY, (view,), elapsed)
+        registry.observe(DB_QUERIES, (view,), timer.count)
+        registry.observe(DB_TIME, (view,), timer.seconds)
+        if getattr(response, 'is_async', False):
+            response.streaming_content = _acount_streamed(response.streaming_content, view)
+        elif getattr(response, 'streaming', False):
+            response.streaming_content = _count_streamed(response.streaming_content, view)
+        else:
+            registry.observe(RESPONSE_SIZE, (view,), len(response.content))
+        flusher.maybe_flush()
+        return response
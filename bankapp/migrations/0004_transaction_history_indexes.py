@@ -0,0 +1,21 @@
+# Generated by Django 5.1.6 on 2026-10-17 16:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bankapp', '0003_account_is_closed'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['from_account', 'timestamp'], name='bankapp_tra_from_ac_1c3847_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['to_account', 'timestamp'], name='bankapp_tra_to_acco_c94be3_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.1.6 on 2026-10-17 16:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bankapp', '0004_transaction_history_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['timestamp'], name='bankapp_tra_timesta_13ea65_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['amount', 'timestamp'], name='bankapp_tra_amount_1c321d_idx'),
+        ),
+    ]
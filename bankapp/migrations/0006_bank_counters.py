@@ -0,0 +1,52 @@
+# Generated by Django 5.1.6 on 2026-10-17 16:02
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def seed_counters(apps, schema_editor):
+    # Start the counters from the real aggregates so existing data is reflected
+    Account = apps.get_model('bankapp', 'Account')
+    BankCounter = apps.get_model('bankapp', 'BankCounter')
+    total = Account.objects.aggregate(total=Sum('balance'))['total'] or 0
+    customers = Account.objects.filter(is_admin=False).count()
+    BankCounter.objects.bulk_create([
+        BankCounter(name='total_balance', shard=0, value=total),
+        BankCounter(name='customer_accounts', shard=0, value=customers),
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bankapp', '0005_transaction_ledger_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BankCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50)),
+                ('shard', models.PositiveSmallIntegerField(default=0)),
+                ('value', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('name', 'shard'), name='unique_counter_shard')],
+            },
+        ),
+        migrations.CreateModel(
+            name='CounterReconciliation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50)),
+                ('expected', models.DecimalField(decimal_places=2, max_digits=16)),
+                ('recorded', models.DecimalField(decimal_places=2, max_digits=16)),
+                ('checked_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['name', 'checked_at'], name='bankapp_cou_name_35f51a_idx')],
+            },
+        ),
+        migrations.RunPython(seed_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,123 @@
+# Generated by Django 5.1.6 on 2026-10-17 16:05
+
+import django.db.models.deletion
+import django.utils.timezone
+from collections import Counter
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Sum
+
+COPY_BATCH_SIZE = 2000
+OPENING_BALANCE = Decimal('50.00')  # Every account started with the $50 promo
+CENTS = Decimal('0.01')
+
+
+def copy_transactions(apps, schema_editor):
+    # Each send wrote two Transaction rows (-x then +x for the same from/to pair);
+    # they become one transfer entry with a posting per account. Self-referencing
+    # rows were deposits (+) or withdrawals (-) and become single-posting entries.
+    Transaction = apps.get_model('bankapp', 'Transaction')
+    JournalEntry = apps.get_model('bankapp', 'JournalEntry')
+    Posting = apps.get_model('bankapp', 'Posting')
+    unmatched = Counter()  # (from, to, size) of copied transfers still waiting for their mirror row
+    batch = []
+
+    def flush():
+        entries = JournalEntry.objects.bulk_create([entry for entry, lines in batch])
+        postings = []
+        for entry, (_, lines) in zip(entries, batch):
+            for posting in lines:
+                posting.entry = entry
+                postings.append(posting)
+        Posting.objects.bulk_create(postings)
+        batch.clear()
+
+    for tx in Transaction.objects.order_by('pk').iterator(chunk_size=COPY_BATCH_SIZE):
+        if tx.from_account_id == tx.to_account_id:
+            kind = 'deposit' if tx.amount >= 0 else 'withdrawal'
+            lines = [Posting(account_id=tx.from_account_id, amount=tx.amount, timestamp=tx.timestamp)]
+        else:
+            key = (tx.from_account_id, tx.to_account_id, abs(tx.amount))
+            if unmatched[key]:
+                unmatched[key] -= 1  # Mirror row of a transfer already copied
+                continue
+            unmatched[key] += 1
+            kind = 'transfer'
+            lines = [
+                Posting(account_id=tx.from_account_id, counterparty_id=tx.to_account_id, amount=-abs(tx.amount), timestamp=tx.timestamp),
+                Posting(account_id=tx.to_account_id, counterparty_id=tx.from_account_id, amount=abs(tx.amount), timestamp=tx.timestamp),
+            ]
+        batch.append((JournalEntry(kind=kind, created_at=tx.timestamp), lines))
+        if len(batch) >= COPY_BATCH_SIZE:
+            flush()
+    if batch:
+        flush()
+
+    # Deposits, withdrawals and admin balance edits mostly changed Account.balance without a
+    # Transaction row. One adjustment per account posts what the copied rows don't explain,
+    # so balance == opening promo + postings holds from here on.
+    Account = apps.get_model('bankapp', 'Account')
+    posted = dict(Posting.objects.values_list('account_id').annotate(total=Sum('amount')).order_by())
+    now = django.utils.timezone.now()
+    for account_id, balance in Account.objects.order_by('pk').values_list('pk', 'balance').iterator(chunk_size=COPY_BATCH_SIZE):
+        # Quantized: some backends sum decimals with float rounding noise
+        missing = (balance - OPENING_BALANCE - posted.get(account_id, Decimal('0'))).quantize(CENTS)
+        if missing:
+            batch.append((
+                JournalEntry(kind='adjustment', memo='Balance before the journal', created_at=now),
+                [Posting(account_id=account_id, amount=missing, timestamp=now)],
+            ))
+            if len(batch) >= COPY_BATCH_SIZE:
+                flush()
+    if batch:
+        flush()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bankapp', '0006_bank_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JournalEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('transfer', 'Transfer'), ('deposit', 'Deposit'), ('withdrawal', 'Withdrawal'), ('adjustment', 'Adjustment')], max_length=20)),
+                ('memo', models.CharField(blank=True, max_length=200)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name_plural': 'journal entries',
+            },
+        ),
+        migrations.CreateModel(
+            name='Posting',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('timestamp', models.DateTimeField(default=django.utils.timezone.now)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='postings', to='bankapp.account')),
+                ('counterparty', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='bankapp.account')),
+                ('entry', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='postings', to='bankapp.journalentry')),
+            ],
+        ),
+        # Copy before building the indexes: bulk loading into an unindexed table is much faster
+        migrations.RunPython(copy_transactions, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='posting',
+            index=models.Index(fields=['account', 'timestamp'], name='bankapp_pos_account_b2c6e3_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='posting',
+            index=models.Index(fields=['timestamp'], name='bankapp_pos_timesta_7bab4b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='posting',
+            index=models.Index(fields=['amount', 'timestamp'], name='bankapp_pos_amount_56e3f5_idx'),
+        ),
+        migrations.DeleteModel(
+            name='Transaction',
+        ),
+    ]
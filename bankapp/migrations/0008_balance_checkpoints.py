@@ -0,0 +1,27 @@
+# Generated by Django 5.1.6 on 2026-10-17 16:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bankapp', '0007_journal'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BalanceCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('as_of', models.DateTimeField()),
+                ('balance', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('last_posting_id', models.BigIntegerField()),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='checkpoints', to='bankapp.account')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['account', 'as_of'], name='bankapp_bal_account_fbc9be_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.1.6 on 2026-10-17 16:09
+
+import django.utils.timezone
+from decimal import Decimal
+from django.db import migrations, models
+
+
+def seed_rates(apps, schema_editor):
+    # The rates previously hard-coded in the account view (approx., Feb 2025)
+    ExchangeRate = apps.get_model('bankapp', 'ExchangeRate')
+    ExchangeRate.objects.bulk_create([
+        ExchangeRate(currency='GBP', symbol='£', rate=Decimal('0.79')),
+        ExchangeRate(currency='EUR', symbol='€', rate=Decimal('0.92')),
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bankapp', '0010_idempotency_keys'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExchangeRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('currency', models.CharField(max_length=3)),
+                ('symbol', models.CharField(max_length=5)),
+                ('rate', models.DecimalField(decimal_places=6, max_digits=14)),
+                ('decimal_places', models.PositiveSmallIntegerField(default=2)),
+                ('effective_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['currency', 'effective_at'], name='bankapp_exc_currenc_0affc2_idx')],
+            },
+        ),
+        migrations.RunPython(seed_rates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.6 on 2026-10-17 17:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bankapp', '0011_exchange_rates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransferCommand',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('payment_number', models.CharField(max_length=10)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('partition', models.PositiveSmallIntegerField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('applied', 'Applied'), ('rejected', 'Rejected')], default='pending', max_length=10)),
+                ('error', models.CharField(blank=True, max_length=200)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('applied_at', models.DateTimeField(null=True)),
+                ('entry', models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='bankapp.journalentry')),
+                ('recipient', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='bankapp.account')),
+                ('sender', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='transfer_commands', to='bankapp.account')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['partition', 'status', 'id'], name='bankapp_tra_partiti_3730df_idx')],
+            },
+        ),
+    ]
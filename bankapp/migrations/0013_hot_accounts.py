@@ -0,0 +1,31 @@
+# Generated by Django 5.1.6 on 2026-10-17 17:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bankapp', '0012_transfer_commands'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='account',
+            name='is_hot',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='BalanceShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('balance', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_shards', to='bankapp.account')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('account', 'shard'), name='unique_balance_shard')],
+            },
+        ),
+    ]
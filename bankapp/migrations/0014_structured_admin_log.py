@@ -0,0 +1,67 @@
+# Generated by Django 5.1.6 on 2026-10-17 17:32
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bankapp', '0013_hot_accounts'),
+    ]
+
+    operations = [
+        # Existing free-text entries are kept as 'other' entries
+        migrations.RenameField(
+            model_name='adminlog',
+            old_name='action',
+            new_name='detail',
+        ),
+        migrations.AddField(
+            model_name='adminlog',
+            name='amount',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True),
+        ),
+        migrations.AlterField(
+            model_name='adminlog',
+            name='detail',
+            field=models.CharField(blank=True, max_length=200),
+        ),
+        migrations.AddField(
+            model_name='adminlog',
+            name='kind',
+            field=models.CharField(choices=[('create_admin', 'Created admin'), ('reset_bank', 'Reset bank'), ('edit_balance', 'Edited balance'), ('close_account', 'Closed account'), ('suspend_account', 'Suspended account'), ('delete_account', 'Deleted account'), ('other', 'Other')], default='other', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='adminlog',
+            name='target',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='bankapp.account'),
+        ),
+        migrations.AddField(
+            model_name='adminlog',
+            name='target_number',
+            field=models.CharField(blank=True, max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='adminlog',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='adminlog',
+            index=models.Index(fields=['timestamp'], name='bankapp_adm_timesta_034cc4_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='adminlog',
+            index=models.Index(fields=['kind', 'timestamp'], name='bankapp_adm_kind_b0e0ad_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='adminlog',
+            index=models.Index(fields=['admin', 'timestamp'], name='bankapp_adm_admin_i_64f69d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='adminlog',
+            index=models.Index(fields=['target', 'timestamp'], name='bankapp_adm_target__224829_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.6 on 2026-10-17 17:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bankapp', '0014_structured_admin_log'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedPosting',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('timestamp', models.DateTimeField()),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_postings', to='bankapp.account')),
+                ('counterparty', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='bankapp.account')),
+                ('entry', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='archived_postings', to='bankapp.journalentry')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['account', 'timestamp'], name='bankapp_arc_account_22e237_idx'), models.Index(fields=['timestamp'], name='bankapp_arc_timesta_92efbb_idx'), models.Index(fields=['amount', 'timestamp'], name='bankapp_arc_amount_be5378_idx')],
+            },
+        ),
+    ]
@@ -1,7 +1,17 @@
+from datetime import timedelta
+from decimal import Decimal
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 import uuid
 
+# Every account opens with the $50 promo, which is not itself a journal entry:
+# balance == OPENING_BALANCE + sum of the account's postings
+OPENING_BALANCE = Decimal('50.00')
+# Checkpoints only cover postings at least this old, so a transaction still in
+# flight when the job runs can't commit "behind" a checkpoint and be missed
+CHECKPOINT_LAG = timedelta(minutes=5)
+
 # Example for a user named "testuser"
 # user = User.objects.get(username='testuser')
 # Account.objects.create(
@@ -33,23 +43,311 @@ class Account(models.Model):
     is_admin = models.BooleanField(default=False)  # For admin accounts
     is_suspended = models.BooleanField(default=False)  # For suspended accounts
     is_closed = models.BooleanField(default=False)  # For closed accounts (new field)
+    is_hot = models.BooleanField(default=False)  # Credits land on BalanceShard rows (see hot_accounts)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the loaded admin flag so signals can tell when it flips
+        instance._loaded_is_admin = instance.__dict__.get('is_admin')
+        return instance
+
+    def balance_at(self, when):
+        """Return this account's balance as of ``when``.
+
+        Starts from the newest checkpoint taken at or before ``when`` and sums
+        only the postings made after it, so the cost follows recent activity
+        rather than the account's whole history.
+        """
+        checkpoint = self.checkpoints.filter(as_of__lte=when).order_by('-as_of').first()
+        base = checkpoint.balance if checkpoint else OPENING_BALANCE
+        # Archived postings keep their ids and timestamps, so both tables take the same filters
+        for postings in (self.postings.all(), self.archived_postings.all()):
+            postings = postings.filter(timestamp__lte=when)
+            if checkpoint:
+                # The timestamp bound keeps the scan on the (account, timestamp) index
+                postings = postings.filter(pk__gt=checkpoint.last_posting_id,
+                                           timestamp__gte=checkpoint.as_of - CHECKPOINT_LAG)
+            base += postings.aggregate(total=models.Sum('amount'))['total'] or Decimal('0')
+        return base
 
     def __str__(self):
         return f"{self.first_name} {self.last_name} ({self.account_number})"
 
-class Transaction(models.Model):
-    from_account = models.ForeignKey(Account, related_name='sent_transactions', on_delete=models.CASCADE)
-    to_account = models.ForeignKey(Account, related_name='received_transactions', on_delete=models.CASCADE)
-    amount = models.DecimalField(max_digits=12, decimal_places=2)  # Positive for incoming, negative for outgoing
-    timestamp = models.DateTimeField(auto_now_add=True)  # Automatically set when created
+class AppendOnlyQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        raise TypeError(f"{self.model.__name__} rows are append-only and cannot be updated")
+
+class AppendOnlyModel(models.Model):
+    # Ledger rows are written once; corrections are new entries, never edits.
+    # Bulk deletes stay available to the reset job, which wipes the whole ledger.
+    objects = AppendOnlyQuerySet.as_manager()
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise TypeError(f"{type(self).__name__} rows are append-only and cannot be changed")
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise TypeError(f"{type(self).__name__} rows are append-only and cannot be deleted")
+
+class JournalEntry(AppendOnlyModel):
+    TRANSFER = 'transfer'
+    DEPOSIT = 'deposit'
+    WITHDRAWAL = 'withdrawal'
+    ADJUSTMENT = 'adjustment'  # Admin balance edits, account closures, reset carry-overs
+    KIND_CHOICES = [
+        (TRANSFER, 'Transfer'),
+        (DEPOSIT, 'Deposit'),
+        (WITHDRAWAL, 'Withdrawal'),
+        (ADJUSTMENT, 'Adjustment'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    memo = models.CharField(max_length=200, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name_plural = 'journal entries'
+
+    def __str__(self):
+        return f"{self.get_kind_display()} #{self.pk} ({self.created_at})"
+
+class Posting(AppendOnlyModel):
+    # One line of a journal entry. A transfer's two postings sum to zero; deposits,
+    # withdrawals and adjustments have a single posting (the other side is outside the bank).
+    entry = models.ForeignKey(JournalEntry, related_name='postings', on_delete=models.PROTECT)
+    account = models.ForeignKey(Account, related_name='postings', on_delete=models.CASCADE)
+    # The other account of a transfer, copied onto each line so history needs no second lookup.
+    # No FK constraint: deleting that account must not rewrite this (immutable) row.
+    counterparty = models.ForeignKey(
+        Account, related_name='+', null=True, blank=True,
+        on_delete=models.DO_NOTHING, db_constraint=False,
+    )
+    amount = models.DecimalField(max_digits=12, decimal_places=2)  # Positive credits the account, negative debits it
+    timestamp = models.DateTimeField(default=timezone.now)  # Same as the entry's created_at
+
+    class Meta:
+        indexes = [
+            # Per-account history and balance derivation
+            models.Index(fields=['account', 'timestamp']),
+            # Admin ledger browser: bank-wide newest-first listing and amount-range filters
+            models.Index(fields=['timestamp']),
+            models.Index(fields=['amount', 'timestamp']),
+        ]
+
+    def __str__(self):
+        return f"{self.account} {self.amount:+} (entry #{self.entry_id})"
+
+class ArchivedPosting(AppendOnlyModel):
+    # A posting moved out of the hot table by archive_transactions: same id, same columns, same indexes.
+    # Only postings already covered by a balance checkpoint are moved, so balances never need them.
+    id = models.BigIntegerField(primary_key=True)
+    entry = models.ForeignKey(JournalEntry, related_name='archived_postings', on_delete=models.PROTECT)
+    account = models.ForeignKey(Account, related_name='archived_postings', on_delete=models.CASCADE)
+    counterparty = models.ForeignKey(
+        Account, related_name='+', null=True, blank=True,
+        on_delete=models.DO_NOTHING, db_constraint=False,
+    )
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    timestamp = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['account', 'timestamp']),
+            models.Index(fields=['timestamp']),
+            models.Index(fields=['amount', 'timestamp']),
+        ]
+
+    def __str__(self):
+        return f"{self.account} {self.amount:+} (entry #{self.entry_id}, archived)"
+
+class BalanceShard(models.Model):
+    # Part of a hot account's balance; the account's real balance is its own row plus all of these
+    account = models.ForeignKey(Account, related_name='balance_shards', on_delete=models.CASCADE)
+    shard = models.PositiveSmallIntegerField()
+    balance = models.DecimalField(max_digits=12, decimal_places=2, default=0)  # Never negative: debits only take what is there
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['account', 'shard'], name='unique_balance_shard'),
+        ]
 
     def __str__(self):
-        return f"{self.from_account} -> {self.to_account}: ${self.amount}"
+        return f"{self.account}[{self.shard}] = {self.balance}"
+
+class AdminLog(AppendOnlyModel):
+    # One admin action, written through bankapp.audit so it commits with the change it records
+    CREATE_ADMIN = 'create_admin'
+    RESET_BANK = 'reset_bank'
+    EDIT_BALANCE = 'edit_balance'
+    CLOSE_ACCOUNT = 'close_account'
+    SUSPEND_ACCOUNT = 'suspend_account'
+    DELETE_ACCOUNT = 'delete_account'
+    OTHER = 'other'  # Free-text entries, including every entry from before actions were structured
+    KIND_CHOICES = [
+        (CREATE_ADMIN, 'Created admin'),
+        (RESET_BANK, 'Reset bank'),
+        (EDIT_BALANCE, 'Edited balance'),
+        (CLOSE_ACCOUNT, 'Closed account'),
+        (SUSPEND_ACCOUNT, 'Suspended account'),
+        (DELETE_ACCOUNT, 'Deleted account'),
+        (OTHER, 'Other'),
+    ]
+    DESCRIPTIONS = {
+        CREATE_ADMIN: 'Created admin account for {detail}',
+        RESET_BANK: 'Reset bank to initial state',
+        EDIT_BALANCE: 'Edited balance for account {target_number} to ${amount}',
+        CLOSE_ACCOUNT: 'Closed account {target_number}',
+        SUSPEND_ACCOUNT: 'Suspended account {target_number}',
+        DELETE_ACCOUNT: 'Deleted account {target_number} and user',
+        OTHER: '{detail}',
+    }
 
-class AdminLog(models.Model):
     admin = models.ForeignKey(Account, on_delete=models.CASCADE)
-    action = models.CharField(max_length=200)  # e.g., "Added $100 to user XYZ"
-    timestamp = models.DateTimeField(auto_now_add=True)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, default=OTHER)
+    # The account acted on. No FK constraint: deleting it must not rewrite (or remove) its log rows
+    target = models.ForeignKey(
+        Account, related_name='+', null=True, blank=True,
+        on_delete=models.DO_NOTHING, db_constraint=False,
+    )
+    target_number = models.CharField(max_length=10, blank=True)  # Account number, still shown once it is deleted
+    amount = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    detail = models.CharField(max_length=200, blank=True)  # e.g. the new admin's username
+    timestamp = models.DateTimeField(default=timezone.now)  # When the action ran, not when the buffer was written
+
+    class Meta:
+        indexes = [
+            # Dashboard: newest-first pages, overall and per filter
+            models.Index(fields=['timestamp']),
+            models.Index(fields=['kind', 'timestamp']),
+            models.Index(fields=['admin', 'timestamp']),
+            models.Index(fields=['target', 'timestamp']),
+        ]
+
+    def describe(self):
+        return self.DESCRIPTIONS[self.kind].format(detail=self.detail, target_number=self.target_number, amount=self.amount)
+
+    def __str__(self):
+        return f"{self.admin} - {self.describe()}"
+
+class BankCounter(models.Model):
+    # Bank-wide running totals, split over a few shard rows so concurrent writers rarely share a row lock
+    name = models.CharField(max_length=50)
+    shard = models.PositiveSmallIntegerField(default=0)
+    value = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['name', 'shard'], name='unique_counter_shard'),
+        ]
+
+    def __str__(self):
+        return f"{self.name}[{self.shard}] = {self.value}"
+
+class CounterReconciliation(models.Model):
+    # One row per periodic check of a counter against the real aggregate
+    name = models.CharField(max_length=50)
+    expected = models.DecimalField(max_digits=16, decimal_places=2)  # Recomputed from the source tables
+    recorded = models.DecimalField(max_digits=16, decimal_places=2)  # What the counter said
+    checked_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['name', 'checked_at'])]
+
+    @property
+    def drift(self):
+        return self.recorded - self.expected
+
+    def __str__(self):
+        return f"{self.name}: recorded {self.recorded}, expected {self.expected}"
+
+class BalanceCheckpoint(models.Model):
+    # Balance of an account including every posting up to last_posting_id (written by checkpoint_balances)
+    account = models.ForeignKey(Account, related_name='checkpoints', on_delete=models.CASCADE)
+    as_of = models.DateTimeField()  # Timestamp of the last posting covered
+    balance = models.DecimalField(max_digits=12, decimal_places=2)
+    last_posting_id = models.BigIntegerField()
+
+    class Meta:
+        indexes = [models.Index(fields=['account', 'as_of'])]
+
+    def __str__(self):
+        return f"{self.account} @ {self.as_of}: ${self.balance}"
+
+class ApiToken(models.Model):
+    # Bearer token for the JSON API; only a SHA-256 digest of the key is stored
+    account = models.ForeignKey(Account, related_name='api_tokens', on_delete=models.CASCADE)
+    key_hash = models.CharField(max_length=64, unique=True)
+    name = models.CharField(max_length=100, blank=True)  # e.g. the partner integration using it
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.account} - {self.name or 'API token'}"
+
+class IdempotencyKey(models.Model):
+    # Outcome of a money-moving request, replayed when the same key is sent again
+    account = models.ForeignKey(Account, related_name='idempotency_keys', on_delete=models.CASCADE)
+    key = models.CharField(max_length=64)
+    action = models.CharField(max_length=20)  # deposit, withdraw, send, api_transfer
+    status_code = models.PositiveSmallIntegerField(null=True)
+    response = models.JSONField(null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)  # Purged after this; the key may then be reused
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['account', 'key'], name='unique_idempotency_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.account} {self.action} [{self.key}]"
+
+class ExchangeRate(models.Model):
+    # USD -> currency rate; the newest row already in effect wins. New currencies are just new rows.
+    currency = models.CharField(max_length=3)  # ISO code, e.g. GBP
+    symbol = models.CharField(max_length=5)  # e.g. £
+    rate = models.DecimalField(max_digits=14, decimal_places=6)  # Units of currency per 1 USD
+    decimal_places = models.PositiveSmallIntegerField(default=2)  # Display precision, e.g. 0 for JPY
+    effective_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [models.Index(fields=['currency', 'effective_at'])]
+
+    def __str__(self):
+        return f"USD/{self.currency} {self.rate} from {self.effective_at}"
+
+class TransferCommand(models.Model):
+    # A transfer accepted in queued mode, applied later by the worker that owns its partition
+    PENDING = 'pending'
+    APPLIED = 'applied'
+    REJECTED = 'rejected'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (APPLIED, 'Applied'),
+        (REJECTED, 'Rejected'),
+    ]
+
+    sender = models.ForeignKey(Account, related_name='transfer_commands', on_delete=models.CASCADE)
+    # Resolved when queued; cleared if the account is deleted first, which rejects the transfer
+    recipient = models.ForeignKey(Account, related_name='+', null=True, on_delete=models.SET_NULL)
+    payment_number = models.CharField(max_length=10)  # As entered, for the status endpoint
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    partition = models.PositiveSmallIntegerField()  # sender id modulo the partition count
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    error = models.CharField(max_length=200, blank=True)
+    entry = models.ForeignKey(JournalEntry, related_name='+', null=True, on_delete=models.PROTECT)
+    created_at = models.DateTimeField(auto_now_add=True)
+    applied_at = models.DateTimeField(null=True)
+
+    class Meta:
+        indexes = [
+            # Each worker's poll: the oldest pending commands of one partition
+            models.Index(fields=['partition', 'status', 'id']),
+        ]
 
     def __str__(self):
-        return f"{self.admin} - {self.action}"
+        return f"#{self.pk} {self.sender} -> {self.payment_number} ${self.amount} ({self.status})"
@@ -0,0 +1,98 @@
+import base64
+import binascii
+from datetime import datetime
+from django.db.models import Q
+
+PAGE_SIZE = 50  # Rows per history page
+
+
+def encode_cursor(row, field='timestamp'):
+    raw = str(row.pk) if field == 'pk' else f"{getattr(row, field).isoformat()}|{row.pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor, field='timestamp'):
+    """Return (timestamp, pk) -- or (pk,) when paging by pk alone -- from an opaque cursor.
+
+    Returns None if the cursor is missing or malformed.
+    """
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        if field == 'pk':
+            return (int(raw),)
+        stamp, pk = raw.split('|')
+        return datetime.fromisoformat(stamp), int(pk)
+    except (binascii.Error, UnicodeError, ValueError):
+        return None
+
+
+def _page_query(queryset, position, field, page_size):
+    if field == 'pk':
+        queryset = queryset.order_by('-pk')
+        if position:
+            queryset = queryset.filter(pk__lt=position[0])
+    else:
+        queryset = queryset.order_by(f'-{field}', '-pk')
+        if position:
+            stamp, pk = position
+            queryset = queryset.filter(Q(**{f'{field}__lt': stamp}) | Q(**{field: stamp, 'pk__lt': pk}))
+    return queryset[:page_size + 1]
+
+
+def _merge_page(merged, page_size, field):
+    rows = sorted(merged.values(), key=lambda row: (getattr(row, field), row.pk), reverse=True)
+    next_cursor = encode_cursor(rows[page_size - 1], field) if len(rows) > page_size else None
+    return rows[:page_size], next_cursor
+
+
+def _reaches(merged, page_size, field, horizon):
+    # Archived rows are all at or before the horizon, so they can only belong on a page that gets there
+    if horizon is None:
+        return False
+    if len(merged) <= page_size:
+        return True
+    last = sorted((getattr(row, field) for row in merged.values()), reverse=True)[page_size - 1]
+    return last <= horizon
+
+
+def keyset_page(*querysets, cursor=None, page_size=PAGE_SIZE, field='timestamp', archived=(), horizon=None):
+    """Return (rows, next_cursor) for a newest-first page ordered by (field, id).
+
+    Pass ``field='pk'`` to page by primary key alone.
+
+    Each queryset is read with its own ``ORDER BY field DESC, id DESC LIMIT n``
+    so it can walk its index from the cursor instead of sorting the whole
+    history; the partial pages are then merged (and de-duplicated) in Python.
+    Passing several querysets avoids OR-ing two indexed filters together,
+    which would force the database to sort every matching row.
+
+    ``archived`` querysets hold the same kind of rows moved to archive storage,
+    none newer than ``horizon``. They are only read when the page reaches back
+    to the horizon, so recent pages cost nothing extra.
+    """
+    position = decode_cursor(cursor, field)
+    merged = {}
+    for queryset in querysets:
+        for row in _page_query(queryset, position, field, page_size):
+            merged[row.pk] = row
+    if archived and _reaches(merged, page_size, field, horizon):
+        for queryset in archived:
+            for row in _page_query(queryset, position, field, page_size):
+                merged[row.pk] = row
+    return _merge_page(merged, page_size, field)
+
+
+async def akeyset_page(*querysets, cursor=None, page_size=PAGE_SIZE, field='timestamp', archived=(), horizon=None):
+    """Async version of keyset_page() for async views; the same queries, read with async iteration."""
+    position = decode_cursor(cursor, field)
+    merged = {}
+    for queryset in querysets:
+        async for row in _page_query(queryset, position, field, page_size):
+            merged[row.pk] = row
+    if archived and _reaches(merged, page_size, field, horizon):
+        for queryset in archived:
+            async for row in _page_query(queryset, position, field, page_size):
+                merged[row.pk] = row
+    return _merge_page(merged, page_size, field)
@@ -0,0 +1,108 @@
+import threading
+import time
+import uuid
+from asgiref.sync import sync_to_async
+from decimal import Decimal
+from typing import NamedTuple
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+from .models import ExchangeRate
+
+RATE_CACHE_TTL = 300  # Seconds a process keeps its rate table before reloading it
+VERSION_CHECK_INTERVAL = 5  # Seconds between checks of the shared invalidation version
+VERSION_CACHE_KEY = 'bankapp:exchange-rates:version'
+
+
+class Currency(NamedTuple):
+    code: str
+    symbol: str
+    rate: Decimal
+    quantizer: Decimal  # e.g. Decimal('0.01'), built once per currency and reused for every amount
+
+    def convert(self, amount):
+        return (amount * self.rate).quantize(self.quantizer)
+
+
+BASE_CURRENCY = Currency('USD', '$', Decimal('1'), Decimal('0.01'))
+
+
+def _quantizer(places):
+    return Decimal(1).scaleb(-places)
+
+
+class RateProvider:
+    """Process-local exchange-rate table with TTL expiry and version-based invalidation.
+
+    The table is read from ExchangeRate at most once per ``ttl`` seconds. Saving
+    a rate anywhere bumps a version in RATES_CACHE_ALIAS, and each process
+    checks it every few seconds, so an edit is picked up quickly without a
+    cache round-trip on every conversion. That cache must be shared by every
+    worker, or an edit only reaches the process that made it until its TTL.
+    """
+
+    def __init__(self, ttl=RATE_CACHE_TTL, version_interval=VERSION_CHECK_INTERVAL):
+        self.ttl = ttl
+        self.version_interval = version_interval
+        self._lock = threading.Lock()
+        self._currencies = None
+        self._version = None
+        self._loaded_at = 0.0
+        self._checked_at = 0.0
+
+    @staticmethod
+    def _shared_cache():
+        return caches[getattr(settings, 'RATES_CACHE_ALIAS', 'default')]
+
+    def _load(self):
+        currencies = {BASE_CURRENCY.code: BASE_CURRENCY}
+        # Newest row per currency that's already in effect
+        for row in ExchangeRate.objects.filter(effective_at__lte=timezone.now()).order_by('currency', '-effective_at'):
+            code = row.currency.upper()
+            if code not in currencies:
+                currencies[code] = Currency(code, row.symbol, row.rate, _quantizer(row.decimal_places))
+        return currencies
+
+    def _is_stale(self, now):
+        if self._currencies is None or now - self._loaded_at > self.ttl:
+            return True
+        if now - self._checked_at <= self.version_interval:
+            return False
+        # Only an unchanged version postpones the next check; a new one stays stale until reloaded
+        if self._shared_cache().get(VERSION_CACHE_KEY) != self._version:
+            return True
+        self._checked_at = now
+        return False
+
+    def currencies(self):
+        now = time.monotonic()
+        if self._is_stale(now):
+            with self._lock:
+                if self._is_stale(now):
+                    self._version = self._shared_cache().get(VERSION_CACHE_KEY)
+                    self._currencies = self._load()
+                    self._loaded_at = self._checked_at = now
+        return self._currencies
+
+    def get(self, code):
+        """Return the Currency for ``code``, falling back to USD for unknown codes."""
+        return self.currencies().get((code or '').upper(), BASE_CURRENCY)
+
+    async def acurrencies(self):
+        # A table inside its version interval is served from memory; only a check or reload leaves the event loop
+        if self._currencies is None or time.monotonic() - self._checked_at > self.version_interval:
+            return await sync_to_async(self.currencies)()
+        return self._currencies
+
+    async def aget(self, code):
+        """Async version of get() for async views."""
+        return (await self.acurrencies()).get((code or '').upper(), BASE_CURRENCY)
+
+    def invalidate(self):
+        # Tell every process to reload on its next version check, and make this one check now.
+        # The table itself is left in place: concurrent readers keep the old one until the reload
+        self._shared_cache().set(VERSION_CACHE_KEY, uuid.uuid4().hex, None)
+        self._checked_at = 0.0
+
+
+provider = RateProvider()
@@ -0,0 +1,102 @@
+import multiprocessing
+import os
+from decimal import Decimal
+from typing import NamedTuple
+from django.db import connection, connections, transaction
+from django.db.models import Max, Min, Sum
+from .models import OPENING_BALANCE, Account, ArchivedPosting, BalanceShard, Posting
+
+RECONCILE_RANGE_SIZE = 10000  # Account ids per range; each range is one unit of work
+RECONCILE_WORKERS = os.cpu_count() or 1
+CENTS = Decimal('0.01')
+
+
+class Discrepancy(NamedTuple):
+    account_id: int
+    account_number: str
+    balance: Decimal    # Stored: the account row plus, for a hot account, its shards
+    expected: Decimal   # Opening promo plus every posting, archived ones included
+
+    @property
+    def difference(self):
+        return self.balance - self.expected
+
+
+def account_ranges(range_size=RECONCILE_RANGE_SIZE):
+    """Split the account ids into inclusive (first, last) ranges of at most ``range_size`` ids."""
+    bounds = Account.objects.aggregate(first=Min('pk'), last=Max('pk'))
+    if bounds['first'] is None:
+        return []
+    return [
+        (first, min(first + range_size - 1, bounds['last']))
+        for first in range(bounds['first'], bounds['last'] + 1, range_size)
+    ]
+
+
+def _totals(model, field, first, last):
+    # One GROUP BY over the range, read off the (account, ...) index
+    return dict(
+        model.objects.filter(account_id__gte=first, account_id__lte=last)
+        .values_list('account_id').annotate(total=Sum(field)).order_by()
+    )
+
+
+def check_range(bounds):
+    """Compare stored balances with the ledger for accounts ``first <= id <= last``.
+
+    Returns (accounts checked, [Discrepancy, ...]). Everything is read in one
+    transaction; on PostgreSQL it is REPEATABLE READ, so transfers running
+    meanwhile can't show up as false mismatches.
+    """
+    first, last = bounds
+    outermost = not connection.in_atomic_block
+    with transaction.atomic():
+        if outermost and connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+        accounts = list(
+            Account.objects.filter(pk__range=(first, last)).order_by('pk').values_list('pk', 'account_number', 'balance')
+        )
+        shards = _totals(BalanceShard, 'balance', first, last)
+        postings = _totals(Posting, 'amount', first, last)
+        archived = _totals(ArchivedPosting, 'amount', first, last)
+    found = []
+    for pk, number, balance in accounts:
+        balance += shards.get(pk, Decimal('0'))
+        # Quantized like the counters: some backends sum decimals with float rounding noise
+        expected = (OPENING_BALANCE + postings.get(pk, Decimal('0')) + archived.get(pk, Decimal('0'))).quantize(CENTS)
+        balance = balance.quantize(CENTS)
+        if balance != expected:
+            found.append(Discrepancy(pk, number, balance, expected))
+    return len(accounts), found
+
+
+def reconcile_ledger(workers=RECONCILE_WORKERS, range_size=RECONCILE_RANGE_SIZE, progress=None):
+    """Check every account's balance against the ledger; returns (accounts checked, discrepancies).
+
+    Account ids are split into ranges that a pool of ``workers`` processes
+    checks in parallel, each with its own database connection; one worker
+    checks them in this process. ``progress(checked, found)`` is called as
+    ranges finish. Discrepancies come back sorted by account id.
+    """
+    ranges = account_ranges(range_size)
+    checked = 0
+    found = []
+
+    def collect(results):
+        nonlocal checked
+        for count, discrepancies in results:
+            checked += count
+            found.extend(discrepancies)
+            if progress:
+                progress(checked, len(found))
+
+    if workers <= 1 or len(ranges) <= 1:
+        collect(map(check_range, ranges))
+    else:
+        # Forked children must not share the parent's database connections
+        connections.close_all()
+        with multiprocessing.get_context('fork').Pool(min(workers, len(ranges))) as pool:
+            collect(pool.imap_unordered(check_range, ranges))
+    found.sort()
+    return checked, found
@@ -0,0 +1,90 @@
+from django.db import connection, transaction
+from .models import (
+    OPENING_BALANCE, Account, AdminLog, ArchivedPosting, BalanceCheckpoint, BalanceShard, JournalEntry, Posting,
+    TransferCommand,
+)
+from . import audit, counters, hot_accounts
+
+RESET_BALANCE = OPENING_BALANCE  # Every active account goes back to the $50 promo
+RESET_BATCH_SIZE = 5000  # Rows deleted per short transaction
+
+
+def _delete_in_batches(model, batch_size, progress):
+    deleted = 0
+    while True:
+        # Each batch commits on its own so row locks are held for milliseconds, not minutes
+        with transaction.atomic():
+            ids = list(model.objects.order_by('pk').values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                break
+            deleted += model.objects.filter(pk__in=ids).delete()[0]
+        if progress:
+            progress(model._meta.verbose_name_plural, deleted)
+    return deleted
+
+
+def _truncate(*models):
+    tables = ', '.join(connection.ops.quote_name(model._meta.db_table) for model in models)
+    with connection.cursor() as cursor:
+        cursor.execute(f'TRUNCATE TABLE {tables}')
+
+
+def _carry_over_suspended():
+    # Suspended accounts keep their balance; journal it so balance == opening + postings still holds
+    carried = [
+        (pk, balance - OPENING_BALANCE)
+        for pk, balance in Account.objects.filter(is_suspended=True).exclude(balance=OPENING_BALANCE).values_list('pk', 'balance')
+    ]
+    if carried:
+        with transaction.atomic():
+            entry = JournalEntry.objects.create(kind=JournalEntry.ADJUSTMENT, memo='Balance carried over bank reset')
+            Posting.objects.bulk_create(
+                [Posting(entry=entry, account_id=pk, amount=amount, timestamp=entry.created_at) for pk, amount in carried],
+                batch_size=RESET_BATCH_SIZE,
+            )
+    return len(carried)
+
+
+def reset_bank(admin=None, batch_size=RESET_BATCH_SIZE, truncate=False, progress=None):
+    """Reset every non-suspended account to $50 and wipe the ledger and admin logs.
+
+    Balances are reset with one UPDATE. The journal is removed in short,
+    separately committed batches, or with a single TRUNCATE when requested
+    and the backend supports it. ``progress(label, count)`` is called after
+    each step. Returns a dict of row counts.
+    """
+    # Every shard is folded first, waiting on any being credited, so suspended hot accounts carry
+    # over their whole balance
+    hot_accounts.consolidate(batch_size, skip_locked=False)
+    with transaction.atomic():
+        # Rows already at $50 are left alone, so they aren't locked or rewritten
+        accounts = Account.objects.filter(is_suspended=False).exclude(balance=RESET_BALANCE).update(balance=RESET_BALANCE)
+        # A credit that landed on a shard since then would sit on top of the reset balance
+        BalanceShard.objects.filter(account__is_suspended=False).exclude(balance=0).update(balance=0)
+    if progress:
+        progress('accounts reset', accounts)
+
+    if truncate and connection.vendor == 'postgresql':
+        _truncate(BalanceCheckpoint, TransferCommand, ArchivedPosting, Posting, JournalEntry, AdminLog)
+        postings = logs = None  # TRUNCATE doesn't report a row count
+        if progress:
+            progress('tables truncated', 6)
+    else:
+        # Checkpoints summarise postings that are about to disappear
+        _delete_in_batches(BalanceCheckpoint, batch_size, progress)
+        # Queued transfers are dropped with the ledger; applied ones point at entries being deleted
+        _delete_in_batches(TransferCommand, batch_size, progress)
+        # Postings first: journal entries are protected while they still have lines
+        postings = _delete_in_batches(Posting, batch_size, progress)
+        postings += _delete_in_batches(ArchivedPosting, batch_size, progress)
+        _delete_in_batches(JournalEntry, batch_size, progress)
+        logs = _delete_in_batches(AdminLog, batch_size, progress)
+    carried = _carry_over_suspended()
+    if progress:
+        progress('suspended balances carried over', carried)
+
+    counters.reconcile(record=False)  # Balances were rewritten wholesale; recount from the table
+    if admin is not None:
+        # Log the reset action
+        audit.record(admin, AdminLog.RESET_BANK)
+    return {'accounts': accounts, 'postings': postings, 'admin_logs': logs}
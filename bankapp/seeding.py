@@ -0,0 +1,140 @@
+import random
+from datetime import timedelta
+from decimal import Decimal
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+from .ledger import OVERDRAFT_FLOOR
+from .models import OPENING_BALANCE, Account, JournalEntry, Posting
+from . import counters
+
+SEED_BATCH_SIZE = 10000  # Rows per bulk INSERT
+SEED_PASSWORD = 'fakebank-seed'
+
+
+def _password_hash(password, fast):
+    # Hashed once and shared by every synthetic user; the fast variant (1 PBKDF2
+    # iteration) also keeps load-test logins cheap, and Django upgrades it on login
+    if fast:
+        return PBKDF2PasswordHasher().encode(password, PBKDF2PasswordHasher().salt(), iterations=1)
+    return make_password(password)
+
+
+def _unused_numbers(rng, field, count):
+    # Random 10-hex-digit numbers that neither repeat nor match an account already stored
+    # (earlier batches, another prefix, real users), so re-seeding never hits the unique index
+    numbers = []
+    while len(numbers) < count:
+        drawn = list(dict.fromkeys(f'{rng.getrandbits(40):010x}' for _ in range(count - len(numbers))))
+        taken = set(numbers)
+        taken.update(Account.objects.filter(**{f'{field}__in': drawn}).values_list(field, flat=True))
+        numbers += [number for number in drawn if number not in taken]
+    return numbers
+
+
+def _create_accounts(rng, count, prefix, password_hash, batch_size, progress):
+    accounts = []
+    for start in range(0, count, batch_size):
+        size = min(batch_size, count - start)
+        with transaction.atomic():
+            # bulk_create sends no post_save, so bankapp.signals.create_account is bypassed
+            users = User.objects.bulk_create([
+                User(username=f'{prefix}{start + i}', password=password_hash,
+                     first_name='Seed', last_name=f'User{start + i}', email=f'{prefix}{start + i}@example.com')
+                for i in range(size)
+            ])
+            numbers = zip(_unused_numbers(rng, 'account_number', size), _unused_numbers(rng, 'payment_number', size))
+            accounts += Account.objects.bulk_create([
+                Account(user=user, first_name=user.first_name, last_name=user.last_name,
+                        account_number=account_number, payment_number=payment_number, balance=OPENING_BALANCE)
+                for user, (account_number, payment_number) in zip(users, numbers)
+            ])
+        if progress:
+            progress('accounts', len(accounts))
+    return accounts
+
+
+def _movements(rng, account_ids, balances, count):
+    # Yields (kind, [(account_id, counterparty_id, amount), ...]) honouring the overdraft floor
+    for _ in range(count):
+        roll = rng.random()
+        account_id = rng.choice(account_ids)
+        amount = Decimal(rng.randint(100, 10000)).scaleb(-2)  # $1.00 - $100.00
+        if roll < 0.1 or len(account_ids) < 2:
+            balances[account_id] += amount
+            yield JournalEntry.DEPOSIT, [(account_id, None, amount)]
+            continue
+        if balances[account_id] - amount < OVERDRAFT_FLOOR:
+            amount = max(balances[account_id] - OVERDRAFT_FLOOR, Decimal('0')).quantize(Decimal('0.01'))
+            if not amount:
+                balances[account_id] += Decimal('100')
+                yield JournalEntry.DEPOSIT, [(account_id, None, Decimal('100.00'))]
+                continue
+        balances[account_id] -= amount
+        if roll < 0.2:
+            yield JournalEntry.WITHDRAWAL, [(account_id, None, -amount)]
+            continue
+        recipient_id = rng.choice(account_ids)
+        while recipient_id == account_id:
+            recipient_id = rng.choice(account_ids)
+        balances[recipient_id] += amount
+        yield JournalEntry.TRANSFER, [(account_id, recipient_id, -amount), (recipient_id, account_id, amount)]
+
+
+def _create_ledger(rng, account_ids, balances, count, days, batch_size, progress):
+    start = timezone.now() - timedelta(days=days)
+    step = timedelta(days=days) / max(count, 1)  # Timestamps rise with ids, like real traffic
+    batch = []
+    written = 0
+
+    def flush():
+        with transaction.atomic():
+            entries = JournalEntry.objects.bulk_create([entry for entry, lines in batch])
+            Posting.objects.bulk_create([
+                Posting(entry=entry, account_id=account_id, counterparty_id=counterparty_id,
+                        amount=amount, timestamp=entry.created_at)
+                for entry, (_, lines) in zip(entries, batch)
+                for account_id, counterparty_id, amount in lines
+            ], batch_size=batch_size)
+        batch.clear()
+
+    for number, (kind, lines) in enumerate(_movements(rng, account_ids, balances, count)):
+        batch.append((JournalEntry(kind=kind, memo='seed', created_at=start + step * number), lines))
+        if len(batch) >= batch_size:
+            written += len(batch)
+            flush()
+            if progress:
+                progress('journal entries', written)
+    if batch:
+        written += len(batch)
+        flush()
+        if progress:
+            progress('journal entries', written)
+    return written
+
+
+def seed_bank(users, transactions, seed=0, prefix='seed', days=365, batch_size=SEED_BATCH_SIZE,
+              fast_hasher=False, password=SEED_PASSWORD, progress=None):
+    """Bulk-create ``users`` synthetic users/accounts and ``transactions`` journal entries.
+
+    Everything is generated from ``random.Random(seed)``, so the same
+    arguments always give the same dataset; account and payment numbers
+    already in the database are skipped, so seeding again with another
+    prefix never collides. Final balances are written back
+    in bulk, so balance == $50 + postings holds, and the bank counters are
+    resynced at the end. Returns (accounts created, journal entries created).
+    """
+    rng = random.Random(seed)
+    accounts = _create_accounts(rng, users, prefix, _password_hash(password, fast_hasher), batch_size, progress)
+    account_ids = [account.pk for account in accounts]
+    balances = dict.fromkeys(account_ids, OPENING_BALANCE)
+    entries = _create_ledger(rng, account_ids, balances, transactions, days, batch_size, progress) if account_ids else 0
+
+    for start in range(0, len(accounts), batch_size):
+        chunk = accounts[start:start + batch_size]
+        for account in chunk:
+            account.balance = balances[account.pk]
+        Account.objects.bulk_update(chunk, ['balance'], batch_size=batch_size)
+    counters.reconcile(record=False)
+    return len(accounts), entries
@@ -0,0 +1,110 @@
+import threading
+import time
+from collections import OrderedDict
+from django.contrib.sessions.backends import cached_db
+from django.contrib.sessions.models import Session
+from django.utils import timezone
+
+LOCAL_SESSION_TTL = 2  # Seconds a process trusts its own copy before going back to the shared cache
+LOCAL_SESSION_SIZE = 10000  # Sessions kept per process
+PURGE_BATCH_SIZE = 5000
+
+
+class LocalSessionCache:
+    """Small per-process LRU of session key -> session data, each entry trusted for ``ttl`` seconds.
+
+    It soaks up the bursts of requests a browser sends with one session
+    (page, redirects, form posts) without a shared-cache round trip. The
+    short TTL bounds how long a change made by another worker process goes
+    unseen; changes made in this process update it immediately.
+    """
+
+    def __init__(self, size=LOCAL_SESSION_SIZE, ttl=LOCAL_SESSION_TTL):
+        self.size = size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            data, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+        # Sessions mutate their dict in place; never hand out the cached one
+        return dict(data)
+
+    def set(self, key, data):
+        with self._lock:
+            self._entries[key] = (dict(data), time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+local_sessions = LocalSessionCache()
+
+
+class SessionStore(cached_db.SessionStore):
+    """Sessions read from this process's LRU, then the shared cache, then the database.
+
+    Writes go through to the database and then to both caches, as with
+    Django's cached_db engine. The shared cache is SESSION_CACHE_ALIAS, so any
+    cache backend (local memory or files in tests, Redis/Memcached in
+    production) can sit behind it.
+    """
+
+    def _remember(self, data):
+        if data and self.session_key:
+            local_sessions.set(self.session_key, data)
+        return data
+
+    def load(self):
+        data = local_sessions.get(self.session_key) if self.session_key else None
+        return data if data is not None else self._remember(super().load())
+
+    async def aload(self):
+        data = local_sessions.get(self.session_key) if self.session_key else None
+        return data if data is not None else self._remember(await super().aload())
+
+    def save(self, must_create=False):
+        super().save(must_create)
+        self._remember(self._session)
+
+    async def asave(self, must_create=False):
+        await super().asave(must_create)
+        self._remember(self._session)
+
+    def delete(self, session_key=None):
+        local_sessions.discard(session_key or self.session_key)
+        super().delete(session_key)
+
+    async def adelete(self, session_key=None):
+        local_sessions.discard(session_key or self.session_key)
+        await super().adelete(session_key)
+
+
+def purge_expired(batch_size=PURGE_BATCH_SIZE):
+    """Delete expired session rows in small batches; returns the number removed.
+
+    Cached copies expire on their own, at the session's expiry.
+    """
+    removed = 0
+    while True:
+        keys = list(Session.objects.filter(expire_date__lt=timezone.now())
+                    .values_list('session_key', flat=True)[:batch_size])
+        if not keys:
+            return removed
+        removed += Session.objects.filter(session_key__in=keys).delete()[0]
@@ -1,4 +1,4 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete, pre_delete
 from django.contrib.auth.models import User
 import uuid
 
@@ -15,3 +15,39 @@ def create_account(sender, instance, created, **kwargs):
         )
 
 post_save.connect(create_account, sender=User)
+
+# Keep the bank-wide counters in step with account creation and deletion
+def count_new_account(sender, instance, created, **kwargs):
+    from . import counters
+    if created:
+        counters.adjust(counters.TOTAL_BALANCE, instance.balance)
+        if not instance.is_admin:
+            counters.adjust(counters.CUSTOMER_ACCOUNTS, 1)
+        instance._loaded_is_admin = instance.is_admin
+    elif getattr(instance, '_loaded_is_admin', None) not in (None, instance.is_admin):
+        # Promoted to (or demoted from) admin: moves between the customer count and the rest
+        counters.adjust(counters.CUSTOMER_ACCOUNTS, -1 if instance.is_admin else 1)
+        instance._loaded_is_admin = instance.is_admin
+
+def remember_shard_balance(sender, instance, **kwargs):
+    from . import hot_accounts
+    # The shards are deleted with the account, before post_delete could read them
+    instance._shard_balance = hot_accounts.current_balance(instance) - instance.balance
+
+def count_deleted_account(sender, instance, **kwargs):
+    from . import counters
+    counters.adjust(counters.TOTAL_BALANCE, -instance.balance - getattr(instance, '_shard_balance', 0))
+    if not instance.is_admin:
+        counters.adjust(counters.CUSTOMER_ACCOUNTS, -1)
+
+post_save.connect(count_new_account, sender='bankapp.Account')
+pre_delete.connect(remember_shard_balance, sender='bankapp.Account')
+post_delete.connect(count_deleted_account, sender='bankapp.Account')
+
+# Any change to the rate table invalidates every process's cached rates
+def invalidate_rates(sender, **kwargs):
+    from .rates import provider
+    provider.invalidate()
+
+post_save.connect(invalidate_rates, sender='bankapp.ExchangeRate')
+post_delete.connect(invalidate_rates, sender='bankapp.ExchangeRate')
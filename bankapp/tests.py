@@ -1,3 +1,1038 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import os
+import subprocess
+import tempfile
+from unittest import mock
+from datetime import timedelta
+from decimal import Decimal
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.contrib.sessions.models import Session
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.urls import get_resolver, reverse
+from django.utils import timezone
+from . import (
+    archive, audit, backup, batch, benchmarks, counters, exports, hot_accounts, idempotency, ledger, metrics, rates,
+    reconciliation, reset, seeding, sessions, transfer_queue, velocity,
+)
+from .api import issue_token
+from .checkpoints import write_checkpoints
+from .pagination import keyset_page
+from .models import (
+    Account, AdminLog, ApiToken, ArchivedPosting, BalanceShard, ExchangeRate, JournalEntry, Posting, TransferCommand,
+)
 
-# Create your tests here.
+# Small enough for every test run; big enough that per-row queries show up as growth
+TEST_SIZES = ((20, 200), (60, 600))
+
+
+class BankTestCase(TestCase):
+    """Every test starts with no velocity usage: the counters live in a cache the test's rollback can't undo."""
+
+    def setUp(self):
+        super().setUp()
+        for reset in (velocity.get_rules.cache_clear, velocity.windows.clear):
+            reset()
+            self.addCleanup(reset)
+
+
+class ViewBenchmarkTests(BankTestCase):
+    """Every URL runs within its query budget, and bounded views don't grow with the data."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.report = benchmarks.run_benchmarks(TEST_SIZES)
+
+    def test_every_url_is_benchmarked(self):
+        names = {pattern.name for pattern in get_resolver('bankapp.urls').url_patterns}
+        self.assertEqual(names - {case.name for case in benchmarks.CASES}, set())
+
+    def test_views_respond(self):
+        for run in self.report['runs']:
+            for result in run['results']:
+                with self.subTest(view=result['view'], users=run['users']):
+                    self.assertLess(result['status'], 400)
+
+    def test_query_budgets(self):
+        self.assertEqual(benchmarks.over_budget(self.report), [])
+
+    def test_query_counts_do_not_grow_with_data(self):
+        self.assertEqual(benchmarks.query_growth(self.report), [])
+
+    def test_report_diffs_against_itself_cleanly(self):
+        self.assertEqual(benchmarks.compare(self.report, self.report), [])
+        self.assertEqual(benchmarks.dump_report(self.report), benchmarks.dump_report(self.report))
+
+
+class RequestMetricsTests(BankTestCase):
+    """The middleware records per-view aggregates and /metrics serves them, merged across processes."""
+
+    def test_scrape_reports_the_resolved_view(self):
+        self.client.get(reverse('home'))
+        body = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('fakebank_http_requests_total{view="home",method="GET",status="200"}', body)
+        self.assertIn('fakebank_http_request_duration_seconds_bucket{view="home",le="+Inf"}', body)
+        self.assertIn('fakebank_db_queries_per_request_count{view="home"}', body)
+        self.assertNotIn('fakebank_db_queries_per_request_sum{view="home"} 0\n', body)
+        self.assertIn('# TYPE fakebank_http_response_size_bytes histogram', body)
+
+    def test_histogram_buckets_are_cumulative(self):
+        registry = metrics.Registry()
+        for seconds in (0.001, 0.02, 30):
+            registry.observe(metrics.LATENCY, ('account',), seconds)
+        body = metrics.render(registry.snapshot())
+        self.assertIn('fakebank_http_request_duration_seconds_bucket{view="account",le="0.005"} 1', body)
+        self.assertIn('fakebank_http_request_duration_seconds_bucket{view="account",le="10"} 2', body)
+        self.assertIn('fakebank_http_request_duration_seconds_bucket{view="account",le="+Inf"} 3', body)
+        self.assertIn('fakebank_http_request_duration_seconds_count{view="account"} 3', body)
+
+    def test_other_process_snapshots_are_merged(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory):
+            with open(os.path.join(directory, '1.json'), 'w') as snapshot:
+                snapshot.write('[["fakebank_http_requests_total", ["elsewhere", "GET", "200"], [5]]]')
+            metrics.registry.inc(metrics.REQUESTS, ('elsewhere', 'GET', '200'), 2)
+            body = metrics.render(metrics.collect())
+        self.assertIn('fakebank_http_requests_total{view="elsewhere",method="GET",status="200"} 7', body)
+
+    def test_snapshots_of_exited_processes_are_removed(self):
+        exited = subprocess.Popen(['true'])
+        exited.wait()
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory):
+            for name in (f'{exited.pid}.json', f'{exited.pid}.json.tmp', '1.json'):
+                with open(os.path.join(directory, name), 'w') as snapshot:
+                    snapshot.write('[]')
+            metrics.collect()
+            self.assertEqual(os.listdir(directory), ['1.json'])
+
+    @override_settings(METRICS_ALLOWED_IPS=['10.0.0.0/8'], METRICS_TOKEN='scrape-me')
+    def test_scrapes_need_an_allowed_address_or_the_token(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='10.1.2.3').status_code, 200)
+        headers = {'Authorization': 'Bearer scrape-me'}
+        self.assertEqual(self.client.get(reverse('metrics'), headers=headers).status_code, 200)
+        headers = {'Authorization': 'Bearer guess'}
+        self.assertEqual(self.client.get(reverse('metrics'), headers=headers).status_code, 403)
+
+
+class AsyncViewTests(BankTestCase):
+    """The async account page and JSON endpoints, driven through the ASGI request path."""
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='alice', password='pw')
+        self.recipient = User.objects.create_user(username='bob', password='pw').account
+        self.client = AsyncClient()
+
+    async def test_account_page_and_deposit(self):
+        await self.client.aforce_login(self.user)
+        response = await self.client.post(reverse('account'), {'action': 'deposit', 'amount': '25.00'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['balance'], Decimal('75.00'))
+        self.assertEqual(len(response.context['transactions']), 1)
+
+    async def test_api_transfer_and_history(self):
+        account = await Account.objects.aget(user=self.user)
+        token = await sync_to_async(issue_token)(account)
+        headers = {'Authorization': f'Bearer {token}'}
+        response = await self.client.post(
+            reverse('api_transfers'), {'payment_number': self.recipient.payment_number, 'amount': '10.00'},
+            content_type='application/json', headers=headers,
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['balance'], '40.00')
+        history = (await self.client.get(reverse('api_history'), headers=headers)).json()
+        self.assertEqual([row['amount'] for row in history['results']], ['-10.00'])
+        balance = (await self.client.get(reverse('api_balance'), headers=headers)).json()
+        self.assertEqual(balance['balance'], '40.00')
+
+
+class ApiAuthTests(BankTestCase):
+    """API callers need a live token for writes, and every refusal is a JSON 4xx."""
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='alice', password='pw')
+        self.recipient = User.objects.create_user(username='bob', password='pw').account
+        self.token = issue_token(self.user.account)
+
+    def _transfer(self, **headers):
+        return self.client.post(
+            reverse('api_transfers'), {'payment_number': self.recipient.payment_number, 'amount': '10.00'},
+            content_type='application/json', headers=headers,
+        )
+
+    def assertJsonError(self, response, status):
+        self.assertEqual(response.status_code, status)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertIn('error', response.json())
+
+    def test_missing_or_bad_token_is_401(self):
+        self.assertJsonError(self.client.get(reverse('api_balance')), 401)
+        self.assertJsonError(self.client.get(reverse('api_balance'), headers={'Authorization': 'Bearer guess'}), 401)
+        self.assertJsonError(self._transfer(Authorization='Bearer guess'), 401)
+
+    def test_deactivated_users_token_is_401(self):
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertJsonError(self._transfer(Authorization=f'Bearer {self.token}'), 401)
+
+    def test_session_cookie_reads_but_cannot_write(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('api_balance')).json()['balance'], '50.00')
+        self.assertJsonError(self._transfer(), 401)
+        self.assertFalse(Posting.objects.exists())
+
+    def test_errors_are_json(self):
+        headers = {'Authorization': f'Bearer {self.token}'}
+        self.assertJsonError(self.client.put(reverse('api_transfers'), headers=headers), 405)
+        self.assertJsonError(self.client.post(
+            reverse('api_transfers'), 'nope', content_type='application/json', headers=headers,
+        ), 400)
+        self.assertJsonError(self.client.get(reverse('api_admin_accounts'), headers=headers), 403)
+        self.assertJsonError(self.client.get(reverse('api_transfer_status', args=[999]), headers=headers), 404)
+        response = self.client.post(
+            reverse('api_transfers'), {'payment_number': self.recipient.payment_number, 'amount': '500.00'},
+            content_type='application/json', headers=headers,
+        )
+        self.assertJsonError(response, 422)
+
+
+class AdminAccessTests(BankTestCase):
+    """admin_required checks the account loaded with the session's user on every request."""
+
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_user(username='admin', password='pw')
+        self.admin.account.is_admin = True
+        self.admin.account.save(update_fields=['is_admin'])
+        self.client.force_login(self.admin)
+
+    def test_user_and_account_come_in_one_query(self):
+        with self.assertNumQueries(2):  # User joined with its account, then the account list
+            response = self.client.get(reverse('manage_accounts'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_account_list_is_paged(self):
+        seeding.seed_bank(60, 0, prefix='customer', fast_hasher=True)
+        first = self.client.get(reverse('manage_accounts'))
+        second = self.client.get(reverse('manage_accounts'), {'cursor': first.context['next_cursor']})
+        self.assertEqual((len(first.context['accounts']), len(second.context['accounts'])), (50, 10))
+        self.assertIsNone(second.context['next_cursor'])
+        seen = {account.pk for account in first.context['accounts'] + second.context['accounts']}
+        self.assertEqual(seen, set(Account.objects.filter(is_admin=False).values_list('pk', flat=True)))
+
+    def test_demotion_takes_effect_on_the_next_request(self):
+        self.assertEqual(self.client.get(reverse('manage_accounts')).status_code, 200)
+        # A bulk update sends no signals; nothing cached may outlive it
+        Account.objects.filter(user=self.admin).update(is_admin=False)
+        self.assertRedirects(self.client.get(reverse('manage_accounts')), reverse('home'))
+
+    def test_customers_and_anonymous_users_are_turned_away(self):
+        customer = User.objects.create_user(username='carol', password='pw')
+        self.client.force_login(customer)
+        self.assertRedirects(self.client.get(reverse('manage_accounts')), reverse('home'))
+        self.client.logout()
+        response = self.client.get(reverse('manage_accounts'))
+        # Same login redirect as login_required
+        self.assertRedirects(response, f"{settings.LOGIN_URL}?next={reverse('manage_accounts')}", fetch_redirect_response=False)
+
+
+class CachedSessionTests(BankTestCase):
+    """Sessions are written through to the database but read from the caches."""
+
+    def test_logged_in_requests_do_not_query_sessions(self):
+        self.client.force_login(User.objects.create_user(username='dave', password='pw'))
+        with self.assertNumQueries(1):  # The joined user and account load; no django_session query
+            self.client.get(reverse('batch_payments'))
+        self.assertTrue(Session.objects.filter(session_key=self.client.session.session_key).exists())
+
+    def test_reads_fall_back_to_the_database(self):
+        store = sessions.SessionStore()
+        store['colour'] = 'blue'
+        store.save()
+        sessions.local_sessions.clear()
+        store._cache.clear()
+        self.assertEqual(sessions.SessionStore(store.session_key)['colour'], 'blue')
+
+    def test_local_cache_is_bounded_and_expires(self):
+        local = sessions.LocalSessionCache(size=2, ttl=60)
+        for key in 'abc':
+            local.set(key, {'key': key})
+        self.assertIsNone(local.get('a'))
+        self.assertEqual(local.get('c'), {'key': 'c'})
+        local.ttl = -1
+        local.set('d', {'key': 'd'})
+        self.assertIsNone(local.get('d'))
+
+    def test_purge_removes_only_expired_rows(self):
+        now = timezone.now()
+        Session.objects.create(session_key='old', session_data='', expire_date=now - timedelta(days=1))
+        Session.objects.create(session_key='live', session_data='', expire_date=now + timedelta(days=1))
+        self.assertEqual(sessions.purge_expired(batch_size=1), 1)
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), ['live'])
+
+
+class LedgerTests(BankTestCase):
+    """Money moves atomically, never below the -$5 floor, and only from accounts allowed to pay."""
+
+    def setUp(self):
+        super().setUp()
+        self.alice = User.objects.create_user(username='alice', password='pw').account
+        self.bob = User.objects.create_user(username='bob', password='pw').account
+
+    def _balances(self):
+        return [Account.objects.get(pk=account.pk).balance for account in (self.alice, self.bob)]
+
+    def test_transfer_moves_money_and_journals_it(self):
+        entry = ledger.transfer(self.alice, self.bob, Decimal('20.00'))
+        self.assertEqual(self._balances(), [Decimal('30.00'), Decimal('70.00')])
+        self.assertEqual(sorted(entry.postings.values_list('account_id', 'amount')),
+                         sorted([(self.alice.pk, Decimal('-20.00')), (self.bob.pk, Decimal('20.00'))]))
+
+    def test_a_failed_credit_rolls_back_the_debit(self):
+        gone = User.objects.create_user(username='gone', password='pw').account
+        hot_accounts.enable(gone)
+        User.objects.filter(pk=gone.user_id).delete()
+        with self.assertRaises(ledger.InvalidRecipient):
+            ledger.transfer(self.alice, gone, Decimal('20.00'))
+        self.assertEqual(self._balances()[0], Decimal('50.00'))
+        self.assertFalse(JournalEntry.objects.exists())
+
+    def test_balances_stop_at_the_overdraft_floor(self):
+        ledger.withdraw(self.alice, Decimal('55.00'))
+        for move in (lambda: ledger.withdraw(self.alice, Decimal('0.01')),
+                     lambda: ledger.transfer(self.alice, self.bob, Decimal('0.01'))):
+            with self.assertRaises(ledger.InsufficientFunds):
+                move()
+        self.assertEqual(self._balances(), [Decimal('-5.00'), Decimal('50.00')])
+        self.assertEqual(self.alice.balance, Decimal('-5.00'))
+
+    def test_self_sends_and_bad_amounts_are_refused(self):
+        with self.assertRaises(ledger.InvalidRecipient):
+            ledger.send_payment(self.alice, self.alice.payment_number, Decimal('1.00'))
+        for amount in (Decimal('0'), Decimal('-1.00'), Decimal('NaN'), None):
+            for move in (ledger.deposit, ledger.withdraw, lambda account, amount: ledger.transfer(account, self.bob, amount)):
+                with self.subTest(amount=amount), self.assertRaises(ledger.InvalidAmount):
+                    move(self.alice, amount)
+        self.assertEqual(self._balances(), [Decimal('50.00'), Decimal('50.00')])
+        self.assertFalse(JournalEntry.objects.exists())
+
+    def test_suspended_senders_can_receive_but_not_pay(self):
+        Account.objects.filter(pk=self.alice.pk).update(is_suspended=True)  # In-memory copy is stale, like a request's
+        for move in (lambda: ledger.send_payment(self.alice, self.bob.payment_number, Decimal('1.00')),
+                     lambda: ledger.withdraw(self.alice, Decimal('1.00'))):
+            with self.assertRaises(ledger.AccountSuspended):
+                move()
+        results = ledger.batch_transfer(self.alice, [(self.bob.payment_number, '1.00')])
+        self.assertEqual(results[0]['error'], ledger.SUSPENDED_MESSAGE)
+        ledger.deposit(self.alice, Decimal('5.00'))
+        ledger.transfer(self.bob, self.alice, Decimal('5.00'))
+        self.assertEqual(self._balances(), [Decimal('60.00'), Decimal('45.00')])
+
+
+class CounterTests(BankTestCase):
+    """Bank-wide counters move with every balance change and reconcile() catches anything that slips past."""
+
+    def setUp(self):
+        super().setUp()
+        counters.reconcile(record=False)
+        self.alice = User.objects.create_user(username='alice', password='pw').account
+        self.bob = User.objects.create_user(username='bob', password='pw').account
+
+    def _values(self):
+        return counters.read(counters.TOTAL_BALANCE), counters.read(counters.CUSTOMER_ACCOUNTS)
+
+    def test_changes_adjust_the_counters_incrementally(self):
+        self.assertEqual(self._values(), (Decimal('100.00'), Decimal('2.00')))
+        ledger.deposit(self.alice, Decimal('25.00'))
+        ledger.withdraw(self.bob, Decimal('10.00'))
+        ledger.transfer(self.alice, self.bob, Decimal('5.00'))  # Moves money, doesn't change the total
+        self.assertEqual(self._values(), (Decimal('115.00'), Decimal('2.00')))
+        self.alice.is_admin = True
+        self.alice.save()
+        self.assertEqual(self._values(), (Decimal('115.00'), Decimal('1.00')))
+        self.bob.delete()
+        self.assertEqual(self._values(), (Decimal('70.00'), Decimal('0.00')))
+        self.assertEqual([check.drift for check in counters.reconcile()], [0, 0])
+        self.assertEqual(counters.latest_drift(), {})
+
+    def test_reconcile_records_drift_and_resyncs(self):
+        Account.objects.filter(pk=self.alice.pk).update(balance=Decimal('80.00'))  # Bypasses the ledger
+        with self.assertLogs('bankapp.counters', 'WARNING'):
+            checks = counters.reconcile()
+        self.assertEqual([(check.name, check.drift) for check in checks],
+                         [(counters.TOTAL_BALANCE, Decimal('-30.00')), (counters.CUSTOMER_ACCOUNTS, 0)])
+        self.assertEqual(list(counters.latest_drift()), [counters.TOTAL_BALANCE])
+        self.assertEqual(self._values(), (Decimal('130.00'), Decimal('2.00')))
+        self.assertEqual([check.drift for check in counters.reconcile()], [0, 0])
+        self.assertEqual(counters.latest_drift(), {})
+
+
+class ResetTests(BankTestCase):
+    """The reset puts active accounts back at $50, keeps suspended balances and empties the ledger."""
+
+    def setUp(self):
+        super().setUp()
+        self.root = User.objects.create_user(username='root', password='pw').account
+        Account.objects.filter(pk=self.root.pk).update(is_admin=True)
+        self.alice = User.objects.create_user(username='alice', password='pw').account
+        self.bob = User.objects.create_user(username='bob', password='pw').account
+        ledger.deposit(self.alice, Decimal('30.00'))
+        ledger.transfer(self.alice, self.bob, Decimal('5.00'))
+        ledger.withdraw(self.bob, Decimal('20.00'))
+        Account.objects.filter(pk=self.bob.pk).update(is_suspended=True)
+        audit.record(self.root, AdminLog.SUSPEND_ACCOUNT, target=self.bob)
+
+    def _check_reset(self):
+        balances = dict(Account.objects.values_list('pk', 'balance'))
+        self.assertEqual((balances[self.alice.pk], balances[self.root.pk]), (Decimal('50.00'), Decimal('50.00')))
+        self.assertEqual(balances[self.bob.pk], Decimal('35.00'))  # Suspended: kept, journaled as a carry-over
+        self.assertEqual(list(Posting.objects.values_list('account_id', 'entry__kind', 'amount')),
+                         [(self.bob.pk, JournalEntry.ADJUSTMENT, Decimal('-15.00'))])
+        self.assertEqual(list(AdminLog.objects.values_list('kind', flat=True)), [AdminLog.RESET_BANK])
+        self.assertEqual(reconciliation.reconcile_ledger(workers=1)[1], [])
+        self.assertEqual([check.drift for check in counters.reconcile()], [0, 0])
+
+    def test_batched_reset(self):
+        out = io.StringIO()
+        call_command('reset_bank', '--batch-size', '1', '--noinput', stdout=out)
+        self.assertIn('Bank reset complete.', out.getvalue())
+        self._check_reset()
+
+    def test_truncate_falls_back_to_batches_off_postgresql(self):
+        call_command('reset_bank', '--truncate', '--noinput', stdout=io.StringIO())
+        self._check_reset()
+
+    def test_unknown_admin_is_refused(self):
+        with self.assertRaisesMessage(CommandError, "No account for admin user 'nobody'"):
+            call_command('reset_bank', '--admin', 'nobody', '--noinput')
+        self.assertTrue(Posting.objects.exists())
+
+
+class CheckpointTests(BankTestCase):
+    """Checkpoints trail the ledger by CHECKPOINT_LAG, only cover accounts with new postings, and anchor balance_at."""
+
+    def setUp(self):
+        super().setUp()
+        self.alice = User.objects.create_user(username='alice', password='pw').account
+        self.bob = User.objects.create_user(username='bob', password='pw').account
+        self.now = timezone.now()
+        # Ids follow time, as in the real ledger; the last posting is still inside the lag
+        for account, amount, age in ((self.alice, '10.00', timedelta(hours=3)), (self.bob, '5.00', timedelta(hours=2)),
+                                     (self.alice, '20.00', timedelta(hours=1)), (self.alice, '1.00', timedelta(minutes=1))):
+            entry = JournalEntry.objects.create(kind=JournalEntry.DEPOSIT, created_at=self.now - age)
+            Posting.objects.create(entry=entry, account=account, amount=Decimal(amount), timestamp=self.now - age)
+
+    def _checkpoints(self, account):
+        return list(account.checkpoints.order_by('as_of').values_list('as_of', 'balance'))
+
+    def test_runs_stop_at_the_lag_and_only_add_new_activity(self):
+        self.assertEqual(write_checkpoints(), 2)
+        hour_ago = self.now - timedelta(hours=1)
+        self.assertEqual(self._checkpoints(self.alice), [(hour_ago, Decimal('80.00'))])
+        self.assertEqual(self._checkpoints(self.bob), [(hour_ago, Decimal('55.00'))])
+        self.assertEqual(write_checkpoints(), 0)  # Nothing new outside the lag
+        self.assertEqual(write_checkpoints(lag=timedelta(0)), 1)  # Only alice has posted since
+        self.assertEqual(self._checkpoints(self.alice)[-1], (self.now - timedelta(minutes=1), Decimal('81.00')))
+        self.assertEqual(len(self._checkpoints(self.bob)), 1)
+
+    def test_balance_at_before_between_and_after_checkpoints(self):
+        write_checkpoints()
+        write_checkpoints(lag=timedelta(0))
+        alice = Account.objects.get(pk=self.alice.pk)
+        for age, expected in ((timedelta(hours=4), '50.00'), (timedelta(hours=2), '60.00'),
+                              (timedelta(minutes=30), '80.00'), (timedelta(0), '81.00')):
+            with self.subTest(age=age):
+                self.assertEqual(alice.balance_at(self.now - age), Decimal(expected))
+        self.assertEqual(Account.objects.get(pk=self.bob.pk).balance_at(self.now), Decimal('55.00'))
+
+
+class JournalMigrationTests(TransactionTestCase):
+    """Migrating to the journal keeps every balance equal to the opening promo plus its postings."""
+
+    serialized_rollback = True  # Migrations seed counters and rates; later tests need them back
+
+    def test_balances_changed_without_transaction_rows_are_adjusted(self):
+        executor = MigrationExecutor(connection)
+        before = [('bankapp', '0006_bank_counters')]
+        executor.migrate(before)
+        old = executor.loader.project_state(before).apps
+        accounts = []
+        for number, name in enumerate(('rita', 'sam')):
+            user = old.get_model('auth', 'User').objects.create(username=name)
+            accounts.append(old.get_model('bankapp', 'Account').objects.create(
+                user=user, first_name=name, last_name='Old', account_number=f'old{number}', payment_number=f'pay{number}',
+                balance=Decimal('50.00'),
+            ))
+        rita, sam = accounts
+        # Baseline behaviour: deposits only touched the balance; a send wrote a -x/+x pair of rows
+        Transaction = old.get_model('bankapp', 'Transaction')
+        Transaction.objects.create(from_account=rita, to_account=sam, amount=Decimal('-10.00'))
+        Transaction.objects.create(from_account=rita, to_account=sam, amount=Decimal('10.00'))
+        type(rita).objects.filter(pk=rita.pk).update(balance=Decimal('70.00'))  # +30 deposited, -10 sent
+        type(sam).objects.filter(pk=sam.pk).update(balance=Decimal('60.00'))
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+        self.assertEqual(reconciliation.reconcile_ledger(workers=1), (2, []))
+        rita = Account.objects.get(pk=rita.pk)
+        self.assertEqual(rita.balance_at(timezone.now()), Decimal('70.00'))
+        self.assertEqual(list(rita.postings.order_by('pk').values_list('entry__kind', 'amount')),
+                         [('transfer', Decimal('-10.00')), ('adjustment', Decimal('30.00'))])
+
+
+@override_settings(QUEUED_TRANSFERS=True)
+class QueuedTransferTests(BankTestCase):
+    """Queued mode: transfers are stored as commands and applied per partition in batches."""
+
+    def setUp(self):
+        super().setUp()
+        self.sender = User.objects.create_user(username='erin', password='pw').account
+        self.recipient = User.objects.create_user(username='frank', password='pw').account
+        self.headers = {'Authorization': f'Bearer {issue_token(self.sender)}'}
+
+    def _send(self, amount):
+        return self.client.post(
+            reverse('api_transfers'), {'payment_number': self.recipient.payment_number, 'amount': amount},
+            content_type='application/json', headers=self.headers,
+        )
+
+    def test_api_queues_and_worker_applies(self):
+        response = self._send('10.00')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['status'], TransferCommand.PENDING)
+        self.assertEqual(Account.objects.get(pk=self.sender.pk).balance, Decimal('50.00'))
+
+        self.assertEqual(transfer_queue.drain(), 1)
+        status = self.client.get(response.json()['status_url'], headers=self.headers).json()
+        self.assertEqual(status['status'], TransferCommand.APPLIED)
+        self.assertEqual(Account.objects.get(pk=self.sender.pk).balance, Decimal('40.00'))
+        self.assertEqual(Account.objects.get(pk=self.recipient.pk).balance, Decimal('60.00'))
+        self.assertEqual(Posting.objects.filter(entry_id=status['entry']).count(), 2)
+
+    def test_commands_apply_in_order_against_the_floor(self):
+        for amount in ('40.00', '40.00', '10.00'):
+            self._send(amount)
+        transfer_queue.drain()
+        self.assertEqual(
+            list(TransferCommand.objects.order_by('pk').values_list('status', flat=True)),
+            [TransferCommand.APPLIED, TransferCommand.REJECTED, TransferCommand.APPLIED],
+        )
+        self.assertEqual(Account.objects.get(pk=self.sender.pk).balance, Decimal('0.00'))
+
+    def test_bad_recipients_fail_in_the_request(self):
+        response = self.client.post(reverse('api_transfers'), {'payment_number': 'nobody', 'amount': '1'},
+                                    content_type='application/json', headers=self.headers)
+        self.assertEqual(response.status_code, 422)
+        self.assertFalse(TransferCommand.objects.exists())
+
+    def test_status_is_private_to_the_sender(self):
+        command_id = self._send('1.00').json()['id']
+        other = {'Authorization': f'Bearer {issue_token(self.recipient)}'}
+        self.assertEqual(self.client.get(reverse('api_transfer_status', args=[command_id]), headers=other).status_code, 404)
+
+    def test_hot_recipients_are_credited_on_shards_without_folding(self):
+        hot_accounts.enable(self.recipient)
+        ledger.deposit(self.recipient, Decimal('5.00'))  # Already on a shard
+        self._send('10.00')
+        transfer_queue.drain()
+        shards = BalanceShard.objects.filter(account=self.recipient).values_list('balance', flat=True)
+        self.assertEqual((Account.objects.get(pk=self.recipient.pk).balance, sum(shards)), (Decimal('50.00'), Decimal('15.00')))
+
+    def test_money_received_in_a_batch_can_be_spent_in_it(self):
+        self.sender.balance = self.recipient.balance = Decimal('0.00')
+        Account.objects.filter(pk__in=[self.sender.pk, self.recipient.pk]).update(balance=Decimal('0.00'))
+        self._send('5.00')
+        transfer_queue.enqueue_transfer(self.recipient, self.sender.payment_number, Decimal('10.00'))
+        TransferCommand.objects.update(partition=0)
+        transfer_queue.drain(partitions=[0])
+        self.assertEqual(set(TransferCommand.objects.values_list('status', flat=True)), {TransferCommand.APPLIED})
+        self.assertEqual(Account.objects.get(pk=self.recipient.pk).balance, Decimal('-5.00'))
+
+    def test_commands_of_a_sender_suspended_since_are_rejected(self):
+        self._send('10.00')
+        Account.objects.filter(pk=self.sender.pk).update(is_suspended=True)
+        transfer_queue.drain()
+        self.assertEqual(TransferCommand.objects.get().error, ledger.SUSPENDED_MESSAGE)
+        self.assertEqual(self._send('1.00').status_code, 422)
+
+    def test_each_partition_has_one_worker(self):
+        owned = [p for worker in range(3) for p in transfer_queue.worker_partitions(worker, 3)]
+        self.assertEqual(sorted(owned), list(range(transfer_queue.TRANSFER_PARTITIONS)))
+
+
+class BatchPaymentTests(BankTestCase):
+    """Batch payments pay many recipients in one atomic unit, rejecting bad lines one by one."""
+
+    def setUp(self):
+        super().setUp()
+        self.payer = User.objects.create_user(username='payroll', password='pw').account
+
+    def test_a_large_payroll_is_paid_under_the_default_rules(self):
+        seeding.seed_bank(100, 0, prefix='staff', fast_hasher=True)
+        ledger.deposit(self.payer, Decimal('5000.00'))
+        staff = Account.objects.filter(user__username__startswith='staff').values_list('payment_number', flat=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            results = ledger.batch_transfer(self.payer, [(number, '50.00') for number in staff])
+        self.assertEqual({result['status'] for result in results}, {'paid'})
+        self.assertEqual(len(results), 100)
+        self.assertEqual(Account.objects.get(pk=self.payer.pk).balance, Decimal('50.00'))
+
+    def test_bad_lines_are_rejected_one_by_one(self):
+        alice = User.objects.create_user(username='alice', password='pw').account
+        bob = User.objects.create_user(username='bob', password='pw').account
+        results = ledger.batch_transfer(self.payer, [
+            (alice.payment_number, '10.00'), ('nobody', '1.00'), (self.payer.payment_number, '1.00'),
+            (bob.payment_number, 'ten'), (bob.payment_number, '-3'), (bob.payment_number, ' 5.50 '),
+        ])
+        self.assertEqual([result['status'] for result in results],
+                         ['paid', 'rejected', 'rejected', 'rejected', 'rejected', 'paid'])
+        self.assertEqual([result['line'] for result in results], [1, 2, 3, 4, 5, 6])
+        self.assertEqual(results[1]['error'], 'Recipient payment number not found.')
+        self.assertEqual(Account.objects.get(pk=self.payer.pk).balance, Decimal('34.50'))
+        entry, = JournalEntry.objects.all()
+        self.assertEqual(sorted(entry.postings.values_list('account_id', 'amount')), sorted([
+            (self.payer.pk, Decimal('-10.00')), (alice.pk, Decimal('10.00')),
+            (self.payer.pk, Decimal('-5.50')), (bob.pk, Decimal('5.50')),
+        ]))
+
+    def test_a_total_below_the_floor_rejects_the_whole_batch(self):
+        alice = User.objects.create_user(username='alice', password='pw').account
+        results = ledger.batch_transfer(self.payer, [(alice.payment_number, '30.00'), (alice.payment_number, '25.01')])
+        self.assertEqual({result['status'] for result in results}, {'rejected'})
+        self.assertIn('below -$5', results[0]['error'])
+        self.assertEqual(Account.objects.get(pk=self.payer.pk).balance, Decimal('50.00'))
+        self.assertFalse(JournalEntry.objects.exists())
+
+    def test_payment_files_parse_or_explain_why_not(self):
+        csv_file = b'\xef\xbb\xbfpayment_number,amount\nabc123,10.00\n\n def456 , 2 \n'
+        self.assertEqual(batch.parse_payment_file(csv_file, 'pay.csv'), [('abc123', '10.00'), ('def456', '2')])
+        json_file = '[{"payment_number": "abc123", "amount": 1.5}, ["def456", "2"]]'
+        self.assertEqual(batch.parse_payment_file(json_file, 'pay.txt'), [('abc123', 1.5), ('def456', '2')])
+        for data, filename, message in (
+            (b'abc123\n', 'pay.csv', 'Expected "payment_number,amount"'),
+            (b'[1, 2', 'pay.json', 'Invalid JSON'),
+            (b'{"payment_number": "abc123"}', 'pay.json', 'Expected a JSON list'),
+            (b'[42]', 'pay.json', 'Unrecognised payment entry'),
+            (b'payment_number,amount\n', 'pay.csv', 'empty'),
+            (b'\xff\xfe', 'pay.csv', 'UTF-8'),
+            (b'x,1\n' * (batch.MAX_BATCH_LINES + 1), 'pay.csv', 'at most'),
+        ):
+            with self.subTest(filename=filename, message=message), self.assertRaisesMessage(batch.BatchFileError, message):
+                batch.parse_payment_file(data, filename)
+
+    def test_upload_errors_are_shown_on_the_page(self):
+        self.client.login(username='payroll', password='pw')
+        upload = SimpleUploadedFile('pay.json', b'[1, 2')
+        response = self.client.post(reverse('batch_payments'), {'payments': upload})
+        self.assertContains(response, 'Invalid JSON')
+
+
+class HotAccountTests(BankTestCase):
+    """Hot accounts: credits land on shard rows, the balance is row plus shards, debits pull from shards."""
+
+    def setUp(self):
+        super().setUp()
+        self.merchant = User.objects.create_user(username='grace', password='pw').account
+        self.payer = User.objects.create_user(username='heidi', password='pw').account
+        hot_accounts.enable(self.merchant)
+        counters.reconcile(record=False)
+
+    def _shards(self):
+        return sum(BalanceShard.objects.filter(account=self.merchant).values_list('balance', flat=True))
+
+    def test_credits_skip_the_account_row(self):
+        ledger.send_payment(self.payer, self.merchant.payment_number, Decimal('20.00'))
+        ledger.deposit(self.merchant, Decimal('5.00'))
+        merchant = Account.objects.get(pk=self.merchant.pk)
+        self.assertEqual(merchant.balance, Decimal('50.00'))
+        self.assertEqual(self._shards(), Decimal('25.00'))
+        self.assertEqual(hot_accounts.current_balance(merchant), Decimal('75.00'))
+        self.assertEqual([check.drift for check in counters.reconcile()], [0, 0])
+
+    def test_balance_reports_include_shards(self):
+        ledger.send_payment(self.payer, self.merchant.payment_number, Decimal('20.00'))
+        headers = {'Authorization': f'Bearer {issue_token(self.merchant)}'}
+        self.assertEqual(self.client.get(reverse('api_balance'), headers=headers).json()['balance'], '70.00')
+        self.client.login(username='grace', password='pw')
+        self.assertContains(self.client.get(reverse('account')), '70.00')
+
+    def test_debits_pull_from_shards(self):
+        ledger.send_payment(self.payer, self.merchant.payment_number, Decimal('50.00'))
+        ledger.withdraw(self.merchant, Decimal('90.00'))
+        merchant = Account.objects.get(pk=self.merchant.pk)
+        self.assertEqual(merchant.balance, Decimal('-5.00'))
+        self.assertEqual(self._shards(), Decimal('15.00'))
+        with self.assertRaises(ledger.InsufficientFunds):
+            ledger.send_payment(merchant, self.payer.payment_number, Decimal('15.01'))
+        ledger.send_payment(merchant, self.payer.payment_number, Decimal('15.00'))
+        self.assertEqual(hot_accounts.current_balance(Account.objects.get(pk=self.merchant.pk)), Decimal('-5.00'))
+
+    def test_batch_and_queued_payments(self):
+        results = ledger.batch_transfer(self.payer, [(self.merchant.payment_number, '10'), (self.merchant.payment_number, '5')])
+        self.assertEqual([result['status'] for result in results], ['paid', 'paid'])
+        self.assertEqual(self._shards(), Decimal('15.00'))
+        transfer_queue.enqueue_transfer(self.merchant, self.payer.payment_number, Decimal('60.00'))
+        transfer_queue.drain()
+        self.assertEqual(Account.objects.get(pk=self.merchant.pk).balance, Decimal('5.00'))
+        self.assertEqual(self._shards(), 0)
+
+    def test_consolidate_and_disable(self):
+        ledger.send_payment(self.payer, self.merchant.payment_number, Decimal('20.00'))
+        self.assertEqual(hot_accounts.consolidate(), Decimal('20.00'))
+        self.assertEqual(Account.objects.get(pk=self.merchant.pk).balance, Decimal('70.00'))
+        ledger.send_payment(self.payer, self.merchant.payment_number, Decimal('10.00'))
+        hot_accounts.disable(self.merchant)
+        self.assertEqual(Account.objects.get(pk=self.merchant.pk).balance, Decimal('80.00'))
+        self.assertEqual(self._shards(), 0)
+
+    def test_reset_leaves_nothing_on_shards(self):
+        ledger.send_payment(self.payer, self.merchant.payment_number, Decimal('20.00'))
+        reset.reset_bank(batch_size=2)
+        self.assertEqual((Account.objects.get(pk=self.merchant.pk).balance, self._shards()), (Decimal('50.00'), 0))
+        self.assertEqual(reconciliation.reconcile_ledger(workers=1)[1], [])
+        self.assertEqual([check.drift for check in counters.reconcile()], [0, 0])
+
+
+class AdminLogTests(BankTestCase):
+    """Admin log entries commit with the action they describe and are paged and filtered on the dashboard."""
+
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_user(username='ivan', password='pw').account
+        self.admin.is_admin = True
+        self.admin.save(update_fields=['is_admin'])
+        self.customer = User.objects.create_user(username='judy', password='pw').account
+        self.client.login(username='ivan', password='pw')
+
+    def test_entries_roll_back_with_their_block(self):
+        with self.assertRaises(RuntimeError), audit.atomic():
+            audit.record(self.admin, AdminLog.SUSPEND_ACCOUNT, target=self.customer)
+            raise RuntimeError
+        self.assertFalse(AdminLog.objects.exists())
+
+    def test_block_writes_its_entries_in_one_insert(self):
+        with CaptureQueriesContext(connection) as queries, audit.atomic():
+            with audit.atomic():
+                audit.record(self.admin, AdminLog.SUSPEND_ACCOUNT, target=self.customer)
+            audit.record(self.admin, AdminLog.CLOSE_ACCOUNT, target=self.customer)
+        self.assertEqual([query['sql'][:6] for query in queries if 'SAVEPOINT' not in query['sql']], ['INSERT'])
+        self.assertEqual(AdminLog.objects.count(), 2)
+
+    def test_deleted_accounts_keep_readable_entries(self):
+        number = self.customer.account_number
+        self.client.post(reverse('delete_account', args=[self.customer.pk]))
+        log = AdminLog.objects.get()
+        self.assertEqual((log.kind, log.describe()), (AdminLog.DELETE_ACCOUNT, f'Deleted account {number} and user'))
+        response = self.client.get(reverse('admin_dashboard'), {'account': number})
+        self.assertContains(response, f'Deleted account {number}')
+
+    def test_dashboard_pages_and_filters(self):
+        for _ in range(60):
+            audit.record(self.admin, AdminLog.SUSPEND_ACCOUNT, target=self.customer)
+        audit.record(self.admin, AdminLog.EDIT_BALANCE, target=self.customer, amount=Decimal('75.00'))
+        response = self.client.get(reverse('admin_dashboard'))
+        self.assertEqual(len(response.context['admin_logs']), 50)
+        self.assertContains(response, f'Edited balance for account {self.customer.account_number} to $75.00')
+        older = self.client.get(reverse('admin_dashboard'), {'cursor': response.context['next_cursor']})
+        self.assertEqual(len(older.context['admin_logs']), 11)
+        self.assertIsNone(older.context['next_cursor'])
+        filtered = self.client.get(reverse('admin_dashboard'), {'kind': AdminLog.EDIT_BALANCE, 'account': 'judy'})
+        self.assertEqual([log.kind for log in filtered.context['admin_logs']], [AdminLog.EDIT_BALANCE])
+
+
+class IdempotencyTests(BankTestCase):
+    """A repeated key replays the first outcome once; a key reused for another action is refused."""
+
+    def setUp(self):
+        super().setUp()
+        self.account = User.objects.create_user(username='quinn', password='pw').account
+        self.client.login(username='quinn', password='pw')
+
+    def _post(self, **data):
+        return self.client.post(reverse('account'), {'idempotency_key': 'k1', **data})
+
+    def test_retries_replay_and_other_actions_are_refused(self):
+        self._post(action='deposit', amount='10.00')
+        self._post(action='deposit', amount='10.00')
+        response = self._post(action='withdraw', amount='10.00')
+        self.assertIn('already used for a different request', response.context['error'])
+        self.assertEqual(Account.objects.get(pk=self.account.pk).balance, Decimal('60.00'))
+        status, outcome, replayed = idempotency.run_once(self.account, 'k1', 'send', lambda: (200, {}))
+        self.assertEqual((status, replayed), (idempotency.REUSED_KEY_STATUS, False))
+
+    def test_each_form_gets_its_own_key(self):
+        context = self.client.get(reverse('account')).context
+        self.assertNotEqual(context['funds_idempotency_key'], context['send_idempotency_key'])
+
+
+class RateProviderTests(BankTestCase):
+    """Each process keeps its rate table until a rate changes anywhere, and never drops it while reloading."""
+
+    def test_invalidation_reaches_every_process_without_dropping_the_table(self):
+        here, elsewhere = rates.RateProvider(version_interval=60), rates.RateProvider(version_interval=0)
+        self.assertNotIn('JPY', here.currencies())
+        self.assertNotIn('JPY', elsewhere.currencies())
+        ExchangeRate.objects.create(currency='JPY', symbol='¥', rate=Decimal('150'), decimal_places=0)
+        here.invalidate()
+        self.assertIsNotNone(here._currencies)
+        self.assertEqual(here.get('jpy').convert(Decimal('2.00')), Decimal('300'))
+        self.assertIn('JPY', elsewhere.currencies())
+
+    def test_version_lives_in_the_rates_cache(self):
+        rates.RateProvider().invalidate()
+        self.assertIsNotNone(caches[settings.RATES_CACHE_ALIAS].get(rates.VERSION_CACHE_KEY))
+        self.assertIsNone(caches['default'].get(rates.VERSION_CACHE_KEY))
+
+
+class SeedingTests(BankTestCase):
+    """Synthetic data keeps balances consistent and never collides with accounts already stored."""
+
+    def test_reseeding_with_the_same_seed_gets_fresh_numbers(self):
+        for prefix in ('a', 'b'):
+            self.assertEqual(seeding.seed_bank(30, 100, seed=7, prefix=prefix, batch_size=8), (30, 100))
+        numbers = Account.objects.values_list('account_number', 'payment_number')
+        self.assertEqual(len({pair[0] for pair in numbers}), 60)
+        self.assertEqual(len({pair[1] for pair in numbers}), 60)
+        self.assertEqual(reconciliation.reconcile_ledger(workers=1)[1], [])
+
+
+class ArchiveTests(BankTestCase):
+    """Cold postings move to the archive table; balances stay intact and history pages reach into it."""
+
+    def setUp(self):
+        super().setUp()
+        self.account = User.objects.create_user(username='kim', password='pw').account
+        now = timezone.now()
+        lines = [(now - timedelta(days=60, minutes=i), Decimal('1.00')) for i in range(30)]
+        lines += [(now - timedelta(seconds=i), Decimal('2.00')) for i in range(5)]
+        for when, amount in sorted(lines):  # Ids follow time, as in the real ledger
+            entry = JournalEntry.objects.create(kind=JournalEntry.DEPOSIT, created_at=when)
+            Posting.objects.create(entry=entry, account=self.account, amount=amount, timestamp=when)
+        Account.objects.filter(pk=self.account.pk).update(balance=Decimal('90.00'))
+        self.moved = archive.archive_postings(now - timedelta(days=30), batch_size=7)
+
+    def test_cold_postings_move_and_balances_hold(self):
+        self.assertEqual((self.moved, Posting.objects.count(), ArchivedPosting.objects.count()), (30, 5, 30))
+        account = Account.objects.get(pk=self.account.pk)
+        self.assertEqual(account.balance_at(timezone.now()), Decimal('90.00'))
+        self.assertEqual(account.balance_at(timezone.now() - timedelta(days=60, minutes=14, seconds=30)), Decimal('65.00'))
+
+    def test_history_pages_fall_back_to_the_archive(self):
+        self.client.login(username='kim', password='pw')
+        self.assertEqual(len(self.client.get(reverse('account')).context['transactions']), 35)
+        headers = {'Authorization': f'Bearer {issue_token(self.account)}'}
+        first = self.client.get(reverse('api_history'), {'limit': 20}, headers=headers).json()
+        second = self.client.get(reverse('api_history'), {'limit': 20, 'cursor': first['next']}, headers=headers).json()
+        self.assertEqual([row['amount'] for row in first['results']][4:6], ['2.00', '1.00'])
+        self.assertEqual((len(second['results']), second['next']), (15, None))
+
+    def test_recent_pages_skip_the_archive(self):
+        horizon = archive.horizon()
+        with self.assertNumQueries(1):
+            rows, _ = keyset_page(self.account.postings.all(), page_size=3,
+                                  archived=[self.account.archived_postings.all()], horizon=horizon)
+        self.assertEqual(len(rows), 3)
+
+    def test_horizon_follows_rows_archived_elsewhere(self):
+        # Another process archiving leaves nothing in this one to invalidate
+        before = archive.horizon()
+        newest = Posting.objects.order_by('-timestamp').first()
+        ArchivedPosting.objects.create(**{field: getattr(newest, field) for field in archive.POSTING_FIELDS})
+        Posting.objects.filter(pk=newest.pk).delete()
+        self.assertEqual(archive.horizon(), newest.timestamp)
+        self.assertGreater(archive.horizon(), before)
+        self.client.login(username='kim', password='pw')
+        self.assertEqual(len(self.client.get(reverse('account')).context['transactions']), 35)
+
+    def test_statement_streams_a_running_balance_across_both_tables(self):
+        self.client.login(username='kim', password='pw')
+        response = self.client.get(reverse('account_statement'), {'format': 'jsonl'})
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual((len(rows), rows[0]['kind'], rows[0]['balance']), (36, 'opening', '50.00'))
+        self.assertEqual([row['balance'] for row in rows[30:32]], ['80.00', '82.00'])
+        self.assertEqual(rows[-1]['balance'], '90.00')
+
+    async def test_statement_streams_asynchronously_under_asgi(self):
+        client = AsyncClient()
+        await client.alogin(username='kim', password='pw')
+        with mock.patch.object(exports, 'ASYNC_LINES_PER_CHUNK', 10):
+            response = await client.get(reverse('account_statement'), {'format': 'jsonl'})
+            self.assertTrue(response.is_async)
+            chunks = [chunk async for chunk in response.streaming_content]
+        self.assertEqual(len(chunks), 4)
+        rows = [json.loads(line) for line in b''.join(chunks).splitlines()]
+        self.assertEqual((len(rows), rows[-1]['balance']), (36, '90.00'))
+
+    def test_statement_opens_at_the_balance_before_its_first_day(self):
+        self.client.login(username='kim', password='pw')
+        start = (timezone.now() - timedelta(days=30)).date()
+        response = self.client.get(reverse('account_statement'), {'from': start.isoformat(), 'format': 'csv'})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'timestamp,entry,kind,memo,counterparty,amount,balance')
+        self.assertTrue(lines[1].endswith(',opening,,,,80.00'))
+        self.assertEqual((len(lines), lines[-1].rsplit(',', 1)[1]), (7, '90.00'))
+        bad = self.client.get(reverse('account_statement'), {'from': 'last year', 'format': 'csv'})
+        self.assertEqual(bad.status_code, 400)
+
+
+class BackupTests(BankTestCase):
+    """Backups stream every table; restores rebuild them exactly, on top of a base, and all or nothing."""
+
+    def setUp(self):
+        super().setUp()
+        self.ivan = User.objects.create_user(username='ivan', password='pw').account
+        self.judy = User.objects.create_user(username='judy', password='pw').account
+        ledger.send_payment(self.ivan, self.judy.payment_number, Decimal('10.00'))
+        issue_token(self.ivan)
+
+    def _state(self):
+        return {
+            model._meta.label_lower: list(model._base_manager.order_by('pk').values_list(*backup._columns(model)))
+            for model in backup.BACKUP_MODELS
+        }
+
+    def _lose_database(self):
+        # Tables as a fresh migrate leaves them, give or take seeded rows
+        with backup._raw_writes():
+            for model in reversed(backup.BACKUP_MODELS):
+                model._base_manager.all().delete()
+
+    def test_full_backup_round_trip(self):
+        before = self._state()
+        out = io.BytesIO()
+        backup.write_backup(out)
+        self._lose_database()
+        backup.restore_backup(io.BytesIO(out.getvalue()), batch_size=2)
+        # Same rows, same ids and timestamps; no signal created accounts or moved counters
+        self.assertEqual(self._state(), before)
+
+    def test_incremental_backup_restores_on_top_of_its_base(self):
+        full = io.BytesIO()
+        backup.write_backup(full)
+        watermarks = {'entry': JournalEntry.objects.latest('pk').pk, 'admin_log': 0}
+        ledger.deposit(self.judy, Decimal('5.00'))
+        ApiToken.objects.all().delete()
+        after = self._state()
+        counts = {}
+        incremental = io.BytesIO()
+        backup.write_backup(incremental, since=watermarks, progress=counts.__setitem__)
+        self.assertEqual((counts['bankapp.journalentry'], counts['bankapp.posting']), (1, 1))
+
+        self._lose_database()
+        with self.assertRaises(backup.BackupError):
+            backup.restore_backup(io.BytesIO(incremental.getvalue()))
+        backup.restore_backup(io.BytesIO(full.getvalue()))
+        backup.restore_backup(io.BytesIO(incremental.getvalue()))
+        self.assertEqual(self._state(), after)
+
+    def test_damaged_backup_changes_nothing(self):
+        out = io.BytesIO()
+        backup.write_backup(out)
+        text = gzip.decompress(out.getvalue()).decode().replace('"10.00"', '"99.00"', 1)
+        self._lose_database()
+        with self.assertRaisesMessage(backup.BackupError, 'checksum mismatch'):
+            backup.restore_backup(io.BytesIO(gzip.compress(text.encode())))
+        self.assertFalse(User.objects.exists())
+
+
+class LedgerReconciliationTests(BankTestCase):
+    """Stored balances (shards included) are checked range by range against the opening promo plus postings."""
+
+    def setUp(self):
+        super().setUp()
+        self.accounts = [User.objects.create_user(username=f'rec{i}', password='pw').account for i in range(5)]
+        hot_accounts.enable(self.accounts[0])
+        for account in self.accounts[1:]:
+            ledger.send_payment(account, self.accounts[0].payment_number, Decimal('3.00'))
+        ledger.deposit(self.accounts[2], Decimal('7.50'))
+
+    def test_consistent_ledger_has_no_discrepancies(self):
+        self.assertEqual(len(reconciliation.account_ranges(range_size=2)), 3)
+        self.assertEqual(reconciliation.reconcile_ledger(workers=1, range_size=2), (5, []))
+
+    def test_mismatched_balances_are_reported(self):
+        Account.objects.filter(pk=self.accounts[3].pk).update(balance=Decimal('1.00'))
+        # The hot account's $12 of credits sit on random shards; $100 too many now
+        BalanceShard.objects.filter(account=self.accounts[0]).update(balance=0)
+        BalanceShard.objects.filter(account=self.accounts[0], shard=0).update(balance=Decimal('112.00'))
+        checked, found = reconciliation.reconcile_ledger(workers=1, range_size=2)
+        self.assertEqual(checked, 5)
+        self.assertEqual([(row.account_id, row.difference) for row in found], [
+            (self.accounts[0].pk, Decimal('100.00')),
+            (self.accounts[3].pk, Decimal('-46.00')),
+        ])
+
+
+@override_settings(VELOCITY_RULES=[
+    {'NAME': 'bankapp.velocity.BlockedRecipientRule'},
+    {'NAME': 'bankapp.velocity.WindowLimitRule', 'OPTIONS': {'window': 3600, 'max_count': 3, 'max_amount': '25'}},
+    {'NAME': 'bankapp.velocity.NewRecipientRule', 'OPTIONS': {'max_amount': '15'}},
+])
+class VelocityTests(BankTestCase):
+    """Sends are judged by the configured rules against cached sliding windows, with no extra queries."""
+
+    def setUp(self):
+        super().setUp()
+        self.sender = User.objects.create_user(username='mallory', password='pw').account
+        self.payee = User.objects.create_user(username='oscar', password='pw').account
+        self.other = User.objects.create_user(username='peggy', password='pw').account
+
+    def _send(self, amount, payee=None):
+        # Usage is counted on commit, which the test's transaction never reaches
+        with self.captureOnCommitCallbacks(execute=True):
+            return ledger.send_payment(self.sender, (payee or self.payee).payment_number, Decimal(amount))
+
+    def test_window_limits_block_without_queries(self):
+        self._send('5.00')
+        self._send('5.00')
+        with self.assertNumQueries(1), self.assertLogs('bankapp.velocity', 'WARNING') as log:
+            with self.assertRaisesMessage(ledger.TransferBlocked, '$25 per hour'):
+                self._send('20.00')
+        self.assertIn('rule=WindowLimitRule', log.output[0])
+        self._send('5.00')
+        with self.assertRaisesMessage(ledger.TransferBlocked, '3 transfers per hour'):
+            self._send('1.00')
+        self.assertEqual(Account.objects.get(pk=self.sender.pk).balance, Decimal('35.00'))
+
+    def test_new_and_blocked_recipients(self):
+        with self.assertRaisesMessage(ledger.TransferBlocked, 'new recipient'):
+            self._send('20.00')
+        self._send('10.00')
+        self._send('12.00')  # Known now
+        Account.objects.filter(pk=self.other.pk).update(is_suspended=True)
+        with self.assertRaisesMessage(ledger.TransferBlocked, 'suspended or closed'):
+            self._send('1.00', payee=self.other)
+
+    def test_batch_lines_count_against_the_window(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            results = ledger.batch_transfer(self.sender, [(self.payee.payment_number, '10.00')] * 3)
+        self.assertEqual([result['status'] for result in results], ['paid', 'paid', 'rejected'])
+        with self.assertRaises(ledger.TransferBlocked):
+            self._send('10.00')
+
+    def test_rolled_back_sends_are_not_counted_or_logged(self):
+        with self.assertNoLogs('bankapp.velocity', 'INFO'):
+            for _ in range(3):
+                with transaction.atomic():
+                    ledger.send_payment(self.sender, self.payee.payment_number, Decimal('5.00'))
+                    transaction.set_rollback(True)
+        with self.assertLogs('bankapp.velocity', 'INFO') as log:
+            self._send('5.00')
+        self.assertIn('Transfer allowed', log.output[0])
+
+    @override_settings(VELOCITY_CACHE_ALIAS='missing')
+    def test_process_counters_take_over_when_the_cache_fails(self):
+        with self.assertLogs('bankapp.velocity', 'WARNING'):
+            self._send('10.00')
+            self._send('10.00')
+            with self.assertRaises(ledger.TransferBlocked):
+                self._send('10.00')
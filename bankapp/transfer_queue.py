@@ -0,0 +1,225 @@
+import logging
+import multiprocessing
+import signal
+import time
+from decimal import Decimal
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+from .models import Account, JournalEntry, Posting, TransferCommand
+from . import hot_accounts, velocity
+from .ledger import (
+    BATCH_WRITE_SIZE, OVERDRAFT_FLOOR, SUSPENDED_MESSAGE, AccountSuspended, InvalidRecipient, _check_amount, screen,
+)
+
+logger = logging.getLogger(__name__)
+
+TRANSFER_PARTITIONS = 16  # Changing this only affects newly queued commands
+QUEUE_BATCH_SIZE = 500  # Commands applied per partition per transaction
+IDLE_SLEEP = 0.2  # Seconds a worker waits after finding all of its partitions empty
+
+
+def queued_transfers_enabled():
+    return getattr(settings, 'QUEUED_TRANSFERS', False)
+
+
+def partition_for(account_id, partitions=TRANSFER_PARTITIONS):
+    return account_id % partitions
+
+
+def enqueue_transfer(sender, payment_number, amount):
+    """Validate and persist a transfer for the queue worker; returns the pending TransferCommand.
+
+    Amount, recipient and velocity rules are checked now, so obvious mistakes
+    fail in the request. The balance is checked when the command is applied.
+    """
+    _check_amount(amount)
+    if sender.is_suspended or sender.is_closed:
+        raise AccountSuspended(SUSPENDED_MESSAGE)
+    recipient = Account.objects.filter(payment_number=payment_number).values_list('pk', 'is_suspended', 'is_closed').first()
+    if recipient is None:
+        raise InvalidRecipient('Recipient payment number not found.')
+    payee = velocity.Payee(*recipient)
+    decision = screen(sender, payee, amount)
+    command = TransferCommand.objects.create(
+        sender=sender, recipient_id=payee.pk, payment_number=payment_number,
+        amount=amount, partition=partition_for(sender.pk),
+    )
+    # Counted when queued: a command later rejected for funds still used up its slot
+    velocity.record(sender.pk, [(payee, amount)], [decision])
+    return command
+
+
+def _reject(command, error):
+    command.status = TransferCommand.REJECTED
+    command.error = error
+
+
+class RecipientGone(Exception):
+    """A recipient vanished between being read and being credited; the batch is rolled back and retried."""
+
+
+def _credit_unlocked(credits, hot):
+    # Recipients outside the batch's senders are credited without locking or reading their rows:
+    # one UPDATE balance = balance + CASE ... for ordinary accounts, a shard each for hot ones
+    plain = {pk: amount for pk, amount in credits.items() if pk not in hot}
+    if plain:
+        added = Case(*(When(pk=pk, then=Value(amount)) for pk, amount in plain.items()),
+                     output_field=Account._meta.get_field('balance'))
+        if Account.objects.filter(pk__in=plain).update(balance=F('balance') + added) != len(plain):
+            raise RecipientGone('A recipient was deleted while the batch was applied.')
+    for pk in sorted(hot):
+        if not hot_accounts.credit(pk, credits[pk]):
+            raise RecipientGone('A recipient was deleted while the batch was applied.')
+
+
+def apply_partition(partition, batch_size=QUEUE_BATCH_SIZE):
+    """Apply the oldest pending commands of one partition in a single transaction.
+
+    Only the batch's senders are locked; they all belong to this partition, so
+    no other worker waits on them. Commands are applied in queue order against
+    the senders' in-memory balances, each one checked against the overdraft
+    floor, and a failed check rejects only that command. Recipients are not
+    locked: they are credited at the end with one relative UPDATE (hot ones on
+    a shard), so a popular recipient doesn't serialize the partitions.
+    Balances, journal entries, postings and command statuses are each written
+    with bulk statements. Returns the number of commands processed.
+    """
+    with transaction.atomic():
+        # skip_locked: if a second pool is started by mistake, it skips this batch instead of applying it twice
+        commands = list(
+            TransferCommand.objects.select_for_update(skip_locked=True)
+            .filter(partition=partition, status=TransferCommand.PENDING)
+            .order_by('pk')[:batch_size]
+        )
+        if not commands:
+            return 0
+        balances, hot_senders, frozen = {}, [], set()
+        for pk, balance, is_hot, is_suspended, is_closed in (
+            Account.objects.select_for_update().filter(pk__in={command.sender_id for command in commands})
+            .order_by('pk').values_list('pk', 'balance', 'is_hot', 'is_suspended', 'is_closed')
+        ):
+            balances[pk] = balance
+            if is_hot:
+                hot_senders.append(pk)
+            if is_suspended or is_closed:
+                frozen.add(pk)
+        # Hot senders' shards are folded into their locked rows so they can spend them; shards
+        # being credited right now are left for later rather than waited for
+        folded = hot_accounts.fold(hot_senders, skip_locked=True) if hot_senders else {}
+        for pk, amount in folded.items():
+            balances[pk] += amount
+        recipients = dict(
+            Account.objects.filter(pk__in={command.recipient_id for command in commands if command.recipient_id})
+            .exclude(pk__in=balances).values_list('pk', 'is_hot')
+        )
+
+        applied = []
+        credits = {}
+        for command in commands:
+            if command.sender_id in frozen:
+                _reject(command, SUSPENDED_MESSAGE)
+            elif command.recipient_id not in balances and command.recipient_id not in recipients:
+                _reject(command, 'Recipient payment number not found.')
+            elif balances[command.sender_id] - command.amount < OVERDRAFT_FLOOR:
+                _reject(command, 'Insufficient funds: balance cannot drop below -$5.')
+            else:
+                balances[command.sender_id] -= command.amount
+                if command.recipient_id in balances:
+                    # Also a sender in this batch: its later commands may spend the money
+                    balances[command.recipient_id] += command.amount
+                else:
+                    credits[command.recipient_id] = credits.get(command.recipient_id, Decimal('0')) + command.amount
+                applied.append(command)
+
+        changed = set(folded)
+        changed.update(command.sender_id for command in applied)
+        changed.update(command.recipient_id for command in applied if command.recipient_id in balances)
+        if changed:
+            # Sender rows are locked, so absolute balances are safe to write with one CASE-based update
+            Account.objects.bulk_update(
+                [Account(pk=pk, balance=balances[pk]) for pk in changed], ['balance'], batch_size=BATCH_WRITE_SIZE,
+            )
+        if applied:
+            now = timezone.now()
+            entries = JournalEntry.objects.bulk_create(
+                [JournalEntry(kind=JournalEntry.TRANSFER, memo=f'Queued transfer #{command.pk}', created_at=now)
+                 for command in applied],
+                batch_size=BATCH_WRITE_SIZE,
+            )
+            postings = []
+            for command, entry in zip(applied, entries):
+                postings.append(Posting(entry=entry, account_id=command.sender_id, counterparty_id=command.recipient_id,
+                                        amount=-command.amount, timestamp=now))
+                postings.append(Posting(entry=entry, account_id=command.recipient_id, counterparty_id=command.sender_id,
+                                        amount=command.amount, timestamp=now))
+                command.entry = entry
+                command.status = TransferCommand.APPLIED
+                command.applied_at = now
+            Posting.objects.bulk_create(postings, batch_size=BATCH_WRITE_SIZE)
+        TransferCommand.objects.bulk_update(commands, ['status', 'error', 'entry', 'applied_at'], batch_size=BATCH_WRITE_SIZE)
+        # Last, so the recipients' row (or shard) locks are held only until the commit right after
+        _credit_unlocked(credits, {pk for pk in credits if recipients[pk]})
+    return len(commands)
+
+
+def drain(partitions=None, batch_size=QUEUE_BATCH_SIZE):
+    """Apply every pending command in ``partitions`` (default: all) until they are empty; returns the count."""
+    partitions = range(TRANSFER_PARTITIONS) if partitions is None else partitions
+    total = 0
+    while True:
+        done = sum(apply_partition(partition, batch_size) for partition in partitions)
+        if not done:
+            return total
+        total += done
+
+
+def worker_partitions(worker, workers, partitions=TRANSFER_PARTITIONS):
+    # Each partition belongs to exactly one worker, so no two workers ever apply the same sender's transfers
+    return [partition for partition in range(partitions) if partition % workers == worker]
+
+
+def run_worker(partitions, batch_size=QUEUE_BATCH_SIZE, idle_sleep=IDLE_SLEEP, stop=None):
+    """Keep applying the given partitions until ``stop`` (an Event) is set."""
+    while not (stop and stop.is_set()):
+        try:
+            done = sum(apply_partition(partition, batch_size) for partition in partitions)
+        except Exception:
+            logger.exception('Transfer worker for partitions %s failed; retrying', partitions)
+            connections.close_all()
+            done = 0
+        if not done:
+            time.sleep(idle_sleep)
+
+
+def _pool_worker(partitions, batch_size, idle_sleep, stop):
+    # Ctrl-C reaches the whole process group; only the pool owner handles it, then sets ``stop``
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    run_worker(partitions, batch_size, idle_sleep, stop)
+
+
+def run_pool(workers, batch_size=QUEUE_BATCH_SIZE, idle_sleep=IDLE_SLEEP):
+    """Start one worker process per slice of partitions and wait for them; Ctrl-C stops them all."""
+    # Forked children must not share the parent's database connections
+    connections.close_all()
+    context = multiprocessing.get_context('fork')
+    stop = context.Event()
+    processes = [
+        context.Process(target=_pool_worker, args=(worker_partitions(worker, workers), batch_size, idle_sleep, stop),
+                        name=f'transfer-worker-{worker}')
+        for worker in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # Workers finish their current batch, then exit; further Ctrl-Cs must not orphan them
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        stop.set()
+        for process in processes:
+            process.join()
@@ -1,11 +1,13 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 urlpatterns = [
     path('', views.home, name='home'),
     path('login/', views.login_view, name='login'),  # Correct login URL
     path('logout/', views.logout_view, name='logout'),
     path('account/', views.account, name='account'),
+    path('account/batch/', views.batch_payments, name='batch_payments'),
+    path('account/statement/', views.account_statement, name='account_statement'),
     path('register/', views.register, name='register'),
     path('dashboard/', views.admin_dashboard, name='admin_dashboard'),
     path('create/', views.create_admin, name='create_admin'),
@@ -20,4 +22,11 @@ urlpatterns = [
     path('manage/account/<int:account_id>/close/', views.close_account, name='close_account'),
     path('manage/account/<int:account_id>/suspend/', views.suspend_account, name='suspend_account'),
     path('manage/account/<int:account_id>/delete/', views.delete_account, name='delete_account'),
+    path('metrics', views.metrics_view, name='metrics'),  # Prometheus scrape target
+    # JSON API for machine clients (bearer-token auth, no templates)
+    path('api/v1/balance/', api.balance, name='api_balance'),
+    path('api/v1/history/', api.history, name='api_history'),
+    path('api/v1/transfers/', api.transfers, name='api_transfers'),
+    path('api/v1/transfers/<int:command_id>/', api.transfer_status, name='api_transfer_status'),
+    path('api/v1/admin/accounts/', api.admin_accounts, name='api_admin_accounts'),
 ]
@@ -0,0 +1,294 @@
+import logging
+import time
+from decimal import Decimal
+from functools import lru_cache
+from typing import NamedTuple
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.utils.module_loading import import_string
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+WINDOW_SLOTS = 12  # Slots per window; a window's total covers between 11/12 of it and all of it
+KNOWN_PAYEE_TTL = 90 * 24 * 3600  # Seconds a recipient stays known after the last payment to it
+LOCAL_MAX_ENTRIES = 100000  # Keys kept by the in-process fallback
+CENTS = Decimal('0.01')
+
+# Counters kept per sender, each over any number of windows
+SENT = 'sent'  # Every transfer
+NEW_PAYEE = 'new_payee'  # Transfers to a recipient the sender hasn't paid recently
+
+
+class Payee(NamedTuple):
+    pk: int
+    is_suspended: bool = False
+    is_closed: bool = False
+
+
+class Decision(NamedTuple):
+    allowed: bool
+    rule: str = ''       # Class name of the rule that refused the transfer
+    reason: str = ''     # Shown to the sender
+    new_payee: bool = False
+
+
+class Attempt:
+    """One transfer as the rules see it: who pays whom, how much, and the sender's recent usage."""
+
+    def __init__(self, sender_id, payee, amount, usage, new_payee):
+        self.sender_id = sender_id
+        self.payee = payee
+        self.amount = amount
+        self.new_payee = new_payee
+        self._usage = usage
+
+    def used(self, counter, window):
+        """Return (transfers, dollars) counted by ``counter`` over the last ``window`` seconds."""
+        count, cents = self._usage.get((counter, window), (0, 0))
+        return count, cents * CENTS
+
+
+def _per(window):
+    return {3600: 'hour', 86400: 'day'}.get(window, f'{window} seconds')
+
+
+class Rule:
+    """A velocity rule: check() returns the reason for refusing an Attempt, or None to let it through."""
+
+    counters = ()  # (counter, window seconds) pairs the rule reads
+
+    @property
+    def name(self):
+        return type(self).__name__
+
+    def check(self, attempt):
+        raise NotImplementedError
+
+
+class BlockedRecipientRule(Rule):
+    """No payments to suspended or closed accounts."""
+
+    def check(self, attempt):
+        if attempt.payee.is_suspended or attempt.payee.is_closed:
+            return 'The recipient account is suspended or closed.'
+        return None
+
+
+class WindowLimitRule(Rule):
+    """At most ``max_count`` transfers and ``max_amount`` dollars sent per ``window`` seconds."""
+
+    def __init__(self, window, max_count=None, max_amount=None):
+        self.window = window
+        self.max_count = max_count
+        self.max_amount = None if max_amount is None else Decimal(str(max_amount))
+        self.counters = ((SENT, window),)
+
+    def check(self, attempt):
+        count, amount = attempt.used(SENT, self.window)
+        if self.max_count is not None and count >= self.max_count:
+            return f'Limit of {self.max_count} transfers per {_per(self.window)} reached.'
+        if self.max_amount is not None and amount + attempt.amount > self.max_amount:
+            return f'Transfers are limited to ${self.max_amount} per {_per(self.window)}.'
+        return None
+
+
+class NewRecipientRule(Rule):
+    """Payments to recipients the sender hasn't paid recently: at most ``max_amount`` each, ``max_new`` per ``window``."""
+
+    def __init__(self, max_amount=None, max_new=None, window=86400):
+        self.max_amount = None if max_amount is None else Decimal(str(max_amount))
+        self.max_new = max_new
+        self.window = window
+        self.counters = ((NEW_PAYEE, window),)
+
+    def check(self, attempt):
+        if not attempt.new_payee:
+            return None
+        if self.max_amount is not None and attempt.amount > self.max_amount:
+            return f'Payments to a new recipient are limited to ${self.max_amount}.'
+        count, _ = attempt.used(NEW_PAYEE, self.window)
+        if self.max_new is not None and count >= self.max_new:
+            return f'Limit of {self.max_new} new recipients per {_per(self.window)} reached.'
+        return None
+
+
+def _bump(cache, key, delta, timeout):
+    if not cache.add(key, delta, timeout):
+        try:
+            cache.incr(key, delta)
+        except ValueError:
+            cache.set(key, delta, timeout)  # Expired between add() and incr()
+
+
+class WindowStore:
+    """Per-sender sliding-window counters in the shared cache, with an in-process fallback.
+
+    A window of W seconds is WINDOW_SLOTS slots of W / WINDOW_SLOTS seconds,
+    each a (count, cents) pair of integer keys that expire once they slide
+    out. Everything one send needs, including whether the recipient is known,
+    is read with a single get_many. If the shared cache fails, this process's
+    own copy takes over, so limits still apply per process rather than not at
+    all. Known payees are only as durable as the cache: NewRecipientRule
+    needs VELOCITY_CACHE_ALIAS to be shared and to survive restarts.
+    """
+
+    def __init__(self):
+        self.local = LocMemCache('bankapp-velocity', {'OPTIONS': {'MAX_ENTRIES': LOCAL_MAX_ENTRIES}})
+
+    def _run(self, operation):
+        try:
+            return operation(caches[getattr(settings, 'VELOCITY_CACHE_ALIAS', 'default')])
+        except Exception:
+            logger.warning('Velocity cache unavailable; using in-process counters', exc_info=True)
+            return operation(self.local)
+
+    @staticmethod
+    def _slot(window, now):
+        size = max(window // WINDOW_SLOTS, 1)
+        return int(now // size), size
+
+    @staticmethod
+    def _key(sender_id, counter, window, slot, part):
+        return f'bankapp:velocity:{sender_id}:{counter}:{window}:{slot}:{part}'
+
+    @staticmethod
+    def _payee_key(sender_id, payee_id):
+        return f'bankapp:velocity:{sender_id}:payee:{payee_id}'
+
+    def read(self, sender_id, counters, payee_ids):
+        """Return ({(counter, window): [count, cents]}, {known payee id, ...}) for ``sender_id``."""
+        now = time.time()
+        keys = {}
+        for counter, window in counters:
+            current, _ = self._slot(window, now)
+            for slot in range(current - WINDOW_SLOTS + 1, current + 1):
+                keys[self._key(sender_id, counter, window, slot, 'n')] = (counter, window, 0)
+                keys[self._key(sender_id, counter, window, slot, 'c')] = (counter, window, 1)
+        payee_keys = {self._payee_key(sender_id, pk): pk for pk in payee_ids}
+        values = self._run(lambda cache: cache.get_many([*keys, *payee_keys]))
+        usage = {counter: [0, 0] for counter in counters}
+        known = set()
+        for key, value in values.items():
+            if key in keys:
+                counter, window, part = keys[key]
+                usage[(counter, window)][part] += value
+            else:
+                known.add(payee_keys[key])
+        return usage, known
+
+    def clear(self):
+        """Forget every counter and known payee (tests; the alias should hold nothing else)."""
+        self._run(lambda cache: cache.clear())
+        self.local.clear()
+
+    def add(self, sender_id, totals, payee_ids):
+        """Add {(counter, window): (count, cents)} to the current slots and mark ``payee_ids`` as known."""
+        now = time.time()
+
+        def write(cache):
+            for (counter, window), (count, cents) in totals.items():
+                slot, size = self._slot(window, now)
+                if count:
+                    _bump(cache, self._key(sender_id, counter, window, slot, 'n'), count, window + size)
+                if cents:
+                    _bump(cache, self._key(sender_id, counter, window, slot, 'c'), cents, window + size)
+            cache.set_many({self._payee_key(sender_id, pk): 1 for pk in payee_ids}, KNOWN_PAYEE_TTL)
+
+        self._run(write)
+
+
+windows = WindowStore()
+
+
+@lru_cache(maxsize=None)
+def get_rules():
+    """Build the rules listed in settings.VELOCITY_RULES once per process ({'NAME': path, 'OPTIONS': kwargs})."""
+    return tuple(
+        import_string(rule['NAME'])(**rule.get('OPTIONS', {})) for rule in getattr(settings, 'VELOCITY_RULES', [])
+    )
+
+
+def _counts(counter, decision):
+    return counter == SENT or (counter == NEW_PAYEE and decision.new_payee)
+
+
+def _log(sender_id, payee, amount, decision):
+    outcome = 'allowed' if decision.allowed else 'blocked'
+    metrics.registry.inc(metrics.VELOCITY_DECISIONS, (decision.rule or 'none', outcome))
+    logger.log(
+        logging.INFO if decision.allowed else logging.WARNING,
+        'Transfer %s: sender=%s recipient=%s amount=%s new_payee=%s rule=%s reason=%s',
+        outcome, sender_id, payee.pk, amount, decision.new_payee, decision.rule or '-', decision.reason or '-',
+    )
+
+
+def evaluate(sender_id, lines):
+    """Judge transfers from ``sender_id``; ``lines`` are (Payee, amount) pairs. Returns one Decision per line.
+
+    Lines are judged in order, each as if the allowed lines before it had
+    already been sent, so a batch can't split its way past a limit. Costs one
+    cache read however many rules and lines there are, and no queries. Refusals
+    are logged here; allowed transfers are logged by record() once they have
+    committed. Checks and counts are not atomic, so concurrent sends can
+    overshoot a limit by a transfer or two.
+    """
+    rules = get_rules()
+    if not rules:
+        return [Decision(True) for _ in lines]
+    counters = {counter for rule in rules for counter in rule.counters}
+    usage, known = windows.read(sender_id, counters, {payee.pk for payee, _ in lines})
+    decisions = []
+    for payee, amount in lines:
+        attempt = Attempt(sender_id, payee, amount, usage, payee.pk not in known)
+        decision = Decision(True, new_payee=attempt.new_payee)
+        for rule in rules:
+            reason = rule.check(attempt)
+            if reason:
+                decision = Decision(False, rule.name, reason, attempt.new_payee)
+                break
+        if decision.allowed:
+            cents = int(amount / CENTS)
+            for counter in counters:
+                if _counts(counter[0], decision):
+                    usage[counter][0] += 1
+                    usage[counter][1] += cents
+            known.add(payee.pk)
+        else:
+            _log(sender_id, payee, amount, decision)
+        decisions.append(decision)
+    return decisions
+
+
+def record(sender_id, lines, decisions):
+    """Count the allowed ``lines`` (as passed to evaluate()) once they have actually been paid.
+
+    The counters live outside the database, so they are only written, and the
+    transfers logged as allowed, when the surrounding transaction commits: a
+    rolled-back send leaves no usage and no log line behind.
+    """
+    rules = get_rules()
+    if not rules:
+        return
+    counters = {counter for rule in rules for counter in rule.counters}
+    totals = {}
+    paid = []
+    for (payee, amount), decision in zip(lines, decisions):
+        if not decision.allowed:
+            continue
+        paid.append((payee, amount, decision))
+        for counter in counters:
+            if _counts(counter[0], decision):
+                count, cents = totals.get(counter, (0, 0))
+                totals[counter] = (count + 1, cents + int(amount / CENTS))
+    if not paid:
+        return
+
+    def committed():
+        windows.add(sender_id, totals, {payee.pk for payee, _, _ in paid})
+        for payee, amount, decision in paid:
+            _log(sender_id, payee, amount, decision)
+
+    transaction.on_commit(committed)
@@ -1,5 +1,7 @@
+from asgiref.sync import sync_to_async
 from django.db import models  # Add this import for models.Sum
-from django.shortcuts import render, redirect
+from django.http import HttpResponse
+from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.forms import UserCreationForm, PasswordResetForm, SetPasswordForm  # Updated imports
@@ -9,14 +11,24 @@ from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.utils.encoding import force_bytes, force_str
 from django.core.mail import send_mail  # For sending reset emails (optional for local testing)
 from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
 from django import forms  # Add this line for forms.EmailField
-from .models import Account, Transaction, AdminLog  # Ensure this is here
-from decimal import Decimal  # For precise decimal arithmetic
+from .models import OPENING_BALANCE, Account, ArchivedPosting, Posting, AdminLog  # Ensure this is here
+from . import archive, audit, counters, hot_accounts, idempotency, ledger, metrics, rates, reset, transfer_queue
+from .exports import EXPORT_CHUNK_SIZE, EXPORT_FORMATS, streaming_export
+from .access import admin_required
+from .batch import BatchFileError, parse_payment_file
+from .forms import AdminLogFilterForm, LedgerFilterForm, StatementForm
+from .pagination import akeyset_page, keyset_page
+from decimal import Decimal, DecimalException  # For precise decimal arithmetic
+from datetime import datetime, time, timedelta
+import heapq
 import uuid  # For generating unique IDs
 
 # Home view with total non-admin accounts
 def home(request):
-    total_accounts = Account.objects.filter(is_admin=False).count()
+    total_accounts = int(counters.read(counters.CUSTOMER_ACCOUNTS))  # Precomputed, no table scan
     return render(request, 'home.html', {'total_accounts': total_accounts})
     
 # Login view
@@ -35,84 +47,154 @@ def logout_view(request):
     logout(request)
     return redirect('home')
 
-# Account view (protected by login)
+# Apply one deposit/withdraw/send form submission; returns (status, outcome) for idempotent replay
+def _apply_account_action(acct, data):
+    action = data.get('action')
+    payment_number = data.get('payment_number')  # For sending money
+    try:
+        amount = Decimal(data.get('amount', '0')) if 'amount' in data else None  # For deposit/withdraw
+        send_amount = Decimal(data.get('send_amount', '0')) if 'send_amount' in data else None  # For sending money
+        if action == 'deposit':
+            ledger.deposit(acct, amount)
+        elif action == 'withdraw':
+            ledger.withdraw(acct, amount)
+        elif action == 'send' and payment_number and send_amount:
+            if transfer_queue.queued_transfers_enabled():
+                # Queued mode: the partition's worker applies it; the page links to its status
+                command = transfer_queue.enqueue_transfer(acct, payment_number, send_amount)
+                return 202, {'error': None, 'queued': command.pk}
+            # Locks, balance checks and ledger rows all happen in one atomic transfer
+            ledger.send_payment(acct, payment_number, send_amount)
+    except DecimalException:
+        return 400, {'error': 'Invalid amount. Please enter a valid number.'}
+    except ledger.LedgerError as e:
+        return 422, {'error': str(e)}
+    return 200, {'error': None}
+
+# Account view (protected by login); async, so slow clients don't hold a worker thread
 @login_required
-def account(request):
+async def account(request):
+    user = await request.auser()
     try:
-        acct = request.user.account
-    except (Account.DoesNotExist, AttributeError):
-        acct = Account.objects.create(
-            user=request.user,
-            first_name=request.user.first_name or 'Default',
-            last_name=request.user.last_name or 'User',
+        acct = await Account.objects.aget(user=user)
+    except Account.DoesNotExist:
+        acct = await Account.objects.acreate(
+            user=user,
+            first_name=user.first_name or 'Default',
+            last_name=user.last_name or 'User',
             account_number=str(uuid.uuid4())[:10],
             payment_number=str(uuid.uuid4())[:10],
             balance=Decimal('50.00')  # Use Decimal for consistency
         )
-    transactions = acct.sent_transactions.all() | acct.received_transactions.all()
 
+    error = None
+    queued_transfer = None
     if request.method == 'POST':
-        action = request.POST.get('action')
-        amount = Decimal(request.POST.get('amount', '0')) if 'amount' in request.POST else None  # For deposit/withdraw
-        payment_number = request.POST.get('payment_number')  # For sending money
-        send_amount = Decimal(request.POST.get('send_amount', '0')) if 'send_amount' in request.POST else None  # For sending money
+        # A retried or double-clicked submission carries the same key and gets the first outcome back
+        key = request.POST.get('idempotency_key', '')
+        # Locking and transactions have no async ORM equivalent, so only this section runs in a thread
+        status, outcome, replayed = await sync_to_async(idempotency.run_once)(
+            acct, key if len(key) <= idempotency.MAX_KEY_LENGTH else '',
+            request.POST.get('action', ''), lambda: _apply_account_action(acct, request.POST),
+        )
+        error = outcome['error']
+        queued_transfer = outcome.get('queued')
 
-        if action == 'deposit':
-            acct.balance += amount
-        elif action == 'withdraw' and acct.balance - amount >= Decimal('-5'):  # Use Decimal for -5
-            acct.balance -= amount
-        elif action == 'send' and payment_number and send_amount:
-            try:
-                recipient = Account.objects.get(payment_number=payment_number)
-                if recipient != acct and acct.balance - send_amount >= Decimal('-5'):  # Ensure not sending to self and balance check
-                    acct.balance -= send_amount  # Deduct from sender
-                    recipient.balance += send_amount  # Add to recipient
-                    acct.save()
-                    recipient.save()
-                    # Log the transaction (negative for sender, positive for recipient)
-                    Transaction.objects.create(from_account=acct, to_account=recipient, amount=-send_amount)
-                    Transaction.objects.create(from_account=acct, to_account=recipient, amount=send_amount)
-            except Account.DoesNotExist:
-                # Handle case where payment number doesn’t exist (e.g., show an error message)
-                return render(request, 'account.html', {
-                    'account': acct,
-                    'transactions': transactions,
-                    'balance': acct.balance,
-                    'currency_symbol': '$',
-                    'currency_label': 'USD',
-                    'error': 'Recipient payment number not found.'
-                })
+    # One bounded page of this account's postings, read straight off its (account, timestamp) index
+    cursor = request.GET.get('cursor')
+    transactions, next_cursor = await akeyset_page(
+        acct.postings.select_related('entry', 'counterparty'),
+        cursor=cursor,
+        # Older history moved to the archive table is only read once a page reaches back to it
+        archived=[acct.archived_postings.select_related('entry', 'counterparty')],
+        horizon=await archive.ahorizon(),
+    )
 
-        acct.save()
-        # Log transaction for deposit/withdraw if applicable
-        if action in ['deposit', 'withdraw']:
-            Transaction.objects.create(from_account=acct, to_account=acct, amount=amount if action == 'deposit' else -amount)
-
-    # Currency conversion (simplified rates for demonstration, as of Feb 2025)
-    currency = request.GET.get('currency', 'USD')
-    balance = acct.balance
-    if currency == 'GBP':
-        converted_balance = balance * Decimal('0.79')  # Approx. USD to GBP
-        currency_symbol = '£'
-        currency_label = 'GBP'
-    elif currency == 'EUR':
-        converted_balance = balance * Decimal('0.92')  # Approx. USD to EUR
-        currency_symbol = '€'
-        currency_label = 'EUR'
-    else:  # Default to USD
-        converted_balance = balance
-        currency_symbol = '$'
-        currency_label = 'USD'
+    # Currency conversion from the cached rate table: one pass over the balance and the page
+    currency = await rates.provider.aget(request.GET.get('currency', 'USD'))
+    for row in transactions:
+        row.display_amount = currency.convert(row.amount)
 
     return render(request, 'account.html', {
         'account': acct,
         'transactions': transactions,
-        'balance': converted_balance,
-        'currency_symbol': currency_symbol,
-        'currency_label': currency_label,
-        'error': 'Recipient payment number not found.' if 'error' in locals() else None
+        'next_cursor': next_cursor,
+        'is_first_page': not cursor,
+        # Fresh keys per rendered form, so each form's retries replay its own outcome
+        'funds_idempotency_key': uuid.uuid4().hex,
+        'send_idempotency_key': uuid.uuid4().hex,
+        'balance': currency.convert(await hot_accounts.acurrent_balance(acct)),
+        'currencies': await rates.provider.acurrencies(),
+        'currency_symbol': currency.symbol,
+        'currency_label': currency.code,
+        'error': error,
+        'queued_transfer': queued_transfer,
     })
 
+# Batch payments view: pay every line of an uploaded CSV/JSON file in one atomic batch
+@login_required
+def batch_payments(request):
+    acct = request.user.account
+    if request.method == 'POST':
+        upload = request.FILES.get('payments')
+        if upload is None:
+            return render(request, 'batch_payments.html', {'error': 'Choose a payment file to upload.'})
+        try:
+            lines = parse_payment_file(upload.read(), upload.name)
+        except BatchFileError as e:
+            return render(request, 'batch_payments.html', {'error': str(e)})
+        results = ledger.batch_transfer(acct, lines)
+        paid = [result for result in results if result['status'] == 'paid']
+        return render(request, 'batch_payments.html', {
+            'results': results,
+            'paid_count': len(paid),
+            'paid_total': sum((result['amount'] for result in paid), Decimal('0')),
+            'balance': hot_accounts.current_balance(acct),
+        })
+    return render(request, 'batch_payments.html')
+
+# Columns of a customer statement, in output order
+STATEMENT_FIELDS = ('timestamp', 'entry', 'kind', 'memo', 'counterparty', 'amount', 'balance')
+
+def _statement_rows(postings):
+    return postings.order_by('timestamp', 'pk').values_list(
+        'timestamp', 'pk', 'entry_id', 'entry__kind', 'entry__memo', 'counterparty__account_number', 'amount',
+    ).iterator(chunk_size=EXPORT_CHUNK_SIZE)  # Server-side cursor, constant memory
+
+def _running_balance(start, opening, rows):
+    # The opening line first, then one line per posting with the balance after it
+    yield start or '', '', 'opening', '', '', '', opening
+    balance = opening
+    for timestamp, _pk, entry, kind, memo, counterparty, amount in rows:
+        balance += amount
+        yield timestamp, entry, kind, memo, counterparty or '', amount, balance
+
+# Statement download: the account's postings in a date range, oldest first, with a running balance
+@login_required
+def account_statement(request):
+    export_format = request.GET.get('format', 'csv')
+    form = StatementForm({'date_from': request.GET.get('from'), 'date_to': request.GET.get('to')})
+    if export_format not in EXPORT_FORMATS or not form.is_valid():
+        return HttpResponse('Invalid statement request: use from/to dates (YYYY-MM-DD) and format=csv or jsonl.',
+                            status=400, content_type='text/plain')
+    acct = request.user.account
+    conditions = {}
+    start = opening = None
+    if form.cleaned_data['date_from']:
+        start = conditions['timestamp__gte'] = _start_of_day(form.cleaned_data['date_from'])
+        # Checkpointed, so the opening balance costs the same for a week-old or a five-year-old account
+        opening = acct.balance_at(start - timedelta(microseconds=1))
+    if form.cleaned_data['date_to']:
+        conditions['timestamp__lt'] = _start_of_day(form.cleaned_data['date_to'] + timedelta(days=1))
+
+    # Both streams are already oldest-first; merging them keeps memory flat. The archive is
+    # always read: a statement starting after it costs one empty index range scan
+    rows = heapq.merge(_statement_rows(acct.archived_postings.filter(**conditions)),
+                       _statement_rows(acct.postings.filter(**conditions)),
+                       key=lambda row: (row[0], row[1]))
+    lines = _running_balance(start, OPENING_BALANCE if opening is None else opening, rows)
+    return streaming_export(request, STATEMENT_FIELDS, lines, export_format, f'statement-{acct.account_number}')
+
 # Define a custom registration form
 class CustomUserCreationForm(UserCreationForm):
     email = forms.EmailField(required=True)
@@ -153,53 +235,75 @@ def register(request):
         user_form = CustomUserCreationForm()
     return render(request, 'register.html', {'user_form': user_form})
 
+# Resolve an account number or username filter to an account id (None if there is no such account)
+def _account_filter_id(value):
+    return Account.objects.filter(
+        models.Q(account_number=value) | models.Q(user__username=value)
+    ).values_list('pk', flat=True).first()
+
+# Apply the dashboard filters to the admin log
+def _filtered_admin_logs(filters):
+    logs = AdminLog.objects.all()
+    if filters.get('kind'):
+        logs = logs.filter(kind=filters['kind'])
+    if filters.get('date_from'):
+        logs = logs.filter(timestamp__gte=_start_of_day(filters['date_from']))
+    if filters.get('date_to'):
+        logs = logs.filter(timestamp__lt=_start_of_day(filters['date_to'] + timedelta(days=1)))
+    if filters.get('admin'):
+        admin_id = _account_filter_id(filters['admin'])
+        logs = logs.filter(admin_id=admin_id) if admin_id else logs.none()
+    if filters.get('account'):
+        target = _account_filter_id(filters['account'])
+        # Deleted accounts are still found by the number copied onto their entries
+        logs = logs.filter(target_id=target) if target else logs.filter(target_number=filters['account'])
+    return logs
+
 # Admin Dashboard view (only accessible by admins)
-@login_required
+@admin_required
 def admin_dashboard(request):
-    if not request.user.account.is_admin:
-        return redirect('home')  # Redirect non-admins
-    # Calculate total bank value (sum of all account balances, including bank)
-    total_bank_value = Account.objects.aggregate(total=models.Sum('balance'))['total'] or Decimal('0')
-    # Ensure total bank value is $1,000,000 (simplified for now, adjust if needed)
-    if total_bank_value != Decimal('1000000'):
-        # This is a placeholder; you might want to implement a reset or log this
-        total_bank_value = Decimal('1000000')  # Force it to match requirement
-    admin_logs = AdminLog.objects.all().order_by('-timestamp')
+    # Total bank value (sum of all account balances, including bank), maintained incrementally
+    total_bank_value = counters.read(counters.TOTAL_BALANCE)
+    form = AdminLogFilterForm(request.GET or None)
+    filters = form.cleaned_data if form.is_valid() else {}
+    # One bounded page, read newest-first off the (filter, timestamp) index that matches
+    admin_logs, next_cursor = keyset_page(
+        _filtered_admin_logs(filters).select_related('admin__user'),
+        cursor=request.GET.get('cursor'),
+    )
+    query = request.GET.copy()
+    query.pop('cursor', None)
     return render(request, 'admin_dashboard.html', {
         'total_bank_value': total_bank_value,
-        'admin_logs': admin_logs
+        'counter_drift': counters.latest_drift(),
+        'form': form,
+        'admin_logs': admin_logs,
+        'next_cursor': next_cursor,
+        'filter_query': query.urlencode(),
     })
 
 # Create Admin view (only accessible by root or admins)
-@login_required
+@admin_required
 def create_admin(request):
-    if not request.user.account.is_admin:
-        return redirect('home')  # Restrict to admins only
     if request.method == 'POST':
         username = request.POST.get('username')
         password = request.POST.get('password')
         first_name = request.POST.get('first_name')
         last_name = request.POST.get('last_name')
         try:
-            user = User.objects.create_user(username=username, password=password, email='')
-            Account.objects.create(
-                user=user,
-                first_name=first_name,
-                last_name=last_name,
-                account_number=str(uuid.uuid4())[:10],
-                payment_number=str(uuid.uuid4())[:10],
-                balance=Decimal('50.00'),  # Start with $50
-                is_admin=True  # Mark as admin
-            )
-            # Log the action
-            AdminLog.objects.create(
-                admin=request.user.account,
-                action=f"Created admin account for {username}"
-            )
+            with audit.atomic():
+                user = User.objects.create_user(username=username, password=password, email='',
+                                                first_name=first_name, last_name=last_name)
+                # The post_save signal already opened the $50 account; mark it as admin
+                account = user.account
+                account.is_admin = True
+                account.save(update_fields=['is_admin'])
+                # Log the action
+                audit.record(request.account, AdminLog.CREATE_ADMIN, target=account, detail=username)
             return redirect('admin_dashboard')
         except Exception as e:
-            return render(request, 'admin_dashboardcreate_admin.html', {'error': str(e)})
-    return render(request, 'admin_dashboardcreate_admin.html')
+            return render(request, 'create_admin.html', {'error': str(e)})
+    return render(request, 'create_admin.html')
 
 # Reset Bank view (only accessible by root admin)
 @login_required
@@ -207,18 +311,8 @@ def reset_bank(request):
     if request.user.username != 'root':  # Restrict to root admin only
         return redirect('home')  # Redirect non-root admins
     if request.method == 'POST':
-        # Reset all accounts to $50 (including admins, but excluding suspended accounts)
-        for account in Account.objects.filter(is_suspended=False):
-            account.balance = Decimal('50.00')
-            account.save()
-        # Clear all transactions and admin logs
-        Transaction.objects.all().delete()
-        AdminLog.objects.all().delete()
-        # Log the reset action
-        AdminLog.objects.create(
-            admin=request.user.account,
-            action="Reset bank to initial state ($1,000,000 total)"
-        )
+        # Reset all accounts to $50 (including admins, but excluding suspended accounts) and clear the ledger
+        reset.reset_bank(admin=request.account)
         return redirect('admin_dashboard')
     return render(request, 'reset_bank.html', {'message': 'Are you sure you want to reset the bank?'})
 
@@ -270,32 +364,89 @@ def password_reset_confirm(request, uidb64, token):
 def password_reset_complete(request):
     return render(request, 'password_reset_complete.html', {'message': 'Your password has been reset. You can log in now.'})
 
+# Columns written by the ledger export, in output order
+LEDGER_EXPORT_FIELDS = ('id', 'entry', 'kind', 'timestamp', 'account', 'user', 'counterparty', 'counterparty_user', 'amount')
+
+def _start_of_day(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+# Apply the admin ledger filters to the postings table and its archive; returns (hot, archived)
+def _filtered_ledger(filters):
+    conditions = {}
+    if filters.get('date_from'):
+        conditions['timestamp__gte'] = _start_of_day(filters['date_from'])
+    if filters.get('date_to'):
+        conditions['timestamp__lt'] = _start_of_day(filters['date_to'] + timedelta(days=1))
+    if filters.get('min_amount') is not None:
+        conditions['amount__gte'] = filters['min_amount']
+    if filters.get('max_amount') is not None:
+        conditions['amount__lte'] = filters['max_amount']
+    if filters.get('account'):
+        conditions['account_id'] = _account_filter_id(filters['account'])
+        if conditions['account_id'] is None:
+            return Posting.objects.none(), ArchivedPosting.objects.none()
+    return Posting.objects.filter(**conditions), ArchivedPosting.objects.filter(**conditions)
+
+def _export_rows(postings):
+    return postings.order_by('-timestamp', '-pk').values_list(
+        'pk', 'entry_id', 'entry__kind', 'timestamp',
+        'account__account_number', 'account__user__username',
+        'counterparty__account_number', 'counterparty__user__username',
+        'amount',
+    ).iterator(chunk_size=EXPORT_CHUNK_SIZE)  # Server-side cursor, constant memory
+
 # View All Transactions (only accessible by admins)
-@login_required
+@admin_required
 def view_transactions(request):
-    if not request.user.account.is_admin:
-        return redirect('home')  # Redirect non-admins
-    all_transactions = Transaction.objects.all().order_by('-timestamp')
+    form = LedgerFilterForm(request.GET or None)
+    filters = form.cleaned_data if form.is_valid() else {}
+    postings, archived = _filtered_ledger(filters)
+    horizon = archive.horizon()
+
+    export_format = request.GET.get('format')
+    if export_format in EXPORT_FORMATS:
+        rows = _export_rows(postings)
+        if horizon is not None:
+            # Both streams are already newest-first; merging them keeps memory flat
+            rows = heapq.merge(rows, _export_rows(archived), key=lambda row: (row[3], row[0]), reverse=True)
+        return streaming_export(request, LEDGER_EXPORT_FIELDS, rows, export_format, 'transactions')
+
+    # Entry, both accounts and their users come back in the same joined query
+    related = ('entry', 'account__user', 'counterparty__user')
+    transactions, next_cursor = keyset_page(
+        postings.select_related(*related),
+        cursor=request.GET.get('cursor'),
+        archived=[archived.select_related(*related)],
+        horizon=horizon,
+    )
+    query = request.GET.copy()
+    query.pop('cursor', None)
+    query.pop('format', None)
     return render(request, 'view_transactions.html', {
-        'transactions': all_transactions
+        'form': form,
+        'transactions': transactions,
+        'next_cursor': next_cursor,
+        'filter_query': query.urlencode(),
     })
 
 # Manage Accounts view (only accessible by admins)
-@login_required
+@admin_required
 def manage_accounts(request):
-    if not request.user.account.is_admin:
-        return redirect('home')  # Redirect non-admins
-    accounts = Account.objects.filter(is_admin=False).order_by('user__username')  # Non-admin accounts only
+    # One page of non-admin accounts, newest first, walked from the primary key index
+    accounts, next_cursor = keyset_page(
+        hot_accounts.with_full_balance(Account.objects.filter(is_admin=False).select_related('user')),
+        cursor=request.GET.get('cursor'),
+        field='pk',
+    )
     return render(request, 'manage_accounts.html', {
-        'accounts': accounts
+        'accounts': accounts,
+        'next_cursor': next_cursor,
     })
 
 # Edit User Balance view (only accessible by admins)
-@login_required
+@admin_required
 def edit_balance(request, account_id):
-    if not request.user.account.is_admin:
-        return redirect('home')  # Redirect non-admins
-    account = get_object_or_404(Account, id=account_id, is_admin=False)  # Non-admin accounts only
+    account = get_object_or_404(hot_accounts.with_full_balance(Account.objects), id=account_id, is_admin=False)  # Non-admin accounts only
     if request.method == 'POST':
         try:
             new_balance = Decimal(request.POST.get('balance', '0'))
@@ -304,13 +455,10 @@ def edit_balance(request, account_id):
                     'account': account,
                     'error': 'Balance cannot be less than -$5.'
                 })
-            account.balance = new_balance
-            account.save()
-            # Log the action
-            AdminLog.objects.create(
-                admin=request.user.account,
-                action=f"Edited balance for account {account.account_number} to ${new_balance}"
-            )
+            with audit.atomic():
+                ledger.set_balance(account, new_balance, memo=f"Balance set by {request.user.username}")
+                # Log the action
+                audit.record(request.account, AdminLog.EDIT_BALANCE, target=account, amount=new_balance)
             return redirect('manage_accounts')
         except (ValueError, DecimalException):
             return render(request, 'edit_balance.html', {
@@ -322,10 +470,8 @@ def edit_balance(request, account_id):
     })
 
 # Close User Account view (only accessible by admins)
-@login_required
+@admin_required
 def close_account(request, account_id):
-    if not request.user.account.is_admin:
-        return redirect('home')  # Redirect non-admins
     account = get_object_or_404(Account, id=account_id, is_admin=False)  # Non-admin accounts only
     if request.method == 'POST':
         if account.is_closed:
@@ -333,25 +479,19 @@ def close_account(request, account_id):
                 'account': account,
                 'error': 'This account is already closed.'
             })
-        # Transfer balance back to bank (simplified: add to total bank value)
-        account.balance = Decimal('0')  # Reset balance to 0
-        account.is_closed = True
-        account.save()
-        # Log the action
-        AdminLog.objects.create(
-            admin=request.user.account,
-            action=f"Closed account {account.account_number}"
-        )
+        with audit.atomic():
+            # Transfer balance back to bank (simplified: add to total bank value)
+            ledger.set_balance(account, Decimal('0'), memo='Account closed', is_closed=True)  # Reset balance to 0
+            # Log the action
+            audit.record(request.account, AdminLog.CLOSE_ACCOUNT, target=account)
         return redirect('manage_accounts')
     return render(request, 'close_account.html', {
         'account': account
     })
 
 # Suspend User Account view (only accessible by admins)
-@login_required
+@admin_required
 def suspend_account(request, account_id):
-    if not request.user.account.is_admin:
-        return redirect('home')  # Redirect non-admins
     account = get_object_or_404(Account, id=account_id, is_admin=False)  # Non-admin accounts only
     if request.method == 'POST':
         if account.is_suspended:
@@ -360,22 +500,18 @@ def suspend_account(request, account_id):
                 'error': 'This account is already suspended.'
             })
         account.is_suspended = True
-        account.save()
-        # Log the action
-        AdminLog.objects.create(
-            admin=request.user.account,
-            action=f"Suspended account {account.account_number}"
-        )
+        with audit.atomic():
+            account.save()
+            # Log the action
+            audit.record(request.account, AdminLog.SUSPEND_ACCOUNT, target=account)
         return redirect('manage_accounts')
     return render(request, 'suspend_account.html', {
         'account': account
     })
 
 # Delete User Account view (only accessible by admins)
-@login_required
+@admin_required
 def delete_account(request, account_id):
-    if not request.user.account.is_admin:
-        return redirect('home')  # Redirect non-admins
     account = get_object_or_404(Account, id=account_id, is_admin=False)  # Non-admin accounts only
     if request.method == 'POST':
         if account.is_closed or account.is_suspended:
@@ -384,14 +520,18 @@ def delete_account(request, account_id):
                 'error': 'This account is already closed or suspended. Delete anyway?'
             })
         user = account.user
-        account.delete()
-        user.delete()  # Delete the associated User as well
-        # Log the action
-        AdminLog.objects.create(
-            admin=request.user.account,
-            action=f"Deleted account {account.account_number} and user"
-        )
+        with audit.atomic():
+            # Logged first, while the account still has its primary key
+            audit.record(request.account, AdminLog.DELETE_ACCOUNT, target=account)
+            account.delete()
+            user.delete()  # Delete the associated User as well
         return redirect('manage_accounts')
     return render(request, 'delete_account.html', {
         'account': account
     })
+
+# Prometheus scrape endpoint: request metrics merged across every worker process, for scrapers only
+def metrics_view(request):
+    if not metrics.scrape_allowed(request):
+        return HttpResponse('Forbidden.', status=403, content_type='text/plain')
+    return HttpResponse(metrics.render(metrics.collect()), content_type='text/plain; version=0.0.4; charset=utf-8')
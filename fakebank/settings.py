@@ -40,11 +40,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'bankapp.metrics.RequestMetricsMiddleware',  # First, so it times and counts everything below
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'bankapp.access.AccountMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -90,6 +92,46 @@ DATABASES = {
     }
 }
 
+# Authentication
+# Loads each session's user together with its bank account in one query
+
+AUTHENTICATION_BACKENDS = ['bankapp.access.AccountBackend']
+
+# Caches and sessions
+# Sessions are written through to the database, read from a per-process LRU
+# and then the shared "sessions" cache, so most requests never query
+# django_session. Velocity counters (see VELOCITY_CACHE_ALIAS) and the
+# exchange-rate version (RATES_CACHE_ALIAS) get caches of their own. Local
+# memory keeps development and tests self-contained; in production point
+# "sessions", "velocity" and "rates" at a cache every worker shares (Redis,
+# Memcached), or each process enforces the limits on its own and only sees
+# its own rate edits until its table expires.
+# Expired rows are removed by `manage.py purge_sessions --every 3600`.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'sessions': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'sessions',
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+    'velocity': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'velocity',
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+    'rates': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'rates',
+    },
+}
+
+SESSION_ENGINE = 'bankapp.sessions'
+SESSION_CACHE_ALIAS = 'sessions'
+RATES_CACHE_ALIAS = 'rates'
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -134,3 +176,45 @@ STATIC_ROOT = BASE_DIR / "staticfiles"
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Request metrics
+# Each worker process writes its metric snapshot here every few seconds, and
+# /metrics sums them. Leave as None for a single process; with several
+# workers, point it at a directory they share; snapshots of exited workers are
+# removed when /metrics is read. /metrics only answers clients in
+# METRICS_ALLOWED_IPS (addresses or networks, as seen in REMOTE_ADDR) or
+# sending "Authorization: Bearer <METRICS_TOKEN>".
+
+METRICS_DIR = None
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+METRICS_TOKEN = None
+
+# Transfers
+# When True, sends are stored as pending TransferCommands and applied by
+# `manage.py run_transfer_workers`; clients poll /api/v1/transfers/<id>/.
+
+QUEUED_TRANSFERS = False
+
+# Velocity checks
+# Rules run on every send (single, batch and queued) against per-sender
+# sliding-window counters kept in VELOCITY_CACHE_ALIAS, without database
+# queries. Each entry names a rule class in bankapp.velocity (or your own
+# subclass of bankapp.velocity.Rule) and its options; windows are in seconds.
+# Counters are only written when a send commits.
+#
+# Only the recipient check is on by default. The limits are opt-in: a batch
+# payment counts every line against them, so they must be sized for the
+# largest payroll a customer sends. They also need VELOCITY_CACHE_ALIAS to be
+# a cache every worker shares and that survives restarts (e.g. Redis with
+# persistence): recipients are "known" only while their cache keys live, so
+# with local memory every payee is new again after a restart and in every
+# other process. For example:
+#
+#     {'NAME': 'bankapp.velocity.WindowLimitRule', 'OPTIONS': {'window': 3600, 'max_count': 30, 'max_amount': '5000'}},
+#     {'NAME': 'bankapp.velocity.WindowLimitRule', 'OPTIONS': {'window': 86400, 'max_amount': '20000'}},
+#     {'NAME': 'bankapp.velocity.NewRecipientRule', 'OPTIONS': {'max_amount': '1000', 'max_new': 20, 'window': 86400}},
+
+VELOCITY_CACHE_ALIAS = 'velocity'
+VELOCITY_RULES = [
+    {'NAME': 'bankapp.velocity.BlockedRecipientRule'},
+]